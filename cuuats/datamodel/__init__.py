@@ -3,9 +3,15 @@ from cuuats.datamodel.fields import BaseField, OIDField, GlobalIDField, \
     GeometryField, StringField, NumericField, CalculatedField, ScaleField, \
     WeightsField, MethodField, ForeignKey
 from cuuats.datamodel.manytomany import ManyToManyField
-from cuuats.datamodel.features import BaseFeature, require_registration
+from cuuats.datamodel.features import BaseFeature, require_registration, \
+    get_lazy_registration_stats
 from cuuats.datamodel.scales import BaseScale, BreaksScale, DictScale, \
     StaticScale, ScaleLevel
-from cuuats.datamodel.factory import feature_class_factory
-from cuuats.datamodel.query import Q
+from cuuats.datamodel.factory import feature_class_factory, \
+    load_workspace_models
+from cuuats.datamodel.instrumentation import get_field_stats, \
+    instrument_fields
+from cuuats.datamodel.profiling import QueryProfiler, add_query_hook, \
+    remove_query_hook
+from cuuats.datamodel.query import Q, F
 from cuuats.datamodel.domains import D, CodedValue
@@ -0,0 +1,55 @@
+"""
+Workspace backends. The ArcGIS backend is only available when arcpy can be
+imported.
+"""
+
+import os
+from cuuats.datamodel.backends.base import BaseBackend
+from cuuats.datamodel.backends.sqlite import SQLiteBackend
+
+try:
+    from cuuats.datamodel.backends.arcgis import ArcGISBackend
+except ImportError:
+    ArcGISBackend = None
+
+
+# Backend classes keyed by the extension of the workspace path. Workspaces
+# with other extensions use the ArcGIS backend.
+BACKENDS = {
+    '.sqlite': SQLiteBackend,
+    '.sqlite3': SQLiteBackend,
+    '.db': SQLiteBackend,
+}
+
+
+def register_backend(extension, backend_class):
+    """
+    Use the backend class for workspaces whose paths have the extension.
+    """
+
+    BACKENDS[extension.lower()] = backend_class
+
+
+def get_backend_class(path):
+    """
+    Returns the backend class used for the workspace at the given path.
+    """
+
+    if path == ':memory:':
+        return SQLiteBackend
+
+    backend_class = BACKENDS.get(os.path.splitext(path)[1].lower(), None)
+    if backend_class is not None:
+        return backend_class
+
+    if ArcGISBackend is None:
+        raise ImportError('arcpy is required to open %s' % (path,))
+    return ArcGISBackend
+
+
+def get_backend(path):
+    """
+    Returns a backend for the workspace at the given path.
+    """
+
+    return get_backend_class(path)(path)
@@ -0,0 +1,213 @@
+"""
+Workspace backend for file geodatabases and SDE using arcpy.
+"""
+
+import arcpy
+import os
+import re
+from contextlib import contextmanager
+from time import time
+from cuuats.datamodel.backends.base import BaseBackend
+
+
+class ArcGISBackend(BaseBackend):
+    """
+    Backend that reads and writes a geodatabase using arcpy.
+    """
+
+    supports_table_to_numpy = True
+
+    @classmethod
+    def create(cls, path):
+        if not os.path.exists(path):
+            (directory, gdb_name) = os.path.split(os.path.abspath(path))
+            arcpy.CreateFileGDB_management(directory, gdb_name)
+        return cls(path)
+
+    def _get_path(self, layer_name):
+        return os.path.join(self.path, layer_name)
+
+    def _make_layer_name(self):
+        """
+        Returns a unique layer name.
+        """
+
+        return 'layer_%s' % (str(time()).replace('.', ''),)
+
+    def get_editor(self):
+        return arcpy.da.Editor(self.path)
+
+    def list_domains(self):
+        return arcpy.da.ListDomains(self.path)
+
+    def list_layers(self):
+        layer_names = []
+        for (dir_path, dir_names, file_names) in arcpy.da.Walk(
+                self.path, datatype=['FeatureClass', 'Table']):
+            layer_names.extend(file_names)
+        return layer_names
+
+    def list_fields(self, layer_name):
+        return arcpy.ListFields(self._get_path(layer_name))
+
+    def list_relationship_names(self, layer_name):
+        layer = arcpy.Describe(self._get_path(layer_name))
+        return getattr(layer, 'relationshipClassNames', [])
+
+    def describe_relationship(self, rc_name):
+        rc = arcpy.Describe(self._get_path(rc_name))
+        origin = rc.originClassNames[0]
+        destination = rc.destinationClassNames[0]
+        keys = rc.OriginClassKeys
+        primary = [k[0] for k in keys if k[1] == 'OriginPrimary'][0]
+        foreign = [k[0] for k in keys if k[1] == 'OriginForeign'][0]
+        is_attachment = rc.isAttachmentRelationship
+        return (origin, destination, primary, foreign, is_attachment)
+
+    def search_cursor(self, layer_name, field_names, where_clause=None,
+                      sql_clause=(None, None)):
+        return arcpy.da.SearchCursor(
+            self._get_path(layer_name), field_names, where_clause,
+            sql_clause=sql_clause)
+
+    def update_cursor(self, layer_name, field_names, where_clause=None,
+                      sql_clause=(None, None)):
+        return arcpy.da.UpdateCursor(
+            self._get_path(layer_name), field_names, where_clause,
+            sql_clause=sql_clause)
+
+    def insert_cursor(self, layer_name, field_names):
+        return arcpy.da.InsertCursor(self._get_path(layer_name), field_names)
+
+    def is_update_cursor(self, cursor):
+        return isinstance(cursor, arcpy.da.UpdateCursor)
+
+    def get_count(self, layer_name, where_clause=None):
+        if where_clause is None:
+            return int(arcpy.GetCount_management(
+                self._get_path(layer_name)).getOutput(0))
+
+        with self.make_table_view(layer_name, where_clause) as view_name:
+            return int(arcpy.GetCount_management(view_name).getOutput(0))
+
+    def table_to_numpy(self, layer_name, field_names, where_clause=None,
+                       null_values=None):
+        return arcpy.da.TableToNumPyArray(
+            self._get_path(layer_name), field_names, where_clause, False,
+            null_values)
+
+    def add_field(self, layer_name, field_name, storage):
+        arcpy.AddField_management(
+            self._get_path(layer_name),
+            field_name,
+            **storage)
+
+    def summarize(self, layer_name, fields, where_clause=None):
+        summary_name = self._make_layer_name()
+        summary_path = 'in_memory/%s' % (summary_name,)
+
+        with self.make_layer(layer_name) as temp_layer_name:
+            if where_clause:
+                arcpy.SelectLayerByAttribute_management(
+                    temp_layer_name, where_clause=where_clause)
+
+            arcpy.Statistics_analysis(
+                temp_layer_name, summary_path, fields)
+
+        summary_fields = [re.sub(r'[^A-Za-z0-9]', '_', '%s_%s' % (s, f))
+                          for (f, s) in fields]
+
+        for row in arcpy.da.SearchCursor(summary_path, summary_fields):
+            return dict(zip(summary_fields, row))
+
+    @contextmanager
+    def make_layer(self, fc_name, where_clause=None):
+        layer_name = self._make_layer_name()
+
+        arcpy.MakeFeatureLayer_management(self._get_path(fc_name), layer_name)
+        yield layer_name
+
+        arcpy.Delete_management(layer_name)
+
+    @contextmanager
+    def make_table_view(self, table_name, where_clause=None):
+        view_name = self._make_layer_name()
+
+        arcpy.MakeTableView_management(
+            self._get_path(table_name), view_name, where_clause)
+        try:
+            yield view_name
+        finally:
+            arcpy.Delete_management(view_name)
+
+    def spatial_join(self, origin, destination, primary_key,
+                     rel_type='INTERSECT', search_radius=None):
+        dest_path = self._get_path(destination)
+        origin_path = self._get_path(origin)
+
+        # Create field mappings. We really don't want any fields
+        # included, so we add the origin primary key, which will
+        # be removed automatically.
+        field_mappings = arcpy.FieldMappings()
+        field_map = arcpy.FieldMap()
+        field_map.addInputField(origin_path, primary_key)
+        field_mappings.addFieldMap(field_map)
+
+        # Execute the spatial join.
+        join_name = self._make_layer_name()
+        join_path = 'in_memory/%s' % (join_name,)
+        arcpy.SpatialJoin_analysis(
+            dest_path, origin_path, join_path, 'JOIN_ONE_TO_MANY',
+            'KEEP_COMMON', field_mappings, rel_type, search_radius)
+
+        # Create a mapping: destination -> origin.
+        with arcpy.da.SearchCursor(
+                join_path, ['TARGET_FID', 'JOIN_FID']) as cursor:
+            oid_map = dict([(str(row[0]), row[1]) for row in cursor])
+
+        # Delete the join layer.
+        arcpy.Delete_management(join_path)
+        return oid_map
+
+    def create_domain(self, name, domain_type='CodedValue',
+                      coded_values=None, value_range=None,
+                      field_type='SHORT'):
+        if domain_type not in ('CodedValue', 'Range'):
+            raise ValueError('Invalid domain type: %s' % (domain_type,))
+
+        arcpy.CreateDomain_management(
+            self.path, name, name, field_type,
+            'CODED' if domain_type == 'CodedValue' else 'RANGE')
+        for (code, description) in (coded_values or {}).items():
+            arcpy.AddCodedValueToDomain_management(
+                self.path, name, code, description)
+        if value_range is not None:
+            arcpy.SetValueForRangeDomain_management(
+                self.path, name, value_range[0], value_range[1])
+
+    def create_layer(self, name, fields=(), geometry_type=None,
+                     oid_field_name='OBJECTID', shape_field_name='Shape'):
+        # The names of the OID and shape fields are chosen by ArcGIS.
+        if geometry_type is None:
+            arcpy.CreateTable_management(self.path, name)
+        else:
+            arcpy.CreateFeatureclass_management(
+                self.path, name, geometry_type)
+
+        for (field_name, storage) in fields:
+            self.add_field(name, field_name, storage)
+
+    def create_relationship(self, name, origin, destination, primary_key,
+                            foreign_key, is_attachment=False):
+        if is_attachment:
+            raise ValueError(
+                'Use enable_attachments() to create attachment tables')
+
+        arcpy.CreateRelationshipClass_management(
+            self._get_path(origin), self._get_path(destination),
+            self._get_path(name), 'SIMPLE', destination, origin, 'NONE',
+            'ONE_TO_MANY', 'NONE', primary_key, foreign_key)
+
+    def enable_attachments(self, layer_name):
+        arcpy.EnableAttachments_management(self._get_path(layer_name))
+        return '%s__ATTACH' % (layer_name,)
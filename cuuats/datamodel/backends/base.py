@@ -0,0 +1,201 @@
+"""
+The interface between a Workspace and the storage that it reads and writes.
+"""
+
+
+class BaseBackend(object):
+    """
+    Base class for workspace backends. Cursors follow the interface of the
+    arcpy.da cursors: they are context managers that yield rows as
+    sequences, update cursors have updateRow() and deleteRow() methods, and
+    insert cursors have an insertRow() method that returns the new object
+    ID. Editors follow the interface of arcpy.da.Editor.
+    """
+
+    # Whether table_to_numpy() is implemented.
+    supports_table_to_numpy = False
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def create(cls, path):
+        """
+        Create an empty workspace at the path if it does not exist, and
+        return a backend for it.
+        """
+
+        return cls(path)
+
+    def get_editor(self):
+        """
+        Returns an editor used to start and stop edit sessions.
+        """
+
+        raise NotImplementedError
+
+    def list_domains(self):
+        """
+        Returns a list of the domains in the workspace. Domains have name,
+        domainType, codedValues and range attributes.
+        """
+
+        raise NotImplementedError
+
+    def list_layers(self):
+        """
+        Returns the names of the tables and feature classes in the
+        workspace.
+        """
+
+        raise NotImplementedError
+
+    def list_fields(self, layer_name):
+        """
+        Returns a list of the fields of a layer. Fields have the attributes
+        of a FieldInfo.
+        """
+
+        raise NotImplementedError
+
+    def list_relationship_names(self, layer_name):
+        """
+        Returns the names of the relationship classes that a layer
+        participates in.
+        """
+
+        raise NotImplementedError
+
+    def describe_relationship(self, rc_name):
+        """
+        Returns a tuple of the origin, destination, primary key, foreign key
+        and attachment flag of a relationship class.
+        """
+
+        raise NotImplementedError
+
+    def search_cursor(self, layer_name, field_names, where_clause=None,
+                      sql_clause=(None, None)):
+        """
+        Returns a cursor that reads rows from a layer.
+        """
+
+        raise NotImplementedError
+
+    def update_cursor(self, layer_name, field_names, where_clause=None,
+                      sql_clause=(None, None)):
+        """
+        Returns a cursor that reads, updates and deletes rows in a layer.
+        """
+
+        raise NotImplementedError
+
+    def insert_cursor(self, layer_name, field_names):
+        """
+        Returns a cursor that inserts rows in a layer.
+        """
+
+        raise NotImplementedError
+
+    def is_update_cursor(self, cursor):
+        """
+        Returns true if the cursor was created by update_cursor().
+        """
+
+        raise NotImplementedError
+
+    def get_count(self, layer_name, where_clause=None):
+        """
+        Returns the number of rows in a layer matching the where clause.
+        """
+
+        raise NotImplementedError
+
+    def table_to_numpy(self, layer_name, field_names, where_clause=None,
+                       null_values=None):
+        """
+        Returns the specified fields of a layer as a NumPy structured array.
+        """
+
+        raise NotImplementedError
+
+    def add_field(self, layer_name, field_name, storage):
+        """
+        Add a field to a layer. The storage dictionary contains keyword
+        arguments for arcpy.AddField_management.
+        """
+
+        raise NotImplementedError
+
+    def summarize(self, layer_name, fields, where_clause=None):
+        """
+        Returns a dictionary of summary statistics, keyed by statistic and
+        field name (for example, SUM_length). Fields is a list of (field
+        name, statistic) tuples.
+        """
+
+        raise NotImplementedError
+
+    def make_layer(self, fc_name, where_clause=None):
+        """
+        Returns a context manager that makes a feature class into a
+        temporary layer, yielding the layer name.
+        """
+
+        raise NotImplementedError
+
+    def make_table_view(self, table_name, where_clause=None):
+        """
+        Returns a context manager that makes a table into a temporary table
+        view limited to rows matching the where clause, yielding the view
+        name.
+        """
+
+        raise NotImplementedError
+
+    def spatial_join(self, origin, destination, primary_key,
+                     rel_type='INTERSECT', search_radius=None):
+        """
+        Returns a dictionary mapping object IDs of destination features,
+        as strings, to the object IDs of the origin features that they are
+        spatially related to.
+        """
+
+        raise NotImplementedError
+
+    def create_domain(self, name, domain_type='CodedValue',
+                      coded_values=None, value_range=None,
+                      field_type='SHORT'):
+        """
+        Create a coded value or range domain. Coded values is a dictionary
+        of descriptions keyed by code, and value range is a (min, max)
+        tuple.
+        """
+
+        raise NotImplementedError
+
+    def create_layer(self, name, fields=(), geometry_type=None,
+                     oid_field_name='OBJECTID', shape_field_name='Shape'):
+        """
+        Create a table, or a feature class if a geometry type (such as
+        POINT or POLYLINE) is given. Fields is a list of field names and
+        storage dictionaries, as accepted by add_field().
+        """
+
+        raise NotImplementedError
+
+    def create_relationship(self, name, origin, destination, primary_key,
+                            foreign_key, is_attachment=False):
+        """
+        Create a one-to-many relationship class.
+        """
+
+        raise NotImplementedError
+
+    def enable_attachments(self, layer_name):
+        """
+        Create an attachment table and relationship class for a layer,
+        returning the name of the attachment table.
+        """
+
+        raise NotImplementedError
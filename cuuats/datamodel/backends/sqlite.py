@@ -0,0 +1,716 @@
+"""
+A pure-Python workspace backend that stores layers in a SQLite database, so
+that the ORM can be tested and profiled without ArcGIS. Where clauses
+produced by SQLCompiler are run as SQL.
+
+Fields, domains and relationship classes are described by metadata tables
+(gdb_layers, gdb_fields, gdb_domains, gdb_coded_values and
+gdb_relationships). Geometries are stored as JSON coordinates: a point is
+[x, y], and a line or polygon is a list of points. They can also be read
+and written as well-known text using the SHAPE@WKT token.
+"""
+
+import itertools
+import json
+import math
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from cuuats.datamodel.backends.base import BaseBackend
+from cuuats.datamodel.schema import DomainInfo, FieldInfo
+
+
+METADATA_SQL = (
+    'CREATE TABLE IF NOT EXISTS gdb_layers ('
+    'name TEXT PRIMARY KEY, geometry_type TEXT, position INTEGER)',
+    'CREATE TABLE IF NOT EXISTS gdb_fields ('
+    'layer_name TEXT, name TEXT, type TEXT, alias TEXT, required INTEGER, '
+    'domain TEXT, length INTEGER, scale INTEGER, precision INTEGER, '
+    'position INTEGER, PRIMARY KEY (layer_name, name))',
+    'CREATE TABLE IF NOT EXISTS gdb_domains ('
+    'name TEXT PRIMARY KEY, domain_type TEXT, min_value, max_value)',
+    'CREATE TABLE IF NOT EXISTS gdb_coded_values ('
+    'domain_name TEXT, code, description TEXT, '
+    'PRIMARY KEY (domain_name, code))',
+    'CREATE TABLE IF NOT EXISTS gdb_relationships ('
+    'name TEXT PRIMARY KEY, origin TEXT, destination TEXT, '
+    'primary_key TEXT, foreign_key TEXT, is_attachment INTEGER)',
+)
+
+# Field types accepted by add_field, mapped to the type reported by
+# list_fields and the SQLite column type.
+FIELD_TYPES = {
+    'TEXT': ('String', 'TEXT'),
+    'FLOAT': ('Single', 'REAL'),
+    'DOUBLE': ('Double', 'REAL'),
+    'SHORT': ('SmallInteger', 'INTEGER'),
+    'LONG': ('Integer', 'INTEGER'),
+    'DATE': ('Date', 'TEXT'),
+    'BLOB': ('Blob', 'BLOB'),
+    'GUID': ('Guid', 'TEXT'),
+}
+
+# Statistics supported by summarize, as SQL aggregate expressions.
+STATISTICS = {
+    'SUM': 'SUM(%s)',
+    'MEAN': 'AVG(%s)',
+    'MIN': 'MIN(%s)',
+    'MAX': 'MAX(%s)',
+    'RANGE': 'MAX(%s) - MIN(%s)',
+    'COUNT': 'COUNT(%s)',
+    'STD': 'AVG(%s * %s) - AVG(%s) * AVG(%s)',
+}
+
+SHAPE_TOKENS = ('SHAPE@', 'SHAPE@XY', 'SHAPE@JSON', 'SHAPE@WKT')
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+
+def quote(identifier):
+    """
+    Quote an identifier for use in SQL.
+    """
+
+    return '"%s"' % (identifier.replace('"', '""'),)
+
+
+def to_tuples(coordinates):
+    """
+    Convert nested lists of coordinates to nested tuples.
+    """
+
+    if isinstance(coordinates, list):
+        return tuple([to_tuples(c) for c in coordinates])
+    return coordinates
+
+
+def get_centroid(coordinates):
+    """
+    Returns the mean of the points in a geometry as an (x, y) tuple.
+    """
+
+    if not isinstance(coordinates[0], (list, tuple)):
+        return tuple(coordinates[:2])
+
+    points = []
+    stack = [coordinates]
+    while stack:
+        item = stack.pop()
+        if isinstance(item[0], (list, tuple)):
+            stack.extend(item)
+        else:
+            points.append(item)
+    return (sum([p[0] for p in points]) / float(len(points)),
+            sum([p[1] for p in points]) / float(len(points)))
+
+
+def to_wkt(coordinates, geometry_type=None):
+    """
+    Convert coordinates to well-known text.
+    """
+
+    if not isinstance(coordinates[0], (list, tuple)):
+        return 'POINT (%r %r)' % tuple(coordinates[:2])
+
+    points = ', '.join(['%r %r' % tuple(p[:2]) for p in coordinates])
+    if (geometry_type or '').upper() == 'POLYGON':
+        return 'POLYGON ((%s))' % (points,)
+    return 'LINESTRING (%s)' % (points,)
+
+
+def from_wkt(text):
+    """
+    Convert a point, line string or single ring polygon in well-known text
+    to coordinates.
+    """
+
+    match = re.match(
+        r'^\s*(POINT|LINESTRING|POLYGON)\s*\(+([^()]*)\)+\s*$', text,
+        re.IGNORECASE)
+    if match is None:
+        raise ValueError('Unsupported well-known text: %s' % (text,))
+
+    points = [[float(c) for c in p.split()] for p in match.group(2).split(',')]
+    if match.group(1).upper() == 'POINT':
+        return points[0]
+    return points
+
+
+def get_segments(coordinates, geometry_type=None):
+    """
+    Returns the segments of a geometry as pairs of (x, y) tuples. A point
+    is a segment of zero length, and polygon rings are closed.
+    """
+
+    if not isinstance(coordinates[0], (list, tuple)):
+        point = tuple(coordinates[:2])
+        return [(point, point)]
+
+    points = [tuple(p[:2]) for p in coordinates]
+    if (geometry_type or '').upper() == 'POLYGON' and points[0] != points[-1]:
+        points.append(points[0])
+    return zip(points[:-1], points[1:]) or [(points[0], points[0])]
+
+
+def _get_point_distance(point, segment):
+    # Distance from a point to a segment.
+    ((x, y), ((x1, y1), (x2, y2))) = (point, segment)
+    (dx, dy) = (x2 - x1, y2 - y1)
+    length = float(dx * dx + dy * dy)
+    t = 0.0
+    if length:
+        t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _get_segment_distance(a, b):
+    # Distance between two segments, which is zero if they cross.
+    (d1, d2) = (_cross(b[0], b[1], a[0]), _cross(b[0], b[1], a[1]))
+    (d3, d4) = (_cross(a[0], a[1], b[0]), _cross(a[0], a[1], b[1]))
+    if ((d1 > 0 > d2) or (d1 < 0 < d2)) and ((d3 > 0 > d4) or (d3 < 0 < d4)):
+        return 0.0
+    return min(_get_point_distance(a[0], b), _get_point_distance(a[1], b),
+               _get_point_distance(b[0], a), _get_point_distance(b[1], a))
+
+
+def _contains(segments, point):
+    # Returns true if the point is inside the ring formed by the segments.
+    (x, y) = point
+    inside = False
+    for ((x1, y1), (x2, y2)) in segments:
+        if (y1 > y) != (y2 > y) and \
+                x < x1 + (y - y1) * (x2 - x1) / float(y2 - y1):
+            inside = not inside
+    return inside
+
+
+def get_distance(a, a_type, b, b_type):
+    """
+    Returns the shortest distance between two geometries given as
+    coordinates and geometry types. The distance is zero if they intersect.
+    """
+
+    (a_segments, b_segments) = (get_segments(a, a_type),
+                                get_segments(b, b_type))
+    if ((a_type or '').upper() == 'POLYGON' and
+            _contains(a_segments, b_segments[0][0])) or \
+            ((b_type or '').upper() == 'POLYGON' and
+             _contains(b_segments, a_segments[0][0])):
+        return 0.0
+    return min([_get_segment_distance(s, t)
+                for s in a_segments for t in b_segments])
+
+
+def to_datetime(value):
+    """
+    Parse a date stored as text.
+    """
+
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError('Invalid date: %s' % (value,))
+
+
+class SQLiteCursor(object):
+    """
+    A cursor over the rows of a layer.
+    """
+
+    def __init__(self, backend, layer_name, field_names, where_clause=None,
+                 sql_clause=(None, None)):
+        self.backend = backend
+        self.layer_name = layer_name
+        self.fields = field_names
+        self._columns = backend._get_columns(layer_name, field_names)
+        (prefix, postfix) = sql_clause or (None, None)
+        self._sql = 'SELECT %s%s FROM %s%s%s' % (
+            prefix + ' ' if prefix else '',
+            ', '.join(['rowid'] + [c for (c, r, w) in self._columns]),
+            quote(layer_name),
+            ' WHERE ' + where_clause if where_clause else '',
+            ' ' + postfix if postfix else '')
+        self._rows = None
+        self._rowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _execute(self):
+        return self.backend.connection.execute(self._sql)
+
+    def __iter__(self):
+        if self._rows is None:
+            self._rows = self._execute()
+
+        readers = [r for (c, r, w) in self._columns]
+        for row in self._rows:
+            self._rowid = row[0]
+            yield [v if r is None or v is None else r(v)
+                   for (r, v) in zip(readers, row[1:])]
+        self._rowid = None
+
+    def close(self):
+        if isinstance(self._rows, sqlite3.Cursor):
+            self._rows.close()
+        self._rows = None
+        self._rowid = None
+
+
+class SQLiteUpdateCursor(SQLiteCursor):
+    """
+    A cursor that can update and delete the current row.
+    """
+
+    def _execute(self):
+        # Read the matching rows before modifying any of them.
+        return self.backend.connection.execute(self._sql).fetchall()
+
+    def updateRow(self, values):
+        if self._rowid is None:
+            raise RuntimeError('No current row')
+
+        columns = []
+        params = []
+        for ((column, reader, writer), value) in zip(self._columns, values):
+            columns.append('%s = ?' % (column,))
+            params.append(value if writer is None or value is None
+                          else writer(value))
+
+        if columns:
+            self.backend.connection.execute(
+                'UPDATE %s SET %s WHERE rowid = ?' % (
+                    quote(self.layer_name), ', '.join(columns)),
+                params + [self._rowid])
+
+    def deleteRow(self):
+        if self._rowid is None:
+            raise RuntimeError('No current row')
+
+        self.backend.connection.execute(
+            'DELETE FROM %s WHERE rowid = ?' % (quote(self.layer_name),),
+            (self._rowid,))
+
+
+class SQLiteInsertCursor(object):
+    """
+    A cursor that inserts rows in a layer.
+    """
+
+    def __init__(self, backend, layer_name, field_names):
+        self.backend = backend
+        self.fields = field_names
+        columns = backend._get_columns(layer_name, field_names)
+        self._writers = [w for (c, r, w) in columns]
+        self._sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            quote(layer_name),
+            ', '.join([c for (c, r, w) in columns]),
+            ', '.join(['?'] * len(columns)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def insertRow(self, values):
+        params = [v if w is None or v is None else w(v)
+                  for (w, v) in zip(self._writers, values)]
+        return self.backend.connection.execute(self._sql, params).lastrowid
+
+
+class SQLiteEditor(object):
+    """
+    An editor with the interface of arcpy.da.Editor. An edit session is a
+    transaction, and operations are savepoints. Edit sessions may be
+    nested, in which case the inner sessions are also savepoints.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._savepoints = []
+        self._depth = 0
+
+    @property
+    def isEditing(self):
+        return self._depth > 0
+
+    def _savepoint(self):
+        name = 'sp%i' % (len(self._savepoints),)
+        self.backend.connection.execute('SAVEPOINT %s' % (name,))
+        self._savepoints.append(name)
+
+    def _release(self, rollback):
+        name = self._savepoints.pop()
+        if rollback:
+            self.backend.connection.execute('ROLLBACK TO %s' % (name,))
+        self.backend.connection.execute('RELEASE %s' % (name,))
+
+    def startEditing(self, with_undo=True, multiuser_mode=True):
+        if self._depth == 0:
+            self.backend.connection.execute('BEGIN')
+        else:
+            self._savepoint()
+        self._depth += 1
+
+    def stopEditing(self, save_changes=True):
+        if self._depth == 0:
+            raise RuntimeError('Not editing')
+
+        self._depth -= 1
+        if self._depth > 0:
+            self._release(not save_changes)
+        elif save_changes:
+            del self._savepoints[:]
+            self.backend.connection.execute('COMMIT')
+        else:
+            del self._savepoints[:]
+            self.backend.connection.execute('ROLLBACK')
+
+    def startOperation(self):
+        self._savepoint()
+
+    def stopOperation(self):
+        self._release(False)
+
+    def abortOperation(self):
+        self._release(True)
+
+
+class SQLiteBackend(BaseBackend):
+    """
+    Backend that stores layers in a SQLite database. The path may be a file
+    name or ':memory:'. Layers, domains and relationship classes are created
+    using create_layer(), create_domain() and create_relationship().
+    """
+
+    def __init__(self, path):
+        super(SQLiteBackend, self).__init__(path)
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False)
+        for sql in METADATA_SQL:
+            self.connection.execute(sql)
+        self._fields = {}
+        self._lock = threading.Lock()
+        self._view_ids = itertools.count()
+
+    def _get_fields(self, layer_name):
+        # Fields of a layer, keyed by lower case name.
+        if layer_name not in self._fields:
+            fields = self.list_fields(layer_name)
+            if not fields:
+                raise ValueError('Layer does not exist: %s' % (layer_name,))
+            self._fields[layer_name] = dict(
+                [(f.name.lower(), f) for f in fields])
+        return self._fields[layer_name]
+
+    def _get_field_of_type(self, layer_name, field_type):
+        for field in self._get_fields(layer_name).values():
+            if field.type == field_type:
+                return field
+        raise ValueError('%s has no %s field' % (layer_name, field_type))
+
+    def _get_geometry_type(self, layer_name):
+        row = self.connection.execute(
+            'SELECT geometry_type FROM gdb_layers WHERE name = ?',
+            (layer_name,)).fetchone()
+        return row and row[0]
+
+    def _get_columns(self, layer_name, field_names):
+        # Returns a (column, reader, writer) tuple for each field name.
+        columns = []
+        for field_name in field_names:
+            token = field_name.upper()
+            if token == 'OID@':
+                columns.append((quote(self._get_field_of_type(
+                    layer_name, 'OID').name), None, None))
+                continue
+
+            if token.startswith('SHAPE@'):
+                if token not in SHAPE_TOKENS:
+                    raise ValueError('Unsupported token: %s' % (field_name,))
+                column = quote(self._get_field_of_type(
+                    layer_name, 'Geometry').name)
+                geometry_type = self._get_geometry_type(layer_name)
+                columns.append((column,) + {
+                    'SHAPE@': (lambda v: to_tuples(json.loads(v)),
+                               json.dumps),
+                    'SHAPE@XY': (lambda v: get_centroid(json.loads(v)),
+                                 json.dumps),
+                    'SHAPE@JSON': (None, None),
+                    'SHAPE@WKT': (lambda v: to_wkt(
+                        json.loads(v), geometry_type),
+                        lambda v: json.dumps(from_wkt(v))),
+                }[token])
+                continue
+
+            field = self._get_fields(layer_name).get(field_name.lower(), None)
+            if field is None:
+                raise ValueError('%s is not a field of %s' % (
+                    field_name, layer_name))
+
+            column = quote(field.name)
+            if field.type == 'Blob':
+                columns.append((column, str, sqlite3.Binary))
+            elif field.type == 'Date':
+                columns.append((column, to_datetime, lambda v: v.isoformat(
+                    ' ') if isinstance(v, datetime) else v))
+            elif field.type == 'Geometry':
+                columns.append((column, lambda v: to_tuples(json.loads(v)),
+                                json.dumps))
+            else:
+                columns.append((column, None, None))
+        return columns
+
+    def get_editor(self):
+        return SQLiteEditor(self)
+
+    def list_domains(self):
+        coded_values = {}
+        for (domain_name, code, description) in self.connection.execute(
+                'SELECT domain_name, code, description '
+                'FROM gdb_coded_values'):
+            coded_values.setdefault(domain_name, {})[code] = description
+
+        return [DomainInfo(n, t, coded_values.get(n, {}),
+                           (l, h) if t == 'Range' else None)
+                for (n, t, l, h) in self.connection.execute(
+                    'SELECT name, domain_type, min_value, max_value '
+                    'FROM gdb_domains ORDER BY name')]
+
+    def list_layers(self):
+        return [r[0] for r in self.connection.execute(
+            'SELECT name FROM gdb_layers ORDER BY position')]
+
+    def list_fields(self, layer_name):
+        return [FieldInfo(n, t, a, bool(r), d, l, s, p)
+                for (n, t, a, r, d, l, s, p) in self.connection.execute(
+                    'SELECT name, type, alias, required, domain, length, '
+                    'scale, precision FROM gdb_fields WHERE layer_name = ? '
+                    'ORDER BY position', (layer_name,))]
+
+    def list_relationship_names(self, layer_name):
+        return [r[0] for r in self.connection.execute(
+            'SELECT name FROM gdb_relationships '
+            'WHERE origin = ? OR destination = ? ORDER BY name',
+            (layer_name, layer_name))]
+
+    def describe_relationship(self, rc_name):
+        row = self.connection.execute(
+            'SELECT origin, destination, primary_key, foreign_key, '
+            'is_attachment FROM gdb_relationships WHERE name = ?',
+            (rc_name,)).fetchone()
+        if row is None:
+            raise ValueError('Relationship class does not exist: %s' % (
+                rc_name,))
+        return tuple(row[:4]) + (bool(row[4]),)
+
+    def search_cursor(self, layer_name, field_names, where_clause=None,
+                      sql_clause=(None, None)):
+        return SQLiteCursor(
+            self, layer_name, field_names, where_clause, sql_clause)
+
+    def update_cursor(self, layer_name, field_names, where_clause=None,
+                      sql_clause=(None, None)):
+        return SQLiteUpdateCursor(
+            self, layer_name, field_names, where_clause, sql_clause)
+
+    def insert_cursor(self, layer_name, field_names):
+        return SQLiteInsertCursor(self, layer_name, field_names)
+
+    def is_update_cursor(self, cursor):
+        return isinstance(cursor, SQLiteUpdateCursor)
+
+    def get_count(self, layer_name, where_clause=None):
+        return self.connection.execute('SELECT COUNT(*) FROM %s%s' % (
+            quote(layer_name),
+            ' WHERE ' + where_clause if where_clause else '')).fetchone()[0]
+
+    def add_field(self, layer_name, field_name, storage):
+        field_type = storage['field_type'].upper()
+        if field_type not in FIELD_TYPES:
+            raise ValueError('Unsupported field type: %s' % (field_type,))
+
+        (list_type, column_type) = FIELD_TYPES[field_type]
+        length = storage.get('field_length', None)
+        if length is None and field_type == 'TEXT':
+            length = 255
+        self._add_field_metadata(
+            layer_name, field_name, list_type, storage.get('field_alias'),
+            storage.get('field_is_required') in (True, 'REQUIRED'),
+            storage.get('field_domain'), length,
+            storage.get('field_scale'), storage.get('field_precision'))
+        self.connection.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+            quote(layer_name), quote(field_name), column_type))
+
+    def _add_field_metadata(self, layer_name, field_name, field_type,
+                            alias=None, required=False, domain=None,
+                            length=None, scale=None, precision=None):
+        with self._lock:
+            position = self.connection.execute(
+                'SELECT COUNT(*) FROM gdb_fields WHERE layer_name = ?',
+                (layer_name,)).fetchone()[0]
+            self.connection.execute(
+                'INSERT INTO gdb_fields VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (layer_name, field_name, field_type, alias or field_name,
+                 int(bool(required)), domain or '', length or 0, scale or 0,
+                 precision or 0, position))
+            self._fields.pop(layer_name, None)
+
+    def summarize(self, layer_name, fields, where_clause=None):
+        columns = []
+        for (field_name, statistic) in fields:
+            expression = STATISTICS.get(statistic.upper(), None)
+            if expression is None:
+                raise ValueError('Unsupported statistic: %s' % (statistic,))
+            column = quote(field_name)
+            columns.append(expression % ((column,) * expression.count('%s')))
+
+        row = self.connection.execute('SELECT %s FROM %s%s' % (
+            ', '.join(columns), quote(layer_name),
+            ' WHERE ' + where_clause if where_clause else '')).fetchone()
+
+        summary = {}
+        for ((field_name, statistic), value) in zip(fields, row):
+            if statistic.upper() == 'STD' and value is not None:
+                value = math.sqrt(max(value, 0))
+            summary[re.sub(r'[^A-Za-z0-9]', '_', '%s_%s' % (
+                statistic, field_name))] = value
+        return summary
+
+    def make_layer(self, fc_name, where_clause=None):
+        # SQLite has no layers, so a temporary view serves as one.
+        return self.make_table_view(fc_name, where_clause)
+
+    @contextmanager
+    def make_table_view(self, table_name, where_clause=None):
+        view_name = 'view_%i' % (next(self._view_ids),)
+        self.connection.execute('CREATE TEMP VIEW %s AS SELECT * FROM %s%s' % (
+            quote(view_name), quote(table_name),
+            ' WHERE ' + where_clause if where_clause else ''))
+        try:
+            yield view_name
+        finally:
+            self.connection.execute('DROP VIEW %s' % (quote(view_name),))
+
+    def _read_geometries(self, layer_name):
+        with self.search_cursor(layer_name, ['OID@', 'SHAPE@']) as cursor:
+            return [(oid, shape) for (oid, shape) in cursor
+                    if shape is not None]
+
+    def spatial_join(self, origin, destination, primary_key,
+                     rel_type='INTERSECT', search_radius=None):
+        """
+        Compares every pair of origin and destination geometries, so this
+        is only practical for small layers. The INTERSECT and
+        WITHIN_A_DISTANCE relationships are supported. The search radius
+        is in the units of the coordinates; any units given with it are
+        ignored. If a destination feature is related to more than one
+        origin feature, the one with the highest object ID is used.
+        """
+
+        rel_type = rel_type.upper()
+        if rel_type not in ('INTERSECT', 'WITHIN_A_DISTANCE'):
+            raise NotImplementedError(
+                'Unsupported spatial relationship: %s' % (rel_type,))
+        radius = float(str(search_radius).split()[0]) \
+            if search_radius else 0.0
+
+        origin_type = self._get_geometry_type(origin)
+        dest_type = self._get_geometry_type(destination)
+        origins = sorted(self._read_geometries(origin))
+        oid_map = {}
+        for (dest_oid, dest_shape) in self._read_geometries(destination):
+            for (origin_oid, origin_shape) in origins:
+                if get_distance(dest_shape, dest_type, origin_shape,
+                                origin_type) <= radius:
+                    oid_map[str(dest_oid)] = origin_oid
+        return oid_map
+
+    def create_domain(self, name, domain_type='CodedValue',
+                      coded_values=None, value_range=None,
+                      field_type='SHORT'):
+        """
+        Create a coded value or range domain. The field type is ignored,
+        since any column can store any type of value.
+        """
+
+        if domain_type not in ('CodedValue', 'Range'):
+            raise ValueError('Invalid domain type: %s' % (domain_type,))
+
+        (min_value, max_value) = value_range or (None, None)
+        self.connection.execute(
+            'INSERT INTO gdb_domains VALUES (?, ?, ?, ?)',
+            (name, domain_type, min_value, max_value))
+        self.connection.executemany(
+            'INSERT INTO gdb_coded_values VALUES (?, ?, ?)',
+            [(name, c, d) for (c, d) in (coded_values or {}).items()])
+
+    def create_layer(self, name, fields=(), geometry_type=None,
+                     oid_field_name='OBJECTID', shape_field_name='Shape'):
+        """
+        Create a table, or a feature class if a geometry type (such as
+        POINT or POLYLINE) is given. Fields is a list of field names and
+        storage dictionaries, as accepted by add_field().
+        """
+
+        position = self.connection.execute(
+            'SELECT COUNT(*) FROM gdb_layers').fetchone()[0]
+        self.connection.execute(
+            'INSERT INTO gdb_layers VALUES (?, ?, ?)',
+            (name, geometry_type, position))
+
+        columns = ['%s INTEGER PRIMARY KEY' % (quote(oid_field_name),)]
+        self._add_field_metadata(
+            name, oid_field_name, 'OID', required=True, length=4)
+        if geometry_type is not None:
+            columns.append('%s TEXT' % (quote(shape_field_name),))
+            self._add_field_metadata(
+                name, shape_field_name, 'Geometry', required=True)
+
+        self.connection.execute('CREATE TABLE %s (%s)' % (
+            quote(name), ', '.join(columns)))
+        for (field_name, storage) in fields:
+            self.add_field(name, field_name, storage)
+
+    def create_relationship(self, name, origin, destination, primary_key,
+                            foreign_key, is_attachment=False):
+        """
+        Create a relationship class. For a many-to-many relationship, the
+        destination is the table that stores the relationships.
+        """
+
+        self.connection.execute(
+            'INSERT INTO gdb_relationships VALUES (?, ?, ?, ?, ?, ?)',
+            (name, origin, destination, primary_key, foreign_key,
+             int(is_attachment)))
+
+    def enable_attachments(self, layer_name):
+        """
+        Create an attachment table and relationship class for a layer, named
+        as they are by ArcGIS.
+        """
+
+        table_name = '%s__ATTACH' % (layer_name,)
+        self.create_layer(table_name, [
+            ('REL_OBJECTID', {'field_type': 'LONG'}),
+            ('CONTENT_TYPE', {'field_type': 'TEXT', 'field_length': 150}),
+            ('ATT_NAME', {'field_type': 'TEXT', 'field_length': 250}),
+            ('DATA_SIZE', {'field_type': 'LONG'}),
+            ('DATA', {'field_type': 'BLOB'}),
+        ], oid_field_name='ATTACHMENTID')
+        self.create_relationship(
+            '%s__ATTACHREL' % (layer_name,), layer_name, table_name,
+            self._get_field_of_type(layer_name, 'OID').name, 'REL_OBJECTID',
+            True)
+        return table_name
@@ -0,0 +1,5 @@
+import sys
+from cuuats.datamodel.benchmarks.suite import main
+
+
+sys.exit(main())
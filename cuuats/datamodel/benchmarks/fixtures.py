@@ -0,0 +1,132 @@
+"""
+Feature classes and data used by the ORM benchmarks. The data is written to
+a SQLite workspace so that the benchmarks can run without ArcGIS.
+"""
+
+import os
+import shutil
+import tempfile
+from cuuats.datamodel.benchmarks.generator import DatasetGenerator
+from cuuats.datamodel.features import BaseFeature, relate
+from cuuats.datamodel.fields import NumericField, OIDField, ScaleField, \
+    StringField, WeightsField
+from cuuats.datamodel.manytomany import ManyToManyField
+from cuuats.datamodel.scales import BreaksScale, DictScale, ScaleLevel
+from cuuats.datamodel.workspaces import WorkspaceManager
+
+
+class Warehouse(BaseFeature):
+    """
+    A warehouse that stores many widgets.
+    """
+
+    OBJECTID = OIDField('Object ID')
+    warehouse_name = StringField('Warehouse Name')
+
+
+class Tag(BaseFeature):
+    """
+    A tag that may be applied to many widgets.
+    """
+
+    OBJECTID = OIDField('Object ID')
+    tag_name = StringField('Tag Name')
+
+
+class Widget(BaseFeature):
+    """
+    A widget with a price and a condition that are scored.
+    """
+
+    OBJECTID = OIDField('Object ID')
+    widget_name = StringField('Widget Name')
+    widget_available = NumericField('Available')
+    widget_condition = NumericField('Condition')
+    widget_price = NumericField('Price')
+    widget_weight = NumericField('Weight')
+
+    price_score = ScaleField(
+        'Price Score',
+        value_field='widget_price',
+        scale=BreaksScale([10, 25, 50, 100], [5, 4, 3, 2, 1]))
+
+    condition_score = ScaleField(
+        'Condition Score',
+        value_field='widget_condition',
+        scale=[
+            ('widget_available == 1', DictScale(
+                {1: 1, 2: 2, 3: 4, 4: 5}), 1),
+            (None, DictScale({1: 0, 2: 1, 3: 2, 4: 3}), 0),
+        ])
+
+    total_score = WeightsField(
+        'Total Score',
+        weights={
+            'price_score': 0.6,
+            'condition_score': 0.4,
+        },
+        scale=BreaksScale([2, 3, 4], [
+            ScaleLevel(1, 'Low'),
+            ScaleLevel(2, 'Moderate'),
+            ScaleLevel(3, 'High'),
+            ScaleLevel(4, 'Very High'),
+        ]))
+
+    tags = ManyToManyField(
+        'Tags',
+        related_class=Tag,
+        relationship_class='WidgetTag',
+        foreign_key='widget_id',
+        related_foreign_key='tag_id',
+        primary_key='OBJECTID',
+        related_primary_key='OBJECTID')
+
+
+relate(Warehouse, Widget, 'OBJECTID', 'warehouse_id', 'warehouse')
+
+
+class Fixture(object):
+    """
+    A temporary SQLite workspace created by DatasetGenerator, with the
+    benchmark feature classes registered to it.
+    """
+
+    def __init__(self, size=1000, seed=0):
+        self.size = size
+        self.seed = seed
+        self.directory = tempfile.mkdtemp(prefix='cuuats_benchmark_')
+        self.path = os.path.join(self.directory, 'benchmark.sqlite')
+
+    def __enter__(self):
+        self.create()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.destroy()
+
+    @property
+    def workspace(self):
+        return Widget.workspace
+
+    def create(self):
+        """
+        Create and populate the workspace, and register the feature
+        classes.
+        """
+
+        generator = DatasetGenerator(self.size, seed=self.seed)
+        WorkspaceManager().workspaces[self.path] = generator.generate(
+            self.path)
+        for feature_class in (Warehouse, Tag, Widget):
+            feature_class.register(
+                os.path.join(self.path, feature_class.__name__))
+
+    def destroy(self):
+        """
+        Remove the workspace.
+        """
+
+        workspace = WorkspaceManager().workspaces.pop(self.path, None)
+        if workspace is not None:
+            workspace.backend.connection.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,307 @@
+"""
+Generates seeded, reproducible datasets of any size for scale testing.
+
+Usage: python -m cuuats.datamodel.benchmarks.generator path [options]
+
+The dataset covers the shapes supported by the model:
+
+- Warehouse: a point feature class.
+- Route: a line feature class related to Warehouse.
+- Widget: a point feature class with coded value domains, related to
+  Warehouse, with attachments stored as blobs.
+- Tag: a table.
+- WidgetTag: a table relating widgets and tags (many-to-many).
+
+The workspace type is chosen by the extension of the path, as it is for
+Workspace, so the same dataset can be written to a SQLite database or to a
+file geodatabase.
+"""
+
+import argparse
+import binascii
+import hashlib
+import logging
+import math
+import random
+import sys
+from time import time
+from cuuats.datamodel.backends import get_backend_class
+from cuuats.datamodel.utils import iter_batches
+from cuuats.datamodel.workspaces import Workspace
+
+
+TEXT = {'field_type': 'TEXT', 'field_length': 50}
+SHORT = {'field_type': 'SHORT'}
+LONG = {'field_type': 'LONG'}
+DOUBLE = {'field_type': 'DOUBLE'}
+
+AVAILABILITY = {0: 'No', 1: 'Yes'}
+CONDITIONS = {1: 'Poor', 2: 'Fair', 3: 'Good', 4: 'Excellent'}
+MODES = {'T': 'Truck', 'R': 'Rail', 'A': 'Air'}
+
+# Domain names, field types and coded values.
+DOMAINS = (
+    ('Availability', 'SHORT', AVAILABILITY),
+    ('Condition', 'SHORT', CONDITIONS),
+    ('Mode', 'TEXT', MODES),
+)
+
+# Layer names, geometry types and fields.
+LAYERS = (
+    ('Warehouse', 'POINT', [
+        ('warehouse_name', TEXT),
+        ('warehouse_open', dict(SHORT, field_domain='Availability')),
+    ]),
+    ('Route', 'POLYLINE', [
+        ('route_name', TEXT),
+        ('route_mode', dict(TEXT, field_length=1, field_domain='Mode')),
+        ('route_length', DOUBLE),
+        ('warehouse_id', LONG),
+    ]),
+    ('Tag', None, [
+        ('tag_name', TEXT),
+    ]),
+    ('Widget', 'POINT', [
+        ('widget_name', TEXT),
+        ('widget_available', dict(SHORT, field_domain='Availability')),
+        ('widget_condition', dict(SHORT, field_domain='Condition')),
+        ('widget_price', DOUBLE),
+        ('widget_weight', DOUBLE),
+        ('warehouse_id', LONG),
+        ('price_score', SHORT),
+        ('condition_score', SHORT),
+        ('total_score', DOUBLE),
+    ]),
+    ('WidgetTag', None, [
+        ('widget_id', LONG),
+        ('tag_id', LONG),
+    ]),
+)
+
+# One-to-many relationship classes.
+RELATIONSHIPS = (
+    ('Warehouse_Widget', 'Warehouse', 'Widget', 'OBJECTID', 'warehouse_id'),
+    ('Warehouse_Route', 'Warehouse', 'Route', 'OBJECTID', 'warehouse_id'),
+)
+
+# Layers with attachments.
+ATTACHMENTS = ('Widget',)
+
+
+class DatasetGenerator(object):
+    """
+    Writes a dataset with the given number of widgets to a workspace. The
+    other layers are sized relative to the number of widgets unless their
+    sizes are given. The rows of each layer are generated from their own
+    random number generator, so changing the size of one layer does not
+    change the values in the others.
+    """
+
+    # Width and height of the area containing the generated geometries.
+    EXTENT = 10000.0
+
+    def __init__(self, widgets=1000, warehouses=None, routes=None, tags=None,
+                 tags_per_widget=3, attachment_rate=0.05,
+                 attachment_size=4096, seed=0, batch_size=10000):
+        self.widgets = widgets
+        self.warehouses = max(1, widgets // 50) if warehouses is None \
+            else warehouses
+        self.routes = self.warehouses * 5 if routes is None else routes
+        self.tags = max(1, widgets // 20) if tags is None else tags
+        self.tags_per_widget = min(tags_per_widget, self.tags)
+        self.attachment_rate = attachment_rate
+        self.attachment_size = attachment_size
+        self.seed = seed
+        self.batch_size = batch_size
+
+    def _random(self, layer_name):
+        # Returns a random number generator for the layer.
+        digest = hashlib.md5('%s:%s' % (self.seed, layer_name)).hexdigest()
+        return random.Random(int(digest, 16))
+
+    def _point(self, rand):
+        return (rand.uniform(0, self.EXTENT), rand.uniform(0, self.EXTENT))
+
+    def _line(self, rand):
+        # A random walk with 2 to 8 vertices.
+        (x, y) = self._point(rand)
+        points = [(x, y)]
+        for i in range(rand.randint(1, 7)):
+            angle = rand.uniform(0, 2 * math.pi)
+            distance = rand.uniform(10, 500)
+            (x, y) = (x + distance * math.cos(angle),
+                      y + distance * math.sin(angle))
+            points.append((x, y))
+        return points
+
+    def _blob(self, rand, size):
+        if size <= 0:
+            return ''
+        return binascii.unhexlify('%0*x' % (size * 2, rand.getrandbits(
+            size * 8)))
+
+    def create_schema(self, backend):
+        """
+        Create the domains, layers, relationship classes and attachment
+        tables using the backend.
+        """
+
+        for (name, field_type, coded_values) in DOMAINS:
+            backend.create_domain(
+                name, coded_values=coded_values, field_type=field_type)
+        for (name, geometry_type, fields) in LAYERS:
+            backend.create_layer(name, fields, geometry_type)
+        for relationship in RELATIONSHIPS:
+            backend.create_relationship(*relationship)
+
+        return dict([(layer_name, backend.enable_attachments(layer_name))
+                     for layer_name in ATTACHMENTS])
+
+    def _insert(self, workspace, layer_name, field_names, rows):
+        # Insert rows in batches, returning the new object IDs.
+        oids = []
+        for batch in iter_batches(rows, self.batch_size):
+            oids.extend(workspace.insert_rows(layer_name, field_names, batch))
+        logging.debug('Inserted %i rows in %s' % (len(oids), layer_name))
+        return oids
+
+    def iter_warehouses(self):
+        rand = self._random('Warehouse')
+        for i in range(self.warehouses):
+            yield ('Warehouse %i' % (i + 1,), int(rand.random() < 0.9),
+                   self._point(rand))
+
+    def iter_routes(self, warehouse_oids):
+        rand = self._random('Route')
+        modes = sorted(MODES.keys())
+        for i in range(self.routes):
+            points = self._line(rand)
+            length = sum([math.hypot(b[0] - a[0], b[1] - a[1])
+                          for (a, b) in zip(points[:-1], points[1:])])
+            yield ('Route %i' % (i + 1,), rand.choice(modes),
+                   round(length, 2), rand.choice(warehouse_oids),
+                   'LINESTRING (%s)' % (', '.join(
+                       ['%r %r' % p for p in points]),))
+
+    def iter_tags(self):
+        for i in range(self.tags):
+            yield ('Tag %i' % (i + 1,),)
+
+    def iter_widgets(self, warehouse_oids):
+        rand = self._random('Widget')
+        availability = sorted(AVAILABILITY.keys())
+        conditions = sorted(CONDITIONS.keys())
+        for i in range(self.widgets):
+            yield ('Widget %i' % (i + 1,), rand.choice(availability),
+                   rand.choice(conditions), round(rand.uniform(1, 150), 2),
+                   round(rand.uniform(0.1, 20), 2),
+                   rand.choice(warehouse_oids), self._point(rand))
+
+    def iter_widget_tags(self, widget_oids, tag_oids):
+        # Every widget has at least one tag.
+        rand = self._random('WidgetTag')
+        for widget_oid in widget_oids:
+            for tag_oid in rand.sample(
+                    tag_oids, rand.randint(1, self.tags_per_widget)):
+                yield (widget_oid, tag_oid)
+
+    def iter_attachments(self, widget_oids):
+        rand = self._random('Attachment')
+        for widget_oid in widget_oids:
+            if rand.random() < self.attachment_rate:
+                yield (widget_oid, 'application/octet-stream',
+                       'widget_%i.bin' % (widget_oid,),
+                       self.attachment_size,
+                       self._blob(rand, self.attachment_size))
+
+    def populate(self, workspace, attachment_tables):
+        """
+        Insert the rows of each layer into the workspace.
+        """
+
+        warehouse_oids = self._insert(
+            workspace, 'Warehouse',
+            ['warehouse_name', 'warehouse_open', 'SHAPE@XY'],
+            self.iter_warehouses())
+        self._insert(
+            workspace, 'Route',
+            ['route_name', 'route_mode', 'route_length', 'warehouse_id',
+             'SHAPE@WKT'],
+            self.iter_routes(warehouse_oids))
+        tag_oids = self._insert(
+            workspace, 'Tag', ['tag_name'], self.iter_tags())
+        widget_oids = self._insert(
+            workspace, 'Widget',
+            ['widget_name', 'widget_available', 'widget_condition',
+             'widget_price', 'widget_weight', 'warehouse_id', 'SHAPE@XY'],
+            self.iter_widgets(warehouse_oids))
+        self._insert(
+            workspace, 'WidgetTag', ['widget_id', 'tag_id'],
+            self.iter_widget_tags(widget_oids, tag_oids))
+        self._insert(
+            workspace, attachment_tables['Widget'],
+            ['REL_OBJECTID', 'CONTENT_TYPE', 'ATT_NAME', 'DATA_SIZE', 'DATA'],
+            self.iter_attachments(widget_oids))
+
+    def generate(self, path):
+        """
+        Create the dataset in a new workspace at the path, and return a
+        Workspace for it.
+        """
+
+        start = time()
+        backend = get_backend_class(path).create(path)
+        attachment_tables = self.create_schema(backend)
+        workspace = Workspace(path, backend=backend)
+        self.populate(workspace, attachment_tables)
+        logging.debug('Generated %s in %.3f seconds' % (path, time() - start))
+        return workspace
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m cuuats.datamodel.benchmarks.generator',
+        description='Generate a dataset for scale testing.')
+    parser.add_argument(
+        'path', help='workspace to create (for example, data.sqlite)')
+    parser.add_argument(
+        '--widgets', type=int, default=1000,
+        help='number of widgets (default: 1000)')
+    parser.add_argument(
+        '--warehouses', type=int,
+        help='number of warehouses (default: 1 per 50 widgets)')
+    parser.add_argument(
+        '--routes', type=int,
+        help='number of routes (default: 5 per warehouse)')
+    parser.add_argument(
+        '--tags', type=int,
+        help='number of tags (default: 1 per 20 widgets)')
+    parser.add_argument(
+        '--tags-per-widget', type=int, default=3,
+        help='maximum number of tags per widget (default: 3)')
+    parser.add_argument(
+        '--attachment-rate', type=float, default=0.05,
+        help='fraction of widgets with an attachment (default: 0.05)')
+    parser.add_argument(
+        '--attachment-size', type=int, default=4096,
+        help='size of each attachment in bytes (default: 4096)')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='random seed (default: 0)')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    generator = DatasetGenerator(
+        args.widgets, args.warehouses, args.routes, args.tags,
+        args.tags_per_widget, args.attachment_rate, args.attachment_size,
+        args.seed)
+    start = time()
+    workspace = generator.generate(args.path)
+
+    for layer_name in workspace.list_layers():
+        print('%-20s %10i' % (layer_name, workspace.count_rows(layer_name)))
+    print('Generated %s in %.1f seconds' % (args.path, time() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Benchmarks for the ORM hot paths. Each benchmark takes a Fixture and returns
+a (function, items) tuple, where calling the function once processes the
+given number of items.
+"""
+
+from cuuats.datamodel.benchmarks.fixtures import Warehouse, Widget
+from cuuats.datamodel.benchmarks.query import BenchmarkFeature, make_mixed_q
+from cuuats.datamodel.domains import D
+from cuuats.datamodel.query import SQLCompiler
+
+
+def _load(queryset):
+    # Evaluate the QuerySet so that benchmarks exclude the query itself.
+    features = list(queryset)
+    return (queryset, features)
+
+
+def feature_construction(fixture):
+    """
+    Convert rows into features using QuerySet._feature.
+    """
+
+    queryset = Widget.objects.all()
+    rows = [list(row) for (row, cursor) in fixture.workspace.iter_rows(
+        Widget.name, queryset.query.fields)]
+
+    def run():
+        for row in rows:
+            queryset._feature(row)
+
+    return (run, len(rows))
+
+
+def q_simplify(fixture):
+    """
+    Build and simplify a large Q tree with a mix of AND, OR and NOT.
+    Simplification is memoized, so a new tree is built for each run.
+    """
+
+    size = max(10, fixture.size)
+
+    def run():
+        make_mixed_q(size).simplify()
+
+    return (run, size)
+
+
+def q_compile(fixture):
+    """
+    Compile a large Q tree without the compiled where clause cache.
+    """
+
+    size = max(10, fixture.size)
+    q = make_mixed_q(size)
+
+    def run():
+        SQLCompiler.clear_cache()
+        SQLCompiler(BenchmarkFeature).compile(q)
+
+    return (run, size)
+
+
+def prefetch_related_manager(fixture):
+    """
+    Prefetch the widgets of each warehouse.
+    """
+
+    (queryset, features) = _load(
+        Warehouse.objects.prefetch_related('widget_set'))
+    return (lambda: queryset._prefetch(features), fixture.size)
+
+
+def prefetch_foreign_key(fixture):
+    """
+    Prefetch the warehouse of each widget.
+    """
+
+    (queryset, features) = _load(
+        Widget.objects.prefetch_related('warehouse'))
+    return (lambda: queryset._prefetch(features), len(features))
+
+
+def prefetch_many_to_many(fixture):
+    """
+    Prefetch the tags of each widget.
+    """
+
+    (queryset, features) = _load(Widget.objects.prefetch_related('tags'))
+    return (lambda: queryset._prefetch(features), len(features))
+
+
+def feature_diff(fixture):
+    """
+    Find the changes to features with one modified field.
+    """
+
+    (queryset, features) = _load(Widget.objects.all())
+    for feature in features:
+        feature.widget_weight += 1
+
+    def run():
+        for feature in features:
+            feature.diff()
+
+    return (run, len(features))
+
+
+def feature_save(fixture):
+    """
+    Save features with one modified field in an edit session.
+    """
+
+    (queryset, features) = _load(Widget.objects.all())
+
+    def run():
+        with fixture.workspace.edit():
+            for feature in features:
+                feature.widget_weight += 1
+                feature.save()
+
+    return (run, len(features))
+
+
+def scoring(fixture):
+    """
+    Score features using a weights field of scale fields.
+    """
+
+    (queryset, features) = _load(Widget.objects.all())
+
+    def run():
+        for feature in features:
+            feature.total_score
+
+    return (run, len(features))
+
+
+def summarize(fixture):
+    """
+    Summarize features by the levels of a weights field.
+    """
+
+    (queryset, features) = _load(Widget.objects.all())
+    return (lambda: queryset.summarize(
+        'total_score', price='widget_price', weight='widget_weight'),
+        len(features))
+
+
+def coded_values(fixture):
+    """
+    Decode domain values and look up codes by description.
+    """
+
+    (queryset, features) = _load(Widget.objects.all())
+    workspace = fixture.workspace
+    descriptions = [D('Yes'), D('No')]
+
+    def run():
+        for feature in features:
+            feature.widget_available.description
+            feature.widget_condition.description
+        for (index, feature) in enumerate(features):
+            feature.widget_available = descriptions[index % 2]
+            workspace.get_coded_value('Condition', 'Good')
+
+    return (run, len(features))
+
+
+BENCHMARKS = (
+    ('feature_construction', feature_construction),
+    ('q_simplify', q_simplify),
+    ('q_compile', q_compile),
+    ('prefetch_related_manager', prefetch_related_manager),
+    ('prefetch_foreign_key', prefetch_foreign_key),
+    ('prefetch_many_to_many', prefetch_many_to_many),
+    ('feature_diff', feature_diff),
+    ('feature_save', feature_save),
+    ('scoring', scoring),
+    ('summarize', summarize),
+    ('coded_values', coded_values),
+)
@@ -0,0 +1,127 @@
+"""
+Micro-benchmarks for simplifying and compiling large Q trees.
+
+Usage: python -m cuuats.datamodel.benchmarks.query [size ...]
+"""
+
+import random
+import sys
+from timeit import default_timer
+from cuuats.datamodel.features import BaseFeature
+from cuuats.datamodel.fields import OIDField, NumericField, StringField
+from cuuats.datamodel.query import Q, SQLCompiler
+
+
+class BenchmarkFeature(BaseFeature):
+    """
+    Unregistered feature class used to compile where clauses.
+    """
+
+    OBJECTID = OIDField('OID')
+    number = NumericField('Number')
+    label = StringField('Label')
+
+
+BenchmarkFeature.name = 'BenchmarkFeature'
+
+
+def make_or_q(size):
+    """
+    A disjunction of conditions, as built by a loop over filter values.
+    """
+
+    q = Q(number=0)
+    for i in range(1, size):
+        q = q | Q(number=i)
+    return q
+
+
+def make_and_q(size):
+    """
+    A conjunction of conditions on two fields.
+    """
+
+    q = Q(number__gt=0)
+    for i in range(1, size):
+        q = q & Q(label__contains='%i' % (i,))
+    return q
+
+
+def make_mixed_q(size, seed=0):
+    """
+    Conditions combined using a random mix of AND, OR and NOT.
+    """
+
+    rand = random.Random(seed)
+    q = Q(number=0)
+    for i in range(1, size):
+        other = Q(number__gte=i) if i % 3 else ~Q(label='%i' % (i,))
+        q = q & other if rand.random() < 0.5 else q | other
+    return q
+
+
+TREES = (
+    ('or', make_or_q),
+    ('and', make_and_q),
+    ('mixed', make_mixed_q),
+)
+
+
+def time_call(fn, repeat=5, setup=None):
+    """
+    Returns the best time in seconds for calling fn. If setup is given, fn
+    is called with the result of setup(), which is not timed.
+    """
+
+    times = []
+    for i in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = default_timer()
+        fn(*args)
+        times.append(default_timer() - start)
+    return min(times)
+
+
+def run(sizes=(10, 100, 1000), repeat=5):
+    """
+    Run the benchmarks, returning a list of (tree, size, build, simplify,
+    compile, cached compile) tuples with times in seconds.
+    """
+
+    results = []
+    for (tree_name, make_q) in TREES:
+        for size in sizes:
+            def build():
+                return make_q(size)
+
+            def build_uncached():
+                SQLCompiler.clear_cache()
+                return make_q(size)
+
+            def compile_q(q):
+                SQLCompiler(BenchmarkFeature).compile(q)
+
+            # Each simplify and compile call gets a fresh tree, built outside
+            # of the timed call.
+            q = make_q(size)
+            compile_q(q)
+
+            results.append((
+                tree_name, size, time_call(build, repeat),
+                time_call(lambda q: q.simplify(), repeat, build),
+                time_call(compile_q, repeat, build_uncached),
+                time_call(lambda: compile_q(q), repeat)))
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    sizes = [int(a) for a in argv] or [10, 100, 1000]
+    print('%-6s %6s %10s %10s %10s %10s' % (
+        'tree', 'size', 'build', 'simplify', 'compile', 'cached'))
+    for result in run(sizes):
+        print('%-6s %6i %10.6f %10.6f %10.6f %10.6f' % result)
+
+
+if __name__ == '__main__':
+    main()
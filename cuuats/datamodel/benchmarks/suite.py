@@ -0,0 +1,159 @@
+"""
+Runs the ORM benchmarks, records baselines and detects regressions.
+
+Usage: python -m cuuats.datamodel.benchmarks [options]
+
+Throughput is measured in items per second using the best of several runs.
+When a baseline is given, the exit status is 1 if the throughput of any
+benchmark has dropped by more than the threshold.
+"""
+
+import argparse
+import json
+import platform
+import sys
+from cuuats.datamodel.benchmarks.fixtures import Fixture
+from cuuats.datamodel.benchmarks.orm import BENCHMARKS
+from cuuats.datamodel.benchmarks.query import time_call
+
+
+# Version of the baseline file format.
+BASELINE_FORMAT = 1
+
+
+def run(size=1000, repeat=5, seed=0, names=None):
+    """
+    Run the benchmarks, returning a dictionary of results keyed by
+    benchmark name. Each result has the best time in seconds, the number of
+    items processed and the throughput in items per second.
+    """
+
+    unknown = set(names or []) - set([n for (n, b) in BENCHMARKS])
+    if unknown:
+        raise KeyError('Unknown benchmarks: %s' % (', '.join(sorted(unknown))))
+
+    results = {}
+    with Fixture(size, seed) as fixture:
+        for (name, benchmark) in BENCHMARKS:
+            if names and name not in names:
+                continue
+            (fn, items) = benchmark(fixture)
+            seconds = time_call(fn, repeat)
+            results[name] = {
+                'seconds': seconds,
+                'items': items,
+                'throughput': items / seconds if seconds else float('inf'),
+            }
+    return results
+
+
+def save_baseline(path, results, size, seed):
+    """
+    Write the results to a JSON baseline file.
+    """
+
+    with open(path, 'w') as baseline_file:
+        json.dump({
+            'format': BASELINE_FORMAT,
+            'size': size,
+            'seed': seed,
+            'python': platform.python_version(),
+            'results': results,
+        }, baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """
+    Read a JSON baseline file.
+    """
+
+    with open(path, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+
+    if baseline.get('format', None) != BASELINE_FORMAT:
+        raise ValueError('%s is not a version %i baseline' % (
+            path, BASELINE_FORMAT))
+    return baseline
+
+
+def compare(results, baseline_results, threshold=0.2):
+    """
+    Compare results with baseline results, returning a list of (name,
+    ratio, regressed) tuples for benchmarks found in both. The ratio is the
+    current throughput divided by the baseline throughput, and a benchmark
+    has regressed if the ratio is less than 1 - threshold.
+    """
+
+    comparisons = []
+    for name in sorted(results.keys()):
+        if name not in baseline_results:
+            continue
+        ratio = results[name]['throughput'] / \
+            baseline_results[name]['throughput']
+        comparisons.append((name, ratio, ratio < 1 - threshold))
+    return comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m cuuats.datamodel.benchmarks',
+        description='Benchmark the cuuats.datamodel ORM.')
+    parser.add_argument(
+        'names', nargs='*', metavar='name',
+        help='benchmarks to run (default: all)')
+    parser.add_argument(
+        '--size', type=int, default=1000,
+        help='number of widgets in the fixture (default: 1000)')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of times to run each benchmark (default: 5)')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='random seed for the fixture data (default: 0)')
+    parser.add_argument(
+        '--save', metavar='PATH',
+        help='save the results as a JSON baseline')
+    parser.add_argument(
+        '--baseline', metavar='PATH',
+        help='compare the results with a JSON baseline')
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='fraction by which throughput may drop before a benchmark '
+             'fails (default: 0.2)')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    results = run(args.size, args.repeat, args.seed, args.names)
+
+    print('%-26s %8s %12s %14s' % ('benchmark', 'items', 'seconds', 'items/s'))
+    for (name, benchmark) in BENCHMARKS:
+        if name in results:
+            result = results[name]
+            print('%-26s %8i %12.6f %14.1f' % (
+                name, result['items'], result['seconds'],
+                result['throughput']))
+
+    if args.save:
+        save_baseline(args.save, results, args.size, args.seed)
+
+    if baseline is None:
+        return 0
+
+    if baseline['size'] != args.size:
+        print('Warning: the baseline fixture size is %i' % (
+            baseline['size'],))
+
+    print('')
+    print('%-26s %8s' % ('benchmark', 'change'))
+    regressions = 0
+    for (name, ratio, regressed) in compare(
+            results, baseline['results'], args.threshold):
+        print('%-26s %+7.1f%%%s' % (
+            name, (ratio - 1) * 100, '  REGRESSION' if regressed else ''))
+        regressions += regressed
+
+    if regressions:
+        print('%i benchmark(s) slower than the baseline by more than %i%%' % (
+            regressions, round(args.threshold * 100)))
+        return 1
+    return 0
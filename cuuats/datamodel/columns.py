@@ -0,0 +1,85 @@
+"""
+Column-wise evaluation of fields and expressions.
+"""
+
+import itertools
+from cuuats.datamodel.expressions import compile_expression
+
+
+class ColumnSet(object):
+    """
+    Field values for many features of the same class, stored as one list
+    per field. Fields and expressions are evaluated one column at a time,
+    returning the same values that the features would.
+    """
+
+    def __init__(self, feature_class, raw_columns, length):
+        self.feature_class = feature_class
+        self.raw_columns = raw_columns
+        self.length = length
+        self._columns = {}
+
+    def __len__(self):
+        return self.length
+
+    def get(self, field_name):
+        """
+        Returns the values of a field, as they would be returned by the
+        field's descriptor. Calculated fields are calculated once.
+        """
+
+        if field_name not in self._columns:
+            field = self.feature_class.fields[field_name]
+            self._columns[field_name] = field.get_many(self)
+        return self._columns[field_name]
+
+    def get_raw(self, field_name):
+        """
+        Returns the database values of a stored field.
+        """
+
+        return self.raw_columns[field_name]
+
+    def subset(self, indexes):
+        """
+        Returns a ColumnSet containing only the rows at the given indexes.
+        """
+
+        subset = self.__class__(
+            self.feature_class,
+            dict([(n, [c[i] for i in indexes])
+                  for (n, c) in self.raw_columns.items()]),
+            len(indexes))
+        subset._columns = dict([(n, [c[i] for i in indexes])
+                                for (n, c) in self._columns.items()])
+        return subset
+
+    def eval(self, expression):
+        """
+        Evaluate the expression for each row, and return a list of results.
+        """
+
+        compiled = compile_expression(expression)
+        if 'self' in compiled.identifiers:
+            raise ValueError(
+                'Expressions that refer to self cannot be evaluated '
+                'over columns')
+
+        field_names = compiled.get_field_names(self.feature_class.fields)
+        if not field_names:
+            return [compiled.evaluate({}) for i in xrange(self.length)]
+
+        columns = [self.get(n) for n in field_names]
+        return [compiled.evaluate(dict(zip(field_names, row)))
+                for row in itertools.izip(*columns)]
+
+    def check_condition(self, condition, default=True):
+        """
+        Returns a list of booleans indicating whether the condition is true
+        for each row.
+        """
+
+        if condition is None:
+            return [default] * self.length
+
+        return [bool(value) for value in self.eval(condition)]
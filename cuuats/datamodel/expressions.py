@@ -0,0 +1,131 @@
+"""
+Compiled expressions used for conditions and calculated fields.
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from cuuats.datamodel.utils import IDENTIFIER_RE
+
+
+def _make_remover(cache, key):
+    # Returns a weak reference callback that removes the cache entry for
+    # the referenced object.
+    def remove(ref):
+        if cache.get(key, (None,))[0] is ref:
+            del cache[key]
+    return remove
+
+
+class CompiledExpression(object):
+    """
+    An expression compiled to a code object, along with the identifiers
+    that it references.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.code = compile(expression, '<expression>', 'eval')
+        self.identifiers = frozenset(IDENTIFIER_RE.findall(expression))
+        self._field_names = {}
+
+    def __repr__(self):
+        return '<CompiledExpression: %s>' % (self.expression,)
+
+    def get_field_names(self, fields):
+        """
+        Returns the names of the fields in the FieldSet that are referenced
+        by this expression, in field order.
+        """
+
+        # Field sets are unhashable, so they are keyed by ID. The weak
+        # reference removes the entry when the field set is discarded, so
+        # entries do not accumulate and IDs are not reused while cached.
+        key = id(fields)
+        (fields_ref, field_names) = self._field_names.get(key, (None, None))
+        if fields_ref is None or fields_ref() is not fields:
+            field_names = [n for n in fields.keys() if n in self.identifiers]
+            fields_ref = weakref.ref(
+                fields, _make_remover(self._field_names, key))
+            self._field_names[key] = (fields_ref, field_names)
+        return field_names
+
+    def evaluate(self, locals_dict):
+        """
+        Evaluate the expression using a dictionary of local variables.
+        """
+
+        return eval(self.code, {}, locals_dict)
+
+
+class ExpressionCache(object):
+    """
+    A thread-safe cache of compiled expressions. When the cache is full,
+    the least recently used expression is discarded.
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, expression):
+        """
+        Returns the CompiledExpression for the expression, compiling it if
+        necessary.
+        """
+
+        with self._lock:
+            compiled = self._cache.pop(expression, None)
+            if compiled is not None:
+                self._cache[expression] = compiled
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        compiled = CompiledExpression(expression)
+        with self._lock:
+            self._cache[expression] = compiled
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        """
+        Discard all compiled expressions and reset the counters.
+        """
+
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        """
+        Returns a dictionary of cache statistics.
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._cache),
+            'max_size': self.max_size,
+        }
+
+
+# The cache shared by the whole process.
+expression_cache = ExpressionCache()
+
+
+def compile_expression(expression):
+    """
+    Returns the CompiledExpression for the expression from the process-wide
+    cache.
+    """
+
+    return expression_cache.get(expression)
@@ -1,29 +1,27 @@
-import inspect
+import fnmatch
 import os
+import sys
+from collections import OrderedDict
 from cuuats.datamodel.features import BaseFeature, relate
 from cuuats.datamodel.fields import BlobField, GeometryField, GlobalIDField, \
     OIDField, StringField, NumericField
 from cuuats.datamodel.workspaces import WorkspaceManager
 
 
-def feature_class_factory(path, register=True, exclude=[],
-                          follow_relationships=True, class_name=None):
-    """
-    Create a feature class by introspecting the workspace.
-    """
+# Feature classes created by load_workspace_models, keyed by workspace path
+# and then by layer name, and the relationships that have been set up
+# between them.
+_workspace_models = {}
+_workspace_relationships = {}
 
-    workspace_path, fc_name = os.path.split(path)
-    workspace = WorkspaceManager().get(workspace_path)
 
+def _create_feature_class(workspace, fc_name, class_name, module):
     class Feature(BaseFeature):
         pass
 
-    # Set the name of the feature class.
+    # Set the name and module of the feature class.
     Feature.__name__ = str(class_name or fc_name)
-
-    # Set the module of the feature class to the module of the caller.
-    frame = inspect.stack()[1]
-    Feature.__module__ = inspect.getmodule(frame[0])
+    Feature.__module__ = module
 
     # Add fields to the feature class.
     # TODO: Handle Date and Raster field types.
@@ -42,6 +40,23 @@ def feature_class_factory(path, register=True, exclude=[],
 
         setattr(Feature, db_name, field)
 
+    return Feature
+
+
+def feature_class_factory(path, register=True, exclude=[],
+                          follow_relationships=True, class_name=None):
+    """
+    Create a feature class by introspecting the workspace.
+    """
+
+    workspace_path, fc_name = os.path.split(path)
+    workspace = WorkspaceManager().get(workspace_path)
+
+    # Set the module of the feature class to the module of the caller.
+    Feature = _create_feature_class(
+        workspace, fc_name, class_name,
+        sys._getframe(1).f_globals.get('__name__'))
+
     # Set up relationships.
     if follow_relationships:
         for rc_info in workspace.list_relationships(fc_name):
@@ -53,6 +68,7 @@ def feature_class_factory(path, register=True, exclude=[],
                     workspace_path, rc_info.destination)
                 RelatedFeature = feature_class_factory(
                     related_path, register=False, follow_relationships=False)
+                RelatedFeature.__module__ = Feature.__module__
                 relate(Feature, RelatedFeature, rc_info.primary_key,
                        rc_info.foreign_key)
                 if register:
@@ -61,6 +77,7 @@ def feature_class_factory(path, register=True, exclude=[],
                 related_path = os.path.join(workspace_path, rc_info.origin)
                 RelatedFeature = feature_class_factory(
                     related_path, register=False, follow_relationships=False)
+                RelatedFeature.__module__ = Feature.__module__
                 relate(RelatedFeature, Feature, rc_info.primary_key,
                        rc_info.foreign_key)
                 if register:
@@ -71,3 +88,108 @@ def feature_class_factory(path, register=True, exclude=[],
         Feature.register(path)
 
     return Feature
+
+
+def _match_layer(layer_name, patterns):
+    return any([fnmatch.fnmatchcase(layer_name.lower(), p.lower())
+                for p in patterns])
+
+
+def _is_registered(feature_class):
+    # Lazily registered classes count as registered.
+    return feature_class.workspace is not None or \
+        '_lazy_path' in feature_class.__dict__
+
+
+def load_workspace_models(workspace_path, include=None, exclude=None,
+                          register=True, lazy=False, module=None):
+    """
+    Create a feature class for each table and feature class in the
+    workspace, and relate them to each other. Layer names may be limited
+    using lists of names or wildcard patterns to include and exclude.
+
+    Each layer is described once, and only one feature class is created for
+    each layer, no matter how many times this function is called. Returns
+    an OrderedDict of feature classes keyed by layer name. If lazy is true,
+    each class is registered when it is first used.
+    """
+
+    workspace = WorkspaceManager().get(workspace_path)
+    if module is None:
+        module = sys._getframe(1).f_globals.get('__name__')
+
+    # Registering the classes describes the same layers and relationship
+    # classes again, so describe them once for the whole load.
+    with workspace.memoize_schema():
+        return _load_workspace_models(
+            workspace, workspace_path, include, exclude, register, lazy,
+            module)
+
+
+def _load_workspace_models(workspace, workspace_path, include, exclude,
+                           register, lazy, module):
+    models = _workspace_models.setdefault(workspace_path, OrderedDict())
+    wired = _workspace_relationships.setdefault(workspace_path, set())
+
+    layer_names = [
+        n for n in workspace.list_layers()
+        if (include is None or _match_layer(n, include)) and
+        not (exclude and _match_layer(n, exclude))]
+
+    # Attachment tables are represented by the attachment class of the
+    # layer they belong to.
+    relationships = OrderedDict()
+    for layer_name in layer_names:
+        for rc_info in workspace.list_relationships(layer_name):
+            relationships[rc_info] = None
+    attachment_tables = set(
+        [r.destination for r in relationships if r.is_attachment])
+
+    created = OrderedDict()
+    for layer_name in layer_names:
+        if layer_name in models or layer_name in attachment_tables:
+            continue
+        created[layer_name] = models[layer_name] = _create_feature_class(
+            workspace, layer_name, None, module)
+
+    # Relate classes using the shared relationship information.
+    changed = OrderedDict(created)
+    for rc_info in relationships:
+        if rc_info.is_attachment or rc_info in wired or \
+                rc_info.origin not in models or \
+                rc_info.destination not in models:
+            continue
+
+        relate(models[rc_info.origin], models[rc_info.destination],
+               rc_info.primary_key, rc_info.foreign_key)
+        changed[rc_info.destination] = models[rc_info.destination]
+        wired.add(rc_info)
+
+    results = OrderedDict(
+        [(n, models[n]) for n in layer_names if n in models])
+
+    # Register new classes, reregister classes with new foreign keys, and
+    # register classes created by earlier calls without registration.
+    if register:
+        for (layer_name, feature_class) in results.items():
+            if not _is_registered(feature_class):
+                changed.setdefault(layer_name, feature_class)
+        for (layer_name, feature_class) in changed.items():
+            feature_class.register(
+                os.path.join(workspace_path, layer_name), lazy=lazy)
+
+    return results
+
+
+def clear_workspace_models(workspace_path=None):
+    """
+    Forget the feature classes created by load_workspace_models for the
+    given workspace, or for all workspaces.
+    """
+
+    if workspace_path is None:
+        _workspace_models.clear()
+        _workspace_relationships.clear()
+    else:
+        _workspace_models.pop(workspace_path, None)
+        _workspace_relationships.pop(workspace_path, None)
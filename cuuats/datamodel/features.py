@@ -1,14 +1,31 @@
+import logging
 import os
-import re
-from collections import OrderedDict, namedtuple
+import threading
+import weakref
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from time import time
+from timeit import default_timer
+from cuuats.datamodel import instrumentation
 from cuuats.datamodel.fields import BaseField, OIDField, CalculatedField, \
     ForeignKey, NumericField, StringField, BlobField, GeometryField
 from cuuats.datamodel.field_values import DeferredValue
 from cuuats.datamodel.query import Q, Manager, SQLCompiler
+from cuuats.datamodel.expressions import compile_expression
+from cuuats.datamodel.utils import IDENTIFIER_RE
 from cuuats.datamodel.workspaces import WorkspaceManager
 
 
-IDENTIFIER_RE = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+# Lazy registrations are completed one at a time. Completing a registration
+# uses the fields of the class, so the lock must be reentrant.
+_registration_lock = threading.RLock()
+_registering = set()
+
+# Lazily registered feature classes, mapped to the number of seconds taken
+# to complete their registration, or None if it has not been completed.
+_lazy_registrations = weakref.WeakKeyDictionary()
+
+# The number of seconds taken by each registration that was not lazy.
+_eager_registration_seconds = []
 
 
 def require_registration(fn):
@@ -17,6 +34,14 @@ def require_registration(fn):
     """
 
     def wrapper(*args, **kwargs):
+        feature_class = args[0]
+        if not isinstance(feature_class, type):
+            feature_class = type(feature_class)
+        complete_registration = getattr(
+            feature_class, 'complete_registration', None)
+        if complete_registration is not None:
+            complete_registration()
+
         if getattr(args[0], 'workspace', None) is None:
             raise AttributeError(
                 'Feature class %s must be registered' %
@@ -32,6 +57,8 @@ class FieldSet(OrderedDict):
         super(FieldSet, self).__init__(*args, **kwargs)
         self.oid_field = None
         self.geom_field = None
+        self._dependents = None
+        self._volatile = None
         # Set the name and db_name of fields. This also happens during
         # field registration, but we may need to access these attributes
         # before the field is registered.
@@ -59,10 +86,61 @@ class FieldSet(OrderedDict):
 
         return self[field_name].db_name
 
+    def _find_dependencies(self):
+        # Map each stored field to the calculated fields that depend on it,
+        # directly or through other calculated fields. Calculated fields
+        # that depend on the feature itself are volatile.
+        dependents = defaultdict(set)
+        volatile = set()
+        for (field_name, field) in self.items():
+            if not isinstance(field, CalculatedField):
+                continue
+
+            seen = set()
+            pending = list(field.get_dependencies())
+            while pending:
+                dependency = pending.pop()
+                if dependency == 'self':
+                    volatile.add(field_name)
+                if dependency in seen or dependency not in self:
+                    continue
+                seen.add(dependency)
+
+                dependency_field = self[dependency]
+                if isinstance(dependency_field, CalculatedField):
+                    pending.extend(dependency_field.get_dependencies())
+                else:
+                    dependents[dependency].add(field_name)
+
+        self._dependents = dict(dependents)
+        self._volatile = volatile
+
+    def get_dependents(self, field_name):
+        """
+        Returns the names of the calculated fields whose values depend on
+        the given stored field.
+        """
+
+        if self._dependents is None:
+            self._find_dependencies()
+        return self._dependents.get(field_name, ())
+
+    def is_volatile(self, field_name):
+        """
+        Returns true if the value of the calculated field may depend on
+        attributes of the feature other than its fields.
+        """
+
+        if self._volatile is None:
+            self._find_dependencies()
+        return field_name in self._volatile
+
 
 class FieldManager(object):
 
     def __get__(self, instance, owner):
+        if '_lazy_path' in owner.__dict__:
+            owner.complete_registration()
         if getattr(owner, '_fields', None) is None:
             self._cache_fields(owner)
         return owner._fields
@@ -95,31 +173,95 @@ class BaseFeature(object):
     objects = Manager()
     fields = FieldManager()
     related_classes = None
+    cache_calculated = False
+    _queryset = None
+
+    @classmethod
+    def register(cls, path, lazy=False):
+        """
+        Connect this feature class to a feature class in a workspace. If
+        lazy is true, the workspace is not accessed until the objects or
+        fields of the class, or an instance of it, are first used.
+        """
+
+        with _registration_lock:
+            if lazy:
+                cls.name = os.path.split(path)[1]
+                cls.workspace = None
+                cls._lazy_path = path
+                _lazy_registrations[cls] = None
+                cls._register_related()
+                return
+
+            if '_lazy_path' in cls.__dict__:
+                del cls._lazy_path
+            start = time()
+            cls._register(path)
+            _eager_registration_seconds.append(time() - start)
 
     @classmethod
-    def register(cls, path):
+    def complete_registration(cls):
         """
-        Connect this feature class to a feature class in a workspace.
+        Complete a lazy registration. This is done automatically when the
+        class is first used, and does nothing if the registration is not
+        pending.
         """
 
+        if '_lazy_path' not in cls.__dict__:
+            return
+
+        with _registration_lock:
+            # Another thread may have completed the registration while we
+            # waited, or this thread may be completing it now.
+            if '_lazy_path' not in cls.__dict__ or cls in _registering:
+                return
+
+            _registering.add(cls)
+            start = time()
+            try:
+                cls._register(cls._lazy_path)
+                del cls._lazy_path
+            finally:
+                _registering.discard(cls)
+
+            _lazy_registrations[cls] = time() - start
+            logging.debug('Completed registration of %s in %.3f seconds' % (
+                cls.__name__, _lazy_registrations[cls]))
+
+    @classmethod
+    def _register_related(cls):
+        # Add reverse relations to the classes that foreign keys of this
+        # class refer to, without using the fields of this class, which
+        # would complete the registration.
+        for subcls in type.mro(cls):
+            for (name, member) in subcls.__dict__.items():
+                if isinstance(member, ForeignKey):
+                    member.register_related(cls, name)
+
+    @classmethod
+    def _register(cls, path):
         workspace_path, cls.name = os.path.split(path)
         cls.workspace = WorkspaceManager().get(workspace_path)
 
-        if not issubclass(cls, BaseAttachment):
-            attachment_info = cls.workspace.get_attachment_info(cls.name)
-            if attachment_info is not None:
-                Attachment = attachment_class_factory(
-                    cls, attachment_info.primary_key,
-                    attachment_info.foreign_key)
-                Attachment.register(
-                    os.path.join(workspace_path, attachment_info.destination))
-                cls.attachment_class = Attachment
-
-        # Register fields with the workspace
-        layer_fields = cls.workspace.get_layer_fields(cls.name)
-        for (field_name, field) in cls.fields.items():
-            field.register(
-                cls.workspace, cls, field_name, cls.name, layer_fields)
+        # Compiled where clauses may refer to the previous layer name.
+        SQLCompiler.clear_cache()
+
+        with cls.workspace.memoize_schema():
+            if not issubclass(cls, BaseAttachment):
+                attachment_info = cls.workspace.get_attachment_info(cls.name)
+                if attachment_info is not None:
+                    Attachment = attachment_class_factory(
+                        cls, attachment_info.primary_key,
+                        attachment_info.foreign_key)
+                    Attachment.register(os.path.join(
+                        workspace_path, attachment_info.destination))
+                    cls.attachment_class = Attachment
+
+            # Register fields with the workspace
+            layer_fields = cls.workspace.get_layer_fields(cls.name)
+            for (field_name, field) in cls.fields.items():
+                field.register(
+                    cls.workspace, cls, field_name, cls.name, layer_fields)
 
         # Register virtual fields in this class
         for subcls in type.mro(cls):
@@ -176,6 +318,7 @@ class BaseFeature(object):
             [(self.fields[k].db_name, v) for (k, v) in kwargs.items()
              if not isinstance(v, DeferredValue)])
         self._prefetch_cache = {}
+        self._calculated_cache = {}
 
     def __repr__(self):
         name = self.name or '(unregistered)'
@@ -208,11 +351,59 @@ class BaseFeature(object):
                            self.values.values()
                            if isinstance(v, DeferredValue)])
 
+        # If this feature came from a QuerySet, load the values for all of
+        # its siblings at once.
+        if self._queryset is not None:
+            self._queryset._load_deferred(fields)
+            if not [n for n in fields.keys()
+                    if isinstance(self.values.get(n), DeferredValue)]:
+                return
+
         values = self.workspace.get_row(
             self.name, fields.values(), self.oid_where)
 
         self.values.update(dict(zip(fields.keys(), values)))
 
+    @classmethod
+    def get_calculated_stats(cls):
+        """
+        Returns a Counter of cache hits, misses and invalidations for
+        calculated values of this class.
+        """
+
+        if '_calculated_stats' not in cls.__dict__:
+            cls._calculated_stats = Counter()
+        return cls._calculated_stats
+
+    @classmethod
+    def reset_calculated_stats(cls):
+        """
+        Reset the calculated value cache counters for this class.
+        """
+
+        cls.get_calculated_stats().clear()
+
+    def _get_calculated(self, field):
+        # Returns the value of a calculated field, using the cache.
+        stats = self.get_calculated_stats()
+        if field.name in self._calculated_cache:
+            stats['hits'] += 1
+            return self._calculated_cache[field.name]
+
+        stats['misses'] += 1
+        value = field.get_value(self)
+        if not self.fields.is_volatile(field.name):
+            self._calculated_cache[field.name] = value
+        return value
+
+    def _invalidate_calculated(self, field_name):
+        # Discard cached values of calculated fields that depend on the
+        # given field.
+        for dependent_name in self.fields.get_dependents(field_name):
+            if dependent_name in self._calculated_cache:
+                del self._calculated_cache[dependent_name]
+                self.get_calculated_stats()['invalidations'] += 1
+
     def clean(self):
         """
         Perform cleaning of the raw data.
@@ -322,13 +513,20 @@ class BaseFeature(object):
         Evaluate the expression in the context of the feature instance.
         """
 
-        identifiers = IDENTIFIER_RE.findall(expression)
+        start = default_timer() if instrumentation.enabled else None
+        compiled = compile_expression(expression)
         # Limit retrieval of field values to field names that are found in the
         # expression in order to prevent recursion for calculated fields.
         locals_dict = dict([(f, getattr(self, f)) for f
-                            in self.fields.keys() if f in identifiers])
+                            in compiled.get_field_names(self.fields)])
         locals_dict.update({'self': self})
-        return eval(expression, {}, locals_dict)
+        value = compiled.evaluate(locals_dict)
+
+        if start is not None:
+            instrumentation.count_evaluation(
+                self.__class__, 'eval(%s)' % (expression,),
+                default_timer() - start)
+        return value
 
     def check_condition(self, condition, default=True):
         """
@@ -342,6 +540,33 @@ class BaseFeature(object):
         return bool(self.eval(condition))
 
 
+def get_lazy_registration_stats():
+    """
+    Returns a dictionary describing lazy registrations: the number of
+    classes registered lazily, the names of those still pending, the time
+    spent completing the others, and an estimate of the time deferred by
+    not registering the pending classes. The estimate is based on the mean
+    time taken by all registrations, lazy or not, and is zero if none have
+    been timed.
+    """
+
+    seconds = [s for s in _lazy_registrations.values() if s is not None]
+    pending = sorted([c.__name__ for (c, s) in _lazy_registrations.items()
+                      if s is None])
+    timed = seconds + _eager_registration_seconds
+    estimated_saving = 0.0
+    if timed:
+        estimated_saving = sum(timed) / len(timed) * len(pending)
+
+    return {
+        'registered': len(seconds) + len(pending),
+        'completed': len(seconds),
+        'pending': pending,
+        'completion_seconds': sum(seconds),
+        'estimated_seconds_saved': estimated_saving,
+    }
+
+
 def relate(origin_class, destination_class, primary_key, foreign_key,
            fk_field_name=None, fk_label=None, related_name=None):
     """
@@ -362,6 +587,14 @@ def relate(origin_class, destination_class, primary_key, foreign_key,
 
     setattr(destination_class, fk_field_name, field)
 
+    # The field set may already have been cached without the new field.
+    destination_class._fields = None
+
+    # A lazily registered class registers its fields when it is first used,
+    # so the reverse relation is added now.
+    if '_lazy_path' in destination_class.__dict__:
+        field.register_related(destination_class, fk_field_name)
+
 
 class BaseAttachment(BaseFeature):
     """
@@ -1,6 +1,10 @@
 import warnings
 from numbers import Number
+from timeit import default_timer
+from cuuats.datamodel import instrumentation
 from cuuats.datamodel.domains import CodedValue, D
+from cuuats.datamodel.exceptions import ObjectDoesNotExist
+from cuuats.datamodel.expressions import compile_expression
 from cuuats.datamodel.field_values import DeferredValue
 from cuuats.datamodel.scales import BaseScale, ScaleLevel
 from cuuats.datamodel.query import RelatedManager
@@ -31,10 +35,15 @@ class BaseField(object):
         BaseField.creation_index += 1
 
     def __get__(self, instance, owner):
-        # Retrieve deferred values if necessary.
+        if instrumentation.enabled:
+            instrumentation.count(instance.__class__, self.name, 'reads')
 
+        # Retrieve deferred values if necessary.
         if isinstance(instance.values.get(self.name, None), DeferredValue):
-            instance.get_deferred_values()
+            if instrumentation.enabled:
+                instrumentation.count(
+                    instance.__class__, self.name, 'deferred_loads')
+            instance.get_deferred_values({self.name: self.db_name})
 
         # Get the current value from the instance.
         value = instance.values.get(self.name, None)
@@ -42,13 +51,34 @@ class BaseField(object):
         # If this field has a coded values domain, set the description
         # for this value.
         if value is not None and self.domain_name:
-            domain = instance.workspace.get_domain(self.domain_name)
-            if domain.domainType == 'CodedValue':
-                description = domain.codedValues.get(value, None)
-                return CodedValue(value, description)
+            if instrumentation.enabled:
+                instrumentation.count(instance.__class__, self.name, 'decodes')
+            return instance.workspace.decode_value(self.domain_name, value)
 
         return value
 
+    def get_many(self, columns):
+        """
+        Returns the values of this field for each row of a ColumnSet, as
+        they would be returned for each feature.
+        """
+
+        values = columns.get_raw(self.name)
+        if self.domain_name:
+            workspace = columns.feature_class.workspace
+            return [None if v is None else
+                    workspace.decode_value(self.domain_name, v)
+                    for v in values]
+        return values
+
+    def get_dependencies(self):
+        """
+        Returns the identifiers that the value of this field depends on,
+        other than its own stored value.
+        """
+
+        return []
+
     def __set__(self, instance, value):
         # If this is a coded value, convert it back to a primative before
         # storing it.
@@ -63,6 +93,10 @@ class BaseField(object):
 
         instance.values[self.name] = value
 
+        # Discard cached calculated values that depend on this field.
+        if getattr(instance, '_calculated_cache', None):
+            instance._invalidate_calculated(self.name)
+
     def __repr__(self):
         return '%s: %s' % (self.__class__.__name__, self.label)
 
@@ -85,7 +119,7 @@ class BaseField(object):
             self.domain_name = layer_field.domain
             domain = workspace.get_domain(layer_field.domain)
             if domain.domainType == 'CodedValue':
-                self.choices.extend(domain.codedValues)
+                self.choices = self.choices + list(domain.codedValues)
             elif hasattr(self, 'min') and hasattr(self, 'max'):
                 self.min, self.max = domain.range
         if layer_field.scale:
@@ -105,11 +139,35 @@ class BaseField(object):
 
         # Check that that value is in the choices, if specified.
         elif len(self.choices) > 0 and value is not None and \
-                value not in self.choices:
+                not self._is_choice(value):
             return ['%s is invalid' % (self.label,)]
 
         return []
 
+    @property
+    def choices(self):
+        return self._choices
+
+    @choices.setter
+    def choices(self, choices):
+        self._choices = list(choices)
+        self._choice_set = None
+
+    def _is_choice(self, value):
+        # Rebuild the set of choices if the list has been changed in place.
+        if self._choice_set is None or \
+                self._choice_set[1] != len(self._choices):
+            try:
+                self._choice_set = (frozenset(self._choices),
+                                    len(self._choices))
+            except TypeError:
+                return value in self._choices
+
+        try:
+            return value in self._choice_set[0]
+        except TypeError:
+            return value in self._choices
+
     def round(self, value):
         """
         Rounds the given value to the number of decimal places it will have
@@ -139,6 +197,23 @@ class BaseField(object):
         value = self.__get__(instance, None)
         return SummaryLevel(0, value, str(value))
 
+    def get_numpy_dtype(self, layer_field=None):
+        """
+        Returns the NumPy dtype used for values of this field. Numbers are
+        stored as floats so that nulls can be represented as NaN. Text is
+        sized by the length of the layer field, if it is given and known,
+        and otherwise by the declared field length.
+        """
+
+        field_type = self.storage.get('field_type', None)
+        if field_type in ('DOUBLE', 'FLOAT', 'LONG', 'SHORT'):
+            return 'f8'
+        elif field_type == 'TEXT':
+            length = getattr(layer_field, 'length', None) or \
+                self.storage.get('field_length', 255)
+            return 'U%i' % (length,)
+        return 'O'
+
 
 class OIDField(BaseField):
     """
@@ -153,6 +228,13 @@ class OIDField(BaseField):
         # OIDs are always valid.
         return []
 
+    def get_numpy_dtype(self, layer_field=None):
+        """
+        Returns the NumPy dtype used for values of this field.
+        """
+
+        return 'i4'
+
 
 class GlobalIDField(BaseField):
     """
@@ -272,13 +354,87 @@ class CalculatedField(BaseField):
         return ScaleLevel(level, str(level))
 
     def __get__(self, instance, owner):
-        if not instance.check_condition(self.condition):
-            return self.default
-        return self.calculate(instance)
+        if instrumentation.enabled:
+            instrumentation.count(instance.__class__, self.name, 'reads')
+        if getattr(instance, 'cache_calculated', False):
+            return instance._get_calculated(self)
+        return self.get_value(instance)
 
     def __set__(self, instance, value):
         raise ValueError('Calculated fields cannot be set')
 
+    def get_value(self, instance):
+        """
+        Returns the value of this field for the instance, or the default if
+        the condition is not met, without using the instance's cache.
+        """
+
+        start = default_timer() if instrumentation.enabled else None
+        if not instance.check_condition(self.condition):
+            value = self.default
+        else:
+            value = self.calculate(instance)
+
+        if start is not None:
+            instrumentation.count_evaluation(
+                instance.__class__, self.name, default_timer() - start)
+        return value
+
+    def _get_expression_dependencies(self, expression):
+        if expression is None:
+            return []
+        return list(compile_expression(expression).identifiers)
+
+    def get_dependencies(self):
+        """
+        Returns the identifiers that the value of this field depends on.
+        Subclasses that override calculate() should override this method,
+        or else the field may depend on any attribute of the feature.
+        """
+
+        return self._get_expression_dependencies(self.condition) + ['self']
+
+    def get_many(self, columns):
+        """
+        Returns the values of this field for each row of a ColumnSet, as
+        they would be returned for each feature.
+        """
+
+        if not self.can_calculate_many():
+            raise TypeError('%s cannot be calculated over columns' % (
+                self.name,))
+
+        conditions = columns.check_condition(self.condition)
+        if all(conditions):
+            return self.calculate_many(columns)
+
+        # Only calculate values for rows that meet the condition.
+        indexes = [i for (i, c) in enumerate(conditions) if c]
+        values = [self.default] * len(columns)
+        if indexes:
+            for (index, value) in zip(
+                    indexes, self.calculate_many(columns.subset(indexes))):
+                values[index] = value
+        return values
+
+    def can_calculate_many(self):
+        """
+        Returns true if this field can be calculated over columns. Subclasses
+        that calculate values over columns define calculate_many(), which
+        is only used if it is defined by the same class as calculate(), or
+        by a subclass of it.
+        """
+
+        def defined_by(method_name):
+            for cls in self.__class__.__mro__:
+                if method_name in cls.__dict__:
+                    return cls
+            return None
+
+        calculate_many_class = defined_by('calculate_many')
+        return calculate_many_class is not None and \
+            issubclass(calculate_many_class, defined_by('calculate'))
+
     def calculate(self, instance):
         """
         Calculate the value for this field based on the state of the instance.
@@ -321,6 +477,7 @@ class MethodField(CalculatedField):
     def __init__(self, name, **kwargs):
         super(MethodField, self).__init__(name, **kwargs)
         self.method_name = kwargs.get('method_name')
+        self.depends_on = kwargs.get('depends_on', None)
 
     def calculate(self, instance):
         """
@@ -329,6 +486,16 @@ class MethodField(CalculatedField):
 
         return getattr(instance, self.method_name)(self.name)
 
+    def get_dependencies(self):
+        """
+        Returns the identifiers that the value of this field depends on.
+        """
+
+        # Unless its dependencies are declared, the method may use any
+        # attribute of the feature.
+        return self._get_expression_dependencies(self.condition) + \
+            list(self.depends_on or ['self'])
+
 
 class WeightsField(CalculatedField):
 
@@ -354,6 +521,31 @@ class WeightsField(CalculatedField):
             return sum([self._get_value(instance, v)*w
                         for (v, w) in self.weights.items()])
 
+    def get_dependencies(self):
+        """
+        Returns the identifiers that the value of this field depends on.
+        """
+
+        return self._get_expression_dependencies(self.condition) + \
+            self.weights.keys()
+
+    def calculate_many(self, columns):
+        """
+        Calculate the values for this field for each row of a ColumnSet.
+        """
+
+        # Accumulate the weighted sum one column at a time, in the same
+        # order as calculate, so that the results are identical.
+        totals = [0] * len(columns)
+        missing = [False] * len(columns)
+        for (field_name, weight) in self.weights.items():
+            values = columns.get(field_name)
+            missing = [m or v is None for (m, v) in zip(missing, values)]
+            totals = [t if m else t + v*weight
+                      for (t, v, m) in zip(totals, values, missing)]
+
+        return [self.default if m else t for (t, m) in zip(totals, missing)]
+
 
 class ScaleField(CalculatedField):
 
@@ -411,6 +603,46 @@ class ScaleField(CalculatedField):
 
         return scale.score(value)
 
+    def get_dependencies(self):
+        """
+        Returns the identifiers that the value of this field depends on.
+        """
+
+        dependencies = self._get_expression_dependencies(self.condition) + \
+            self._get_expression_dependencies(self.value_field)
+        for (condition, scale, weight) in self._unpack_scales():
+            dependencies.extend(self._get_expression_dependencies(condition))
+        return dependencies
+
+    def calculate_many(self, columns):
+        """
+        Calculate the values for this field for each row of a ColumnSet.
+        """
+
+        values = columns.eval(self.value_field)
+        if self.use_description:
+            values = [v.description if isinstance(v, CodedValue) else v
+                      for v in values]
+
+        # Score the rows that match each scale's condition together.
+        results = [self.default] * len(columns)
+        remaining = range(len(columns))
+        for (condition, scale, weight) in self._unpack_scales():
+            if not remaining:
+                break
+            if len(remaining) < len(columns):
+                matches = columns.subset(remaining).check_condition(condition)
+            else:
+                matches = columns.check_condition(condition)
+
+            matched = [i for (i, m) in zip(remaining, matches) if m]
+            scores = scale.score_many([values[i] for i in matched])
+            for (index, score) in zip(matched, scores):
+                results[index] = score
+            remaining = [i for (i, m) in zip(remaining, matches) if not m]
+
+        return results
+
     def summarize(self, instance):
         """
         Returns the summary level for the given instance.
@@ -461,13 +693,23 @@ class ForeignKey(BaseField):
         if self.primary_key is None:
             self.primary_key = self.origin_class.fields.oid_field.name
 
+        self.register_related(feature_class, field_name)
+
+    def register_related(self, feature_class, field_name):
+        """
+        Add the reverse relation to the origin class. This happens when the
+        field is registered, and when the feature class is registered
+        lazily, so that the relation can be followed from the origin class
+        before the feature class is used.
+        """
+
         if self.related_name is None:
             self.related_name = feature_class.__name__.lower() + '_set'
 
         if self.related_manager:
             setattr(self.origin_class, self.related_name,
                     RelatedManager(self.related_name, feature_class,
-                                   self.name, self.primary_key))
+                                   field_name, self.primary_key))
 
         self._set_related(feature_class)
 
@@ -496,10 +738,31 @@ class ForeignKey(BaseField):
             return prefetched_feature
 
         # Otherwise, get the related feature from the database.
+        if instrumentation.enabled:
+            instrumentation.count(instance.__class__, self.name, 'fk_fetches')
         return self.origin_class.objects.get({
             self.primary_key: value
         })
 
+    def get_many(self, columns):
+        """
+        Returns the related feature for each row of a ColumnSet, retrieving
+        all of the related features with one query.
+        """
+
+        values = super(ForeignKey, self).get_many(columns)
+        pk_filter = '%s__in' % (self.primary_key,)
+        pks = sorted(set([v for v in values if v is not None]))
+        origin_map = dict([
+            (getattr(f, self.primary_key), f) for f in
+            self.origin_class.objects.filter({pk_filter: pks})])
+
+        missing = [pk for pk in pks if pk not in origin_map]
+        if missing:
+            raise ObjectDoesNotExist(
+                '%s = %r' % (self.primary_key, missing[0]))
+        return [None if v is None else origin_map[v] for v in values]
+
     def __set__(self, instance, value):
         # Clear prefetched feature for this relationship.
         if self.name in instance._prefetch_cache:
@@ -507,6 +770,7 @@ class ForeignKey(BaseField):
 
         # Allow setting using the primary key or the feature itself.
         if isinstance(value, self.origin_class):
-            super(ForeignKey, self).__set__(getattr(value, self.primary_key))
+            super(ForeignKey, self).__set__(
+                instance, getattr(value, self.primary_key))
         else:
-            super(ForeignKey, self).__set__(value)
+            super(ForeignKey, self).__set__(instance, value)
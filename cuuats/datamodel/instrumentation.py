@@ -0,0 +1,133 @@
+"""
+Opt-in instrumentation of field access. While enabled, the fields of each
+feature class count descriptor reads, deferred value loads, domain
+decodes, calculated value evaluations (with their cumulative time) and
+foreign key fetches. Expressions evaluated using BaseFeature.eval() are
+counted as evaluations under the name eval(expression).
+
+When instrumentation is disabled, the descriptors only check the enabled
+flag.
+"""
+
+import weakref
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+
+# Checked by the field descriptors before counting.
+enabled = False
+
+# Counters keyed by feature class and field name.
+_stats = weakref.WeakKeyDictionary()
+
+KINDS = ('reads', 'deferred_loads', 'decodes', 'evaluations',
+         'evaluation_seconds', 'fk_fetches')
+
+FieldStats = namedtuple('FieldStats', ('class_name', 'field_name') + KINDS)
+
+
+def enable():
+    """
+    Start counting field access.
+    """
+
+    global enabled
+    enabled = True
+
+
+def disable():
+    """
+    Stop counting field access. Counts are kept until reset() is called.
+    """
+
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Discard all counts.
+    """
+
+    _stats.clear()
+
+
+@contextmanager
+def instrument_fields(clear=True):
+    """
+    Count field access within the context, discarding earlier counts
+    unless clear is false.
+    """
+
+    if clear:
+        reset()
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+
+
+def count(feature_class, field_name, kind, amount=1):
+    """
+    Add to the count of the given kind for a field.
+    """
+
+    fields = _stats.get(feature_class, None)
+    if fields is None:
+        fields = _stats[feature_class] = {}
+
+    counter = fields.get(field_name, None)
+    if counter is None:
+        counter = fields[field_name] = Counter()
+    counter[kind] += amount
+
+
+def count_evaluation(feature_class, field_name, seconds):
+    """
+    Count an evaluation of a calculated field or expression that took the
+    given number of seconds.
+    """
+
+    count(feature_class, field_name, 'evaluations')
+    count(feature_class, field_name, 'evaluation_seconds', seconds)
+
+
+def get_field_stats(feature_class=None):
+    """
+    Returns a list of FieldStats for each field that has been accessed,
+    optionally limited to one feature class, sorted by class and field
+    name.
+    """
+
+    if feature_class is None:
+        items = _stats.items()
+    else:
+        items = [(feature_class, _stats.get(feature_class, {}))]
+
+    return sorted([
+        FieldStats(cls.__name__, field_name,
+                   *[counter.get(kind, 0) for kind in KINDS])
+        for (cls, fields) in items
+        for (field_name, counter) in fields.items()])
+
+
+def report(sort_by='reads', limit=None):
+    """
+    Returns a table of field access counts as a string, with the fields
+    sorted by the given kind of count in descending order.
+    """
+
+    if sort_by not in KINDS:
+        raise ValueError('Invalid sort kind: %s' % (sort_by,))
+
+    stats = sorted(get_field_stats(), key=lambda s: -getattr(s, sort_by))
+    lines = ['%-40s %9s %9s %9s %9s %10s %9s' % (
+        'field', 'reads', 'deferred', 'decodes', 'evals', 'eval time',
+        'fk fetch')]
+    for stat in stats[:limit]:
+        lines.append('%-40s %9i %9i %9i %9i %10.4f %9i' % (
+            '%s.%s' % (stat.class_name, stat.field_name),
+            stat.reads, stat.deferred_loads, stat.decodes, stat.evaluations,
+            stat.evaluation_seconds, stat.fk_fetches))
+    return '\n'.join(lines)
@@ -1,6 +1,5 @@
 from cuuats.datamodel.features import BaseFeature, VirtualField
 from cuuats.datamodel.fields import ForeignKey
-import inspect
 import os
 
 
@@ -47,9 +46,8 @@ class ManyToManyField(VirtualField):
         # Set the name of the feature class.
         RelationshipFeature.__name__ = relationship_class_name
 
-        # Set the module of the feature class to the module of the caller.
-        frame = inspect.stack()[1]
-        RelationshipFeature.__module__ = inspect.getmodule(frame[0])
+        # Place the relationship class in the module of the feature class.
+        RelationshipFeature.__module__ = feature_class.__module__
 
         foreign_key = ForeignKey("Foreign Key", origin_class=feature_class,
                                  primary_key=self.primary_key)
@@ -0,0 +1,320 @@
+"""
+Query profiling. Hooks registered with add_query_hook() are called with a
+QueryRecord for each cursor opened by a Workspace, once the cursor is
+closed. QueryProfiler is a hook that collects records, keeps a log of slow
+queries and detects likely N+1 query patterns.
+"""
+
+import logging
+import re
+import sys
+from collections import namedtuple, OrderedDict
+from timeit import default_timer
+from time import time
+
+
+# Registered hooks. The list is replaced rather than modified so that it
+# can be iterated without a lock.
+_query_hooks = []
+
+CallSite = namedtuple('CallSite', ['filename', 'line_number', 'function'])
+
+# The ORM operation that caused a query: the kind of operation, the name of
+# the feature class and the relationship or deferred field names.
+QuerySource = namedtuple('QuerySource', ['kind', 'class_name', 'name'])
+
+NPlusOne = namedtuple('NPlusOne', [
+    'source', 'layer_name', 'sql', 'count', 'total_time', 'call_site',
+    'suggestion'])
+
+# Modules that are part of the ORM, rather than code that uses it.
+INTERNAL_PREFIX = 'cuuats.datamodel.'
+EXTERNAL_PREFIXES = ('cuuats.datamodel.tests', 'cuuats.datamodel.benchmarks')
+
+# Matches literal values in where clauses.
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+LIST_RE = re.compile(r'\(\?(?:, \?)*\)')
+
+# Code objects of the methods that query once per feature, keyed by the
+# kind of source. Populated on first use to avoid circular imports.
+_source_codes = {}
+
+
+def add_query_hook(hook):
+    """
+    Call hook with a QueryRecord for each cursor opened by any workspace.
+    """
+
+    global _query_hooks
+    _query_hooks = _query_hooks + [hook]
+
+
+def remove_query_hook(hook):
+    """
+    Stop calling a hook added using add_query_hook().
+    """
+
+    global _query_hooks
+    _query_hooks = [h for h in _query_hooks if h != hook]
+
+
+def _get_source_codes():
+    if not _source_codes:
+        from cuuats.datamodel.features import BaseFeature
+        from cuuats.datamodel.fields import ForeignKey
+        from cuuats.datamodel.query import QuerySet
+
+        _source_codes.update({
+            ForeignKey.__get__.__func__.__code__: 'ForeignKey.__get__',
+            BaseFeature.get_deferred_values.__func__.__code__:
+                'get_deferred_values',
+            QuerySet._iter_rows.__func__.__code__: 'QuerySet',
+        })
+    return _source_codes
+
+
+def _get_source(frame):
+    # Returns the QuerySource for a frame, or None if the frame is not a
+    # method that queries once per feature.
+    kind = _get_source_codes().get(frame.f_code, None)
+    if kind is None:
+        return None
+
+    f_locals = frame.f_locals
+    if kind == 'ForeignKey.__get__':
+        return QuerySource(kind, f_locals['instance'].__class__.__name__,
+                           f_locals['self'].name)
+    elif kind == 'get_deferred_values':
+        return QuerySource(kind, f_locals['self'].__class__.__name__,
+                           tuple(sorted(f_locals['fields'].keys())))
+
+    # QuerySets created by a RelatedManager record their source.
+    return getattr(f_locals.get('self'), '_query_source', None)
+
+
+def _inspect_stack(frame):
+    # Returns the source of the query, if any, and the first call site
+    # outside of the ORM.
+    source = None
+    while frame is not None:
+        if source is None:
+            source = _get_source(frame)
+
+        module_name = frame.f_globals.get('__name__', '')
+        if not module_name.startswith(INTERNAL_PREFIX) or \
+                module_name.startswith(EXTERNAL_PREFIXES):
+            return (source, CallSite(frame.f_code.co_filename,
+                                     frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    return (source, None)
+
+
+def normalize_sql(sql):
+    """
+    Replace the literal values in a query with placeholders, so that
+    queries that differ only in their values are equal.
+    """
+
+    return LIST_RE.sub('(?)', LITERAL_RE.sub('?', sql))
+
+
+class QueryRecord(object):
+    """
+    Timing and context for a cursor. Times are in seconds. The total time
+    includes opening the cursor and reading rows, but not the time spent by
+    the caller between rows.
+    """
+
+    def __init__(self, workspace, layer_name, field_names, sql,
+                 where_clause=None, update=False):
+        self.workspace = workspace
+        self.layer_name = layer_name
+        self.field_names = list(field_names)
+        self.sql = sql
+        self.where_clause = where_clause
+        self.update = update
+        self.row_count = 0
+        self.first_row_time = None
+        self.total_time = 0
+        self.timestamp = time()
+        self.finished = False
+        (self.source, self.call_site) = _inspect_stack(sys._getframe(1))
+        self._start = default_timer()
+
+    def __repr__(self):
+        return '<QueryRecord: %s (%i rows, %.6f s)>' % (
+            self.sql, self.row_count, self.total_time)
+
+    @property
+    def pattern(self):
+        """
+        The query with literal values replaced by placeholders.
+        """
+
+        return normalize_sql(self.sql)
+
+    def track(self, rows):
+        """
+        Yield the rows of a cursor, timing each read.
+        """
+
+        # The cursor has just been opened.
+        self.total_time = default_timer() - self._start
+        rows = iter(rows)
+        while True:
+            start = default_timer()
+            try:
+                row = next(rows)
+            except StopIteration:
+                self.total_time += default_timer() - start
+                return
+            self.total_time += default_timer() - start
+
+            if self.first_row_time is None:
+                self.first_row_time = self.total_time
+            self.row_count += 1
+            yield row
+
+    def finish(self):
+        """
+        Call the registered hooks, once the cursor has been closed.
+        """
+
+        if self.finished:
+            return
+        self.finished = True
+        for hook in _query_hooks:
+            hook(self)
+
+
+class QueryProfiler(object):
+    """
+    Records queries while it is used as a context manager, or while it is
+    registered using add_query_hook(). If a workspace is given, only its
+    queries are recorded.
+
+    Queries that take at least slow_threshold seconds, or whose first row
+    takes at least first_row_threshold seconds, are added to slow_queries
+    and logged. Groups of at least n_plus_one_threshold similar queries
+    made one feature at a time are reported by find_n_plus_one().
+    """
+
+    def __init__(self, workspace=None, slow_threshold=0.5,
+                 first_row_threshold=None, n_plus_one_threshold=3):
+        self.workspace = workspace
+        self.slow_threshold = slow_threshold
+        self.first_row_threshold = first_row_threshold
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.records = []
+        self.slow_queries = []
+
+    def __enter__(self):
+        add_query_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        remove_query_hook(self)
+
+    def __call__(self, record):
+        if self.workspace is not None and \
+                record.workspace is not self.workspace:
+            return
+
+        self.records.append(record)
+        if self.is_slow(record):
+            self.slow_queries.append(record)
+            logging.warning('Slow query (%.3f s, first row %s s): %s' % (
+                record.total_time,
+                '%.3f' % (record.first_row_time,)
+                if record.first_row_time is not None else '-',
+                record.sql))
+
+    def is_slow(self, record):
+        """
+        Returns true if the record exceeds either threshold.
+        """
+
+        if self.slow_threshold is not None and \
+                record.total_time >= self.slow_threshold:
+            return True
+        return self.first_row_threshold is not None and \
+            record.first_row_time is not None and \
+            record.first_row_time >= self.first_row_threshold
+
+    @property
+    def total_time(self):
+        return sum([r.total_time for r in self.records])
+
+    def clear(self):
+        """
+        Discard the recorded queries.
+        """
+
+        self.records = []
+        self.slow_queries = []
+
+    def get_suggestion(self, source):
+        """
+        Returns advice for avoiding queries from the given source.
+        """
+
+        if source.kind == 'get_deferred_values':
+            return 'Load %s with the QuerySet of %s using ' \
+                'prefetch_deferred(%s), or stop deferring them.' % (
+                    ', '.join(source.name), source.class_name,
+                    ', '.join(["'%s'" % (n,) for n in source.name]))
+
+        return 'Use prefetch_related(\'%s\') on the QuerySet of %s to ' \
+            'fetch %s.%s for all features at once.' % (
+                source.name, source.class_name, source.class_name,
+                source.name)
+
+    def find_n_plus_one(self):
+        """
+        Returns a list of NPlusOne tuples describing groups of similar
+        queries made for one feature at a time, most frequent first.
+        """
+
+        groups = OrderedDict()
+        for record in self.records:
+            if record.source is not None:
+                groups.setdefault(
+                    (record.source, record.pattern), []).append(record)
+
+        results = [
+            NPlusOne(source, records[0].layer_name, pattern, len(records),
+                     sum([r.total_time for r in records]),
+                     records[0].call_site, self.get_suggestion(source))
+            for ((source, pattern), records) in groups.items()
+            if len(records) >= self.n_plus_one_threshold]
+        return sorted(results, key=lambda r: -r.count)
+
+    def report(self):
+        """
+        Returns a summary of the recorded queries as a string.
+        """
+
+        lines = ['%i queries, %i rows, %.3f seconds' % (
+            len(self.records), sum([r.row_count for r in self.records]),
+            self.total_time)]
+
+        if self.slow_queries:
+            lines.append('')
+            lines.append('Slow queries:')
+            for record in self.slow_queries:
+                lines.append('  %.3f s  %s' % (record.total_time, record.sql))
+                if record.call_site is not None:
+                    lines.append('    at %s:%i in %s' % record.call_site)
+
+        n_plus_one = self.find_n_plus_one()
+        if n_plus_one:
+            lines.append('')
+            lines.append('Likely N+1 queries:')
+            for result in n_plus_one:
+                lines.append('  %i x %s (%s)' % (
+                    result.count, result.sql, result.source.kind))
+                if result.call_site is not None:
+                    lines.append('    at %s:%i in %s' % result.call_site)
+                lines.append('    %s' % (result.suggestion,))
+
+        return '\n'.join(lines)
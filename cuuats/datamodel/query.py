@@ -1,10 +1,30 @@
+import copy
 import itertools
-from collections import defaultdict
+import operator
+import time
+import weakref
+from collections import defaultdict, namedtuple, OrderedDict
+from cuuats.datamodel.columns import ColumnSet
 from cuuats.datamodel.exceptions import ObjectDoesNotExist, \
     MultipleObjectsReturned
+from cuuats.datamodel.expressions import compile_expression
 from cuuats.datamodel.field_values import DeferredValue
-from cuuats.datamodel.domains import D
-from cuuats.datamodel.utils import batches
+from cuuats.datamodel.domains import D, CodedValue
+from cuuats.datamodel.profiling import QuerySource
+from cuuats.datamodel.utils import batches, iter_batches, merge_sorted, \
+    Descending
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _is_calculated(field):
+    # The fields module imports this one, so CalculatedField is imported
+    # when it is first needed.
+    from cuuats.datamodel.fields import CalculatedField
+    return isinstance(field, CalculatedField)
 
 
 class SQLCondition(object):
@@ -36,6 +56,43 @@ class SQLCondition(object):
         return '<SQLCondition: %s>' % (
             ' '.join([self.field_name, self.operator, str(self.value)]),)
 
+    def _value_key(self, value):
+        if isinstance(value, (list, tuple)):
+            return ('seq', tuple([self._value_key(v) for v in value]))
+        elif isinstance(value, D):
+            return ('D', value.description)
+        # Include the type, since values that are equal (e.g. 1, 1.0 and
+        # True) may compile to different SQL.
+        return (type(value).__name__, value)
+
+    def get_key(self):
+        """
+        Returns a hashable key describing the structure of this condition.
+        """
+
+        return (self.field_name, self.operator, self._value_key(self.value))
+
+    def split_values(self, batch_size):
+        """
+        Returns a list of copies of this condition that each test a batch of
+        the distinct values in this condition's IN list.
+        """
+
+        values = []
+        seen = set()
+        for value in self.value:
+            value_key = self._value_key(value)
+            if value_key not in seen:
+                seen.add(value_key)
+                values.append(value)
+
+        conditions = []
+        for batch in batches(values, batch_size):
+            condition = copy.copy(self)
+            condition.value = batch
+            conditions.append(condition)
+        return conditions
+
 
 class Q(object):
 
@@ -44,6 +101,8 @@ class Q(object):
         self.negated = False
         self.rel_name = None
         self.children = []
+        self._simplified = None
+        self._key = None
         self._parse_children(filters.items() + kwargs.items())
 
     def __and__(self, other):
@@ -107,105 +166,389 @@ class Q(object):
     def _op_match(self, op):
         return op == self.operator or len(self) == 1
 
-    def _can_merge(self, other, op):
-        return self._op_match(op) and other._op_match(op) and \
-            self.negated == other.negated and self.rel_name == other.rel_name
+    def _can_flatten(self, parent):
+        # Children can be moved into the parent without changing the meaning
+        # of the parent.
+        return self._op_match(parent.operator) and not self.negated and \
+            self.rel_name is None
+
+    def _can_group(self, parent):
+        # Children of Qs for the same relationship can be combined into a
+        # single subquery.
+        return self._op_match(parent.operator) and not self.negated and \
+            self.rel_name is not None
+
+    def _add_simplified_child(self, child, rel_groups):
+        if isinstance(child, Q):
+            if child._can_flatten(self):
+                for grandchild in child.children:
+                    self._add_simplified_child(grandchild, rel_groups)
+                return
+
+            if child._can_group(self):
+                group = rel_groups.get(child.rel_name, None)
+                if group is None:
+                    group = child._clone()
+                    group.operator = self.operator
+                    rel_groups[child.rel_name] = group
+                    self.children.append(group)
+                else:
+                    group.children.extend(child.children)
+                return
+
+        self.children.append(child)
+
+    def _flatten_children(self):
+        # Returns the children of this Q, with the children of any child Qs
+        # that can be flattened into this Q moved up in their place.
+        children = []
+        stack = self.children[::-1]
+        while stack:
+            child = stack.pop()
+            if isinstance(child, Q):
+                candidate = child._simplified or child
+                if candidate._can_flatten(self):
+                    stack.extend(candidate.children[::-1])
+                    continue
+            children.append(child)
+        return children
 
-    def _can_append(self, other, op):
-        return self._op_match(op) and not self.negated and \
-            (self.rel_name is None or self.rel_name == other.rel_name)
+    def simplify(self):
+        """
+        Returns an equivalent Q with unnecessary nesting removed and
+        conditions on the same relationship combined. Each node in the tree
+        is visited once, and the result is memoized.
+        """
+
+        # Simplify descendants first, using an explicit stack so that deeply
+        # nested trees (e.g. those built using reduce) do not exceed the
+        # recursion limit.
+        flat_children = {}
+        stack = [self]
+        while stack:
+            q = stack[-1]
+            if id(q) not in flat_children:
+                flat_children[id(q)] = q._flatten_children()
+
+            pending = [c for c in flat_children[id(q)]
+                       if isinstance(c, Q) and c._simplified is None]
+            if pending:
+                stack.extend(pending)
+                continue
+
+            stack.pop()
+            if q._simplified is None:
+                q._simplify_node(flat_children[id(q)])
+
+        return self._simplified
+
+    def _simplify_node(self, children):
+        # All child Qs have already been simplified.
+        q = self._clone(children=False)
+        rel_groups = OrderedDict()
+        for child in children:
+            if isinstance(child, Q):
+                child = child._simplified
+            q._add_simplified_child(child, rel_groups)
+
+        # Groups that combined several children may now contain children
+        # that can be combined with each other.
+        for group in rel_groups.values():
+            if len(group.children) > 1:
+                index = q.children.index(group)
+                q.children[index] = group.simplify()
+
+        # Remove unnecessary parents.
+        if len(q.children) == 1 and not q.negated and q.rel_name is None \
+                and isinstance(q.children[0], Q):
+            q = q.children[0]
+
+        q._simplified = q
+        self._simplified = q
+
+    def get_key(self):
+        """
+        Returns a hashable key describing the structure of this Q, so that
+        structurally identical Qs can share compiled SQL.
+        """
+
+        # The key is a flat tuple listing the nodes of the tree in prefix
+        # order, so that hashing and comparing keys for deeply nested trees
+        # does not exceed the recursion limit.
+        if self._key is None:
+            tokens = []
+            stack = [self]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, Q):
+                    tokens.append((
+                        node.operator if len(node.children) > 1 else None,
+                        node.negated,
+                        node.rel_name,
+                        len(node.children)))
+                    stack.extend(reversed(node.children))
+                else:
+                    tokens.append(node.get_key())
+            self._key = tuple(tokens)
+        return self._key
+
+    def split_in(self, max_values):
+        """
+        Returns a list of Qs that together match the same rows as this Q,
+        with no two matching the same row, in which no IN list that is
+        ANDed with the rest of the Q has more than max_values values.
+        """
+
+        q = self.simplify()
+        if q.negated or q.rel_name is not None or \
+                (q.operator != 'AND' and len(q.children) > 1):
+            return [self]
+
+        # Split the longest IN list, then split the results in turn until
+        # all of the IN lists are short enough.
+        long_lists = [
+            (len(c.value), i) for (i, c) in enumerate(q.children)
+            if isinstance(c, SQLCondition) and c.operator == 'IN' and
+            isinstance(c.value, (list, tuple)) and len(c.value) > max_values]
+        if not long_lists:
+            return [self]
+
+        index = max(long_lists)[1]
+        results = []
+        for condition in q.children[index].split_values(max_values):
+            split_q = q._clone()
+            split_q.operator = 'AND'
+            split_q.children[index] = condition
+            results.extend(split_q.split_in(max_values))
+        return results
+
+
+class Expression(object):
+    """
+    Base class for expressions that are evaluated against the field values
+    of a row. Expressions can be combined using arithmetic operators.
+    """
+
+    def _combine(self, other, op, reverse=False):
+        if reverse:
+            return CombinedExpression(other, op, self)
+        return CombinedExpression(self, op, other)
+
+    def __add__(self, other):
+        return self._combine(other, operator.add)
+
+    def __radd__(self, other):
+        return self._combine(other, operator.add, True)
+
+    def __sub__(self, other):
+        return self._combine(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self._combine(other, operator.sub, True)
+
+    def __mul__(self, other):
+        return self._combine(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self._combine(other, operator.mul, True)
+
+    def __div__(self, other):
+        return self._combine(other, operator.div)
+
+    def __rdiv__(self, other):
+        return self._combine(other, operator.div, True)
+
+    def __truediv__(self, other):
+        return self._combine(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self._combine(other, operator.truediv, True)
+
+    def __mod__(self, other):
+        return self._combine(other, operator.mod)
+
+    def __rmod__(self, other):
+        return self._combine(other, operator.mod, True)
+
+    def __pow__(self, other):
+        return self._combine(other, operator.pow)
+
+    def __rpow__(self, other):
+        return self._combine(other, operator.pow, True)
+
+    def __neg__(self):
+        return self._combine(-1, operator.mul, True)
+
+    def get_field_names(self):
+        """
+        Returns a list of the field names referenced by this expression.
+        """
 
-    def _merge(self, other, op):
-        q = self._clone()
-        q.children.extend(other.children)
-        q.operator = op
-        return q
+        # Overridden by subclasses
+        return []
 
-    def _append(self, other, op):
-        q = self._clone()
-        child = other._clone()
-        if q.rel_name is not None:
-            child.rel_name = None
-        q.children.append(child)
-        q.operator = op
-        return q
+    def evaluate(self, values):
+        """
+        Evaluate the expression using a dictionary of field values.
+        """
 
-    def _merge_or_append(self, other, op):
-        if self._can_merge(other, op):
-            return self._merge(other, op)
-        elif self._can_append(other, op):
-            return self._append(other, op)
-        elif other._can_append(self, op):
-            return other._append(self, op)
-        return None
+        # Overridden by subclasses
+        raise NotImplementedError
 
-    def simplify(self):
-        q = self._clone()
-        q.children = [c.simplify() if isinstance(c, Q) else c
-                      for c in q.children]
-
-        # Merge/append children with/to each other.
-        num_children = 0
-        while num_children < len(q.children):
-            num_children = len(q.children)
-            for (a, b) in itertools.combinations(q.children, 2):
-                if not isinstance(a, Q) or not isinstance(b, Q):
-                    continue
 
-                new_child = a._merge_or_append(b, q.operator)
-                if new_child:
-                    q.children = [new_child] + \
-                        [c for c in q.children if c not in (a, b)]
-                    break
-
-        # Simplify the partent.
-        parent_dirty = True
-        while parent_dirty:
-            parent_dirty = False
-            # Merge children with the parent.
-            for child in q.children[:]:
-                if isinstance(child, Q) and q._can_merge(child, q.operator):
-                    q.children = [c for c in q.children if c is not child]
-                    q = q._merge(child, q.operator)
-                    parent_dirty = True
-
-            # Remove unnecessary parents.
-            if len(q.children) == 1 and not q.negated and q.rel_name is None \
-                    and isinstance(q.children[0], Q):
-                q = q.children[0]
-                parent_dirty = True
+class F(Expression):
+    """
+    A reference to the value of a field in the current row.
+    """
 
-        return q
+    def __init__(self, field_name):
+        self.field_name = field_name
+
+    def __repr__(self):
+        return '<F: %s>' % (self.field_name,)
+
+    def get_field_names(self):
+        """
+        Returns a list of the field names referenced by this expression.
+        """
+
+        return [self.field_name]
+
+    def evaluate(self, values):
+        """
+        Evaluate the expression using a dictionary of field values.
+        """
+
+        return values[self.field_name]
+
+
+class CombinedExpression(Expression):
+    """
+    Two values or expressions combined using an arithmetic operator. As in
+    SQL, the result is null if either value is null.
+    """
+
+    def __init__(self, lhs, op, rhs):
+        self.lhs = lhs
+        self.op = op
+        self.rhs = rhs
+
+    def __repr__(self):
+        return '<CombinedExpression: %s(%r, %r)>' % (
+            self.op.__name__, self.lhs, self.rhs)
+
+    def _evaluate_side(self, side, values):
+        if isinstance(side, Expression):
+            return side.evaluate(values)
+        return side
+
+    def get_field_names(self):
+        """
+        Returns a list of the field names referenced by this expression.
+        """
+
+        return [n for side in (self.lhs, self.rhs)
+                if isinstance(side, Expression)
+                for n in side.get_field_names()]
+
+    def evaluate(self, values):
+        """
+        Evaluate the expression using a dictionary of field values.
+        """
+
+        lhs = self._evaluate_side(self.lhs, values)
+        rhs = self._evaluate_side(self.rhs, values)
+        if lhs is None or rhs is None:
+            return None
+        return self.op(lhs, rhs)
 
 
 class SQLCompiler(object):
+    # Compiled where clauses, keyed by feature class and then by the
+    # structure of the Q. When a class's cache is full, the least recently
+    # used where clause is discarded.
+    CACHE_SIZE = 1000
+    _cache = weakref.WeakKeyDictionary()
+
+    # Incremented when the cache is cleared, so that where clauses memoized
+    # elsewhere can tell that they may be stale.
+    generation = 0
 
     def __init__(self, feature_class=None):
         self.feature_class = feature_class
 
-    def compile(self, q, inner=False):
-        q = q.simplify()
-        where_parts = []
-        feature_class, other_key, self_key = self._resolve_rel(q.rel_name)
+    @classmethod
+    def clear_cache(cls):
+        """
+        Discard all compiled where clauses.
+        """
 
-        for child in q.children:
-            if isinstance(child, Q):
-                compiler = self.__class__(feature_class)
-                where_parts.append(compiler.compile(child))
-            else:
-                where_parts.append(
-                    self._compile_sql_condition(child, feature_class))
+        cls._cache.clear()
+        cls.generation += 1
+
+    def compile(self, q, inner=False):
+        if self.feature_class is None:
+            return self._compile(q, inner)
 
-        sep = ' %s ' % (q.operator)
-        where = sep.join(where_parts)
+        try:
+            key = (q.simplify().get_key(), inner)
+            hash(key)
+        except TypeError:
+            # Values that cannot be hashed cannot be cached.
+            return self._compile(q, inner)
+
+        class_cache = self._cache.get(self.feature_class, None)
+        if class_cache is None:
+            class_cache = self._cache[self.feature_class] = OrderedDict()
+
+        where = class_cache.pop(key, None)
+        if where is None:
+            where = self._compile(q, inner)
+        class_cache[key] = where
+        while len(class_cache) > self.CACHE_SIZE:
+            class_cache.popitem(last=False)
+        return where
 
-        if len(where_parts) > 1 and (q.negated or inner):
-            where = '(%s)' % (where,)
-        if q.negated:
-            where = 'NOT %s' % (where,)
-        if self_key is not None:
-            where = '%s IN (SELECT %s FROM %s WHERE %s)' % (
-                other_key, self_key, feature_class.name, where)
+    def _compile(self, q, inner):
+        # Compile the simplified tree from the bottom up, using an explicit
+        # stack so that deeply nested trees do not exceed the recursion limit.
+        # Each stack entry holds a Q, the compiler for the feature class that
+        # the Q applies to, and whether the Q is nested inside another Q.
+        results = {}
+        stack = [(q.simplify(), self, inner)]
+        while stack:
+            (node, compiler, node_inner) = stack[-1]
+            feature_class, other_key, self_key = \
+                compiler._resolve_rel(node.rel_name)
+            child_compiler = compiler
+            if feature_class is not compiler.feature_class:
+                child_compiler = self.__class__(feature_class)
+
+            pending = [(c, child_compiler, True) for c in node.children
+                       if isinstance(c, Q) and
+                       (id(c), feature_class) not in results]
+            if pending:
+                stack.extend(pending)
+                continue
+
+            stack.pop()
+            where_parts = [
+                results[(id(c), feature_class)] if isinstance(c, Q) else
+                child_compiler._compile_sql_condition(c, feature_class)
+                for c in node.children]
+
+            sep = ' %s ' % (node.operator)
+            where = sep.join(where_parts)
+
+            if len(where_parts) > 1 and (node.negated or node_inner):
+                where = '(%s)' % (where,)
+            if node.negated:
+                where = 'NOT %s' % (where,)
+            if self_key is not None:
+                where = '%s IN (SELECT %s FROM %s WHERE %s)' % (
+                    other_key, self_key, feature_class.name, where)
+
+            results[(id(node), compiler.feature_class)] = where
 
         return where
 
@@ -262,18 +605,58 @@ class SQLCompiler(object):
                 relation.origin_class.fields.get_db_name(relation.primary_key)]
 
 
+class ChunkSizer(object):
+    """
+    Chooses the number of values in each IN list when a query with a long
+    IN list is split into several scans. Scans have a fixed cost, so the
+    size grows while scans are fast and shrinks when they are slow. It also
+    shrinks to keep where clauses shorter than max_length characters.
+    """
+
+    def __init__(self, size=1000, min_size=100, max_size=10000,
+                 max_length=30000, target_seconds=1.0):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_length = max_length
+        self.target_seconds = target_seconds
+
+    def record(self, size, length, seconds=None):
+        """
+        Record that a where clause with size values in its IN list was
+        length characters long, and that scanning it took the given number
+        of seconds, and adjust the chunk size.
+        """
+
+        new_size = size
+        if seconds is not None:
+            if seconds < self.target_seconds / 2.0:
+                new_size = size * 2
+            elif seconds > self.target_seconds:
+                new_size = int(size * self.target_seconds / seconds)
+
+        if length > 0:
+            new_size = min(new_size, size * self.max_length // length)
+
+        self.size = max(self.min_size, min(self.max_size, new_size))
+
+
 class Query(object):
 
     def __init__(self, fields, compiler):
         self.fields = fields
         self.compiler = compiler
         self._where = None
+        self._where_sql = None
+        self._split_where = None
         self._order_by = None
         self._group_by = None
 
     def clone(self):
-        clone = self.__class__(self.fields, self.compiler)
+        clone = self.__class__(list(self.fields), self.compiler)
         clone._where = self._where
+        clone._where_sql = self._where_sql
+        clone._split_where = self._split_where
         clone._order_by = self._order_by
         clone._group_by = self._group_by
         return clone
@@ -283,6 +666,8 @@ class Query(object):
             self._where = q
         else:
             self._where = self._where & q
+        self._where_sql = None
+        self._split_where = None
 
     def set_order(self, fields):
         self._order_by = []
@@ -305,7 +690,32 @@ class Query(object):
     def where(self):
         if self._where is None:
             return None
-        return self.compiler.compile(self._where)
+        # Where clauses compiled before the compiler's cache was cleared may
+        # refer to a previous layer name.
+        if self._where_sql is None or \
+                self._where_sql[0] != SQLCompiler.generation:
+            self._where_sql = (
+                SQLCompiler.generation, self.compiler.compile(self._where))
+        return self._where_sql[1]
+
+    def split_where(self, max_values):
+        """
+        Returns a list of where clauses that together match the same rows as
+        this query, with no IN list longer than max_values where possible.
+        """
+
+        if self._where is None:
+            return [None]
+        key = (SQLCompiler.generation, max_values)
+        if self._split_where is None or self._split_where[0] != key:
+            qs = self._where.split_in(max_values)
+            if len(qs) == 1:
+                where_clauses = [self.where]
+            else:
+                # Don't fill the compiler's cache with one-off chunks.
+                where_clauses = [self.compiler._compile(q, False) for q in qs]
+            self._split_where = (key, where_clauses)
+        return self._split_where[1]
 
     @property
     def prefix(self):
@@ -322,6 +732,19 @@ class Query(object):
 
 class QuerySet(object):
     PREFETCH_BATCH_SIZE = 1000
+    BULK_BATCH_SIZE = 1000
+    BATCH_DEFERRED = True
+    IN_CHUNK_SIZE = 1000
+    COMBINED_STATISTICS = {
+        'COUNT': sum,
+        'MAX': max,
+        'MIN': min,
+        'SUM': sum,
+    }
+    NUMPY_BUFFER_SIZE = 10000
+
+    # Chunk sizers for splitting long IN lists, keyed by feature class.
+    _chunk_sizers = weakref.WeakKeyDictionary()
 
     def __init__(self, feature_class, query=None):
         self.feature_class = feature_class
@@ -331,6 +754,9 @@ class QuerySet(object):
         self._cache = None
         self._prefetch_rel = []
         self._prefetch_deferred = []
+        self._batch_deferred = self.BATCH_DEFERRED
+        self._values = None
+        self._query_source = None
 
     def __len__(self):
         return self.count()
@@ -357,30 +783,64 @@ class QuerySet(object):
 
     def _fetch_all(self):
         if self._cache is None:
-            self._cache = list(self.iterator())
-            if self._cache:
-                self._prefetch()
-
-    def _prefetch(self):
+            self._cache = list(self._iter_features())
+            if self._cache and self._values is None:
+                self._prefetch(self._cache)
+                self._set_siblings(self._cache)
+
+    def _set_siblings(self, features):
+        # Features remember the QuerySet they came from so that deferred
+        # values can be loaded for all of them at once.
+        if self._batch_deferred:
+            for feature in features:
+                feature._queryset = self
+
+    def _load_deferred(self, fields):
+        # fields maps field names to database names.
+        oid_field = self.feature_class.fields.oid_field
+        if oid_field is None or not self._cache:
+            return
+
+        field_names = fields.keys()
+        db_names = [fields[n] for n in field_names]
+        pending = dict([
+            (f.values.get(oid_field.name), f) for f in self._cache
+            if [n for n in field_names
+                if isinstance(f.values.get(n), DeferredValue)]])
+
+        oid_filter = '%s__in' % (oid_field.name,)
+        for oids in batches(sorted(pending.keys()), self.PREFETCH_BATCH_SIZE):
+            where_clause = self.query.compiler.compile(Q({oid_filter: oids}))
+            for (row, cursor) in self.feature_class.workspace.iter_rows(
+                    self.feature_class.name, [oid_field.db_name] + db_names,
+                    where_clause=where_clause):
+                feature = pending[row[0]]
+                for (field_name, value) in zip(field_names, row[1:]):
+                    # Don't overwrite values that have been loaded or set.
+                    if isinstance(feature.values.get(field_name),
+                                  DeferredValue):
+                        feature.values[field_name] = value
+
+    def _prefetch(self, features):
         # Prefetch related features.
         for rel_name in self._prefetch_rel:
             rel = self.feature_class.__dict__.get(rel_name, None)
             if isinstance(rel, RelatedManager):
-                self._prefetch_related_manager(rel_name, rel)
+                self._prefetch_related_manager(rel_name, rel, features)
             elif rel.__class__.__name__ == 'ForeignKey':
-                self._prefetch_foreign_key(rel_name, rel)
+                self._prefetch_foreign_key(rel_name, rel, features)
             elif rel.__class__.__name__ == 'ManyToManyField':
-                self._prefetch_many_to_many(rel_name, rel)
+                self._prefetch_many_to_many(rel_name, rel, features)
             else:
                 raise AttributeError(
                     'Relationship %s does not exist.' % (rel_name,))
 
-    def _prefetch_related_manager(self, rel_name, rel):
+    def _prefetch_related_manager(self, rel_name, rel, features):
         # rel is a RelatedManager.
         destination = rel.destination_class
 
         pk_filter = '%s__in' % (rel.foreign_key,)
-        all_pks = [getattr(f, rel.primary_key) for f in self._cache]
+        all_pks = [getattr(f, rel.primary_key) for f in features]
         dest_map = defaultdict(list)
 
         for pks in batches(all_pks, self.PREFETCH_BATCH_SIZE):
@@ -388,16 +848,16 @@ class QuerySet(object):
             for feature in dest_features:
                 dest_map[feature.values.get(rel.foreign_key)].append(feature)
 
-        for feature in self._cache:
+        for feature in features:
             feature._prefetch_cache[rel_name] = dest_map[
                 getattr(feature, rel.primary_key)]
 
-    def _prefetch_foreign_key(self, rel_name, rel):
+    def _prefetch_foreign_key(self, rel_name, rel, features):
         # rel is a ForeignKey.
         origin = rel.origin_class
 
         fk_filter = '%s__in' % (rel.primary_key,)
-        all_fks = [f.values.get(rel_name, None) for f in self._cache]
+        all_fks = [f.values.get(rel_name, None) for f in features]
         all_fks = [fk for fk in all_fks if fk is not None]
         origin_map = {}
 
@@ -406,16 +866,16 @@ class QuerySet(object):
             origin_map.update(
                 [(getattr(f, rel.primary_key), f) for f in origin_features])
 
-        for feature in self._cache:
+        for feature in features:
             feature._prefetch_cache[rel_name] = origin_map.get(
                 feature.values.get(rel_name), None)
 
-    def _prefetch_many_to_many(self, rel_name, rel):
+    def _prefetch_many_to_many(self, rel_name, rel, features):
         # rel is a ManyToManyField.
         # - Query rel's relationship class to get instances where the
-        #   the foreign key is in the primary keys from this QuerySet's cache.
+        #   the foreign key is in the primary keys of the given features.
         pk_filter = "%s__in" % (rel.foreign_key,)
-        pks = [getattr(f, rel.primary_key) for f in self._cache]
+        pks = [getattr(f, rel.primary_key) for f in features]
         relationship_class_features = rel.relationship_class.objects.filter(
             {pk_filter: pks})
 
@@ -439,10 +899,10 @@ class QuerySet(object):
         related_class_dict = dict([(getattr(rc, rel.related_primary_key), rc)
                                    for rc in related_class_features])
 
-        # - Iterate over the objects in this QuerySet's cache, and populate
+        # - Iterate over the given features, and populate
         #   their prefectch caches by using the dictionary to find the related
         #   class instances that are related to the object.
-        for feature in self._cache:
+        for feature in features:
             related_class_pks = relationship_class_dict.get(
                 getattr(feature, rel.primary_key)
             )
@@ -453,7 +913,10 @@ class QuerySet(object):
         clone = self.__class__(self.feature_class, self.query.clone())
         clone._field_name_cache = self._field_name_cache
         clone._db_name_cache = self._db_name_cache
-        clone._prefetch_rel = self._prefetch_rel
+        clone._prefetch_rel = list(self._prefetch_rel)
+        clone._batch_deferred = self._batch_deferred
+        clone._values = self._values
+        clone._query_source = self._query_source
 
         if preserve_cache:
             clone._cache = self._cache
@@ -479,6 +942,23 @@ class QuerySet(object):
         values = [row_map.get(d, DeferredValue(f, d)) for (f, d) in fields]
         return self.feature_class(**dict(zip(self._field_names, values)))
 
+    def _get_row_factory(self):
+        # Returns a function that converts a row into a feature, or into a
+        # dictionary or tuple for values() and values_list().
+        if self._values is None:
+            return self._feature
+
+        (field_names, kind) = self._values
+        field_count = len(field_names)
+        if kind == 'dict':
+            return lambda row: dict(zip(field_names, row))
+        elif kind == 'flat':
+            return operator.itemgetter(0)
+        elif kind == 'named':
+            Row = namedtuple('Row', field_names, rename=True)
+            return lambda row: Row._make(row[:field_count])
+        return lambda row: tuple(row[:field_count])
+
     # Methods that return QuerySets
     def all(self):
         return self._clone(preserve_cache=True)
@@ -493,6 +973,105 @@ class QuerySet(object):
         clone.query.add_q(~self._make_q(*args, **kwargs))
         return clone
 
+    def _get_db_names(self, field_names):
+        fields = self.feature_class.fields
+        db_names = []
+        for field_name in field_names:
+            field = fields.get(field_name, None)
+            if field is None:
+                raise AttributeError('%s does not have field "%s"' % (
+                    self.feature_class.__name__, field_name))
+            db_names.append(field.db_name)
+        return db_names
+
+    def _values_clone(self, field_names, kind):
+        if not field_names:
+            field_names = [n for (n, f) in self.feature_class.fields.items()
+                           if f.db_name in self.query.fields]
+
+        clone = self._clone()
+        clone.query.fields = self._get_db_names(field_names)
+        clone._values = (list(field_names), kind)
+        return clone
+
+    def values(self, *fields):
+        """
+        Returns a QuerySet that yields a dictionary of database values for
+        each row, keyed by field name, instead of a feature. Only the given
+        fields are read; by default, all fields that are not deferred are
+        read.
+        """
+
+        return self._values_clone(fields, 'dict')
+
+    def values_list(self, *fields, **kwargs):
+        """
+        Returns a QuerySet that yields a tuple of database values for each
+        row instead of a feature. If flat is true, a single field must be
+        given, and its values are returned instead of tuples. If named is
+        true, named tuples are returned.
+        """
+
+        flat = kwargs.pop('flat', False)
+        named = kwargs.pop('named', False)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments: %s' % (
+                ', '.join(kwargs.keys()),))
+        if flat and named:
+            raise TypeError('flat and named cannot both be true')
+        if flat and len(fields) != 1:
+            raise TypeError('flat requires exactly one field')
+
+        kind = 'tuple'
+        if flat:
+            kind = 'flat'
+        elif named:
+            kind = 'named'
+        return self._values_clone(fields, kind)
+
+    def namedtuples(self, *fields):
+        """
+        Returns a QuerySet that yields a named tuple of database values for
+        each row instead of a feature.
+        """
+
+        return self.values_list(*fields, named=True)
+
+    def only(self, *fields):
+        """
+        Returns a QuerySet that reads only the given fields and the object
+        ID. Other fields are deferred, and are loaded in batches for all of
+        the features in the QuerySet when first accessed.
+        """
+
+        db_names = self._get_db_names(fields)
+        oid_field = self.feature_class.fields.oid_field
+        if oid_field is not None:
+            db_names.append(oid_field.db_name)
+
+        clone = self._clone()
+        clone.query.fields = [d for d in self._db_names if d in db_names]
+        clone._select_prefetched_keys()
+        return clone
+
+    def defer(self, *fields):
+        """
+        Returns a QuerySet that does not read the given fields. They are
+        loaded in batches for all of the features in the QuerySet when first
+        accessed. The object ID cannot be deferred.
+        """
+
+        db_names = self._get_db_names(fields)
+        oid_field = self.feature_class.fields.oid_field
+        if oid_field is not None and oid_field.db_name in db_names:
+            db_names.remove(oid_field.db_name)
+
+        clone = self._clone()
+        clone.query.fields = [d for d in clone.query.fields
+                              if d not in db_names]
+        clone._select_prefetched_keys()
+        return clone
+
     def order_by(self, fields):
         clone = self._clone()
         clone.query.set_order(fields)
@@ -502,9 +1081,11 @@ class QuerySet(object):
     def get(self, *args, **kwargs):
         clone = self._clone()
         clone.query.add_q(self._make_q(*args, **kwargs))
-        clone._fetch_all()
+        # Two rows are enough to tell whether the result is unique.
+        clone._cache = list(clone._iter_features(limit=2))
         clone_length = len(clone)
         if clone_length == 1:
+            clone._prefetch(clone._cache)
             return clone._cache[0]
         elif clone_length == 0:
             raise ObjectDoesNotExist(clone.query.where)
@@ -517,21 +1098,116 @@ class QuerySet(object):
             return self.feature_class(*args, **kwargs)
 
     def count(self):
-        # TODO: Investigate whether using selection would be faster in cases
-        # where the results are not already cached.
         if self._cache is not None:
             return len(self._cache)
 
-        return self.feature_class.workspace.count_rows(
-            self.feature_class.name,
-            self.query.where)
+        return sum([
+            self.feature_class.workspace.count_rows(
+                self.feature_class.name, where_clause)
+            for where_clause in self._get_where_clauses()[1]])
 
-    def iterator(self, limit=None):
+    @property
+    def _chunk_sizer(self):
+        sizer = self._chunk_sizers.get(self.feature_class, None)
+        if sizer is None:
+            sizer = ChunkSizer(self.IN_CHUNK_SIZE)
+            self._chunk_sizers[self.feature_class] = sizer
+        return sizer
+
+    def _get_where_clauses(self):
+        # Split long IN lists into several where clauses, shrinking the
+        # chunk size until the where clauses are short enough.
+        sizer = self._chunk_sizer
+        while True:
+            size = sizer.size
+            where_clauses = self.query.split_where(size)
+            if len(where_clauses) == 1:
+                return (size, where_clauses)
+            sizer.record(size, max([len(w) for w in where_clauses]))
+            if sizer.size >= size:
+                return (size, where_clauses)
+
+    def _iter_rows(self, field_names, where_clause, limit=None):
         for (row, cursor) in self.feature_class.workspace.iter_rows(
-                self.feature_class.name, self.query.fields, False,
-                self.query.where, limit, self.query.prefix,
+                self.feature_class.name, field_names, False,
+                where_clause, limit, self.query.prefix,
                 self.query.postfix):
-            yield self._feature(row)
+            yield row
+
+    def _iter_timed_rows(self, field_names, where_clause, limit, size):
+        # Time the scan, excluding time spent by the caller, and use it to
+        # adjust the chunk size.
+        elapsed = 0
+        start = time.time()
+        for row in self._iter_rows(field_names, where_clause, limit):
+            elapsed += time.time() - start
+            yield row
+            start = time.time()
+        elapsed += time.time() - start
+        self._chunk_sizer.record(size, len(where_clause), elapsed)
+
+    def _iter_merged_rows(self, where_clauses, limit, size):
+        # Scan each where clause separately and merge the rows in the order
+        # given by the query. The where clauses match disjoint sets of rows.
+        field_names = list(self.query.fields)
+        order_by = self.query._order_by or []
+        for (db_name, direction) in order_by:
+            if db_name not in field_names:
+                field_names.append(db_name)
+
+        key_columns = [(field_names.index(n), d.upper() == 'DESC')
+                       for (n, d) in order_by]
+
+        def sort_key(row):
+            return tuple([Descending(row[i]) if desc else row[i]
+                          for (i, desc) in key_columns])
+
+        # Only time the first scan, since the last may have fewer values.
+        streams = [self._iter_timed_rows(field_names, where_clauses[0],
+                                         limit, size)]
+        streams.extend([self._iter_rows(field_names, w, limit)
+                        for w in where_clauses[1:]])
+
+        if key_columns:
+            rows = merge_sorted(streams, sort_key)
+        else:
+            rows = itertools.chain(*streams)
+        return itertools.islice(rows, limit)
+
+    def _iter_features(self, limit=None):
+        (size, where_clauses) = self._get_where_clauses()
+        if len(where_clauses) == 1:
+            rows = self._iter_rows(self.query.fields, where_clauses[0], limit)
+        else:
+            rows = self._iter_merged_rows(where_clauses, limit, size)
+
+        make_row = self._get_row_factory()
+        for row in rows:
+            yield make_row(row)
+
+    def iterator(self, limit=None, chunk_size=None):
+        """
+        Iterate over features without caching them. If a chunk size is given
+        or related features are being prefetched, rows are read in chunks,
+        and prefetching and deferred value loading are done one chunk at a
+        time so that memory use is bounded by the chunk size.
+        """
+
+        features = self._iter_features(limit)
+        if self._values is not None or \
+                (chunk_size is None and not self._prefetch_rel):
+            for feature in features:
+                yield feature
+            return
+
+        for chunk in iter_batches(
+                features, chunk_size or self.PREFETCH_BATCH_SIZE):
+            self._prefetch(chunk)
+            chunk_queryset = self._clone()
+            chunk_queryset._cache = chunk
+            chunk_queryset._set_siblings(chunk)
+            for feature in chunk:
+                yield feature
 
     def first(self):
         if self._cache is not None:
@@ -583,36 +1259,487 @@ class QuerySet(object):
         return [results[hash(l)] for l in levels]
 
     def aggregate(self, fields):
-        return self.feature_class.workspace.summarize(
-            self.feature_class.name,
-            fields,
-            self.query.where)
+        """
+        Returns a dictionary of summary statistics for the rows matching this
+        QuerySet, given a list of (field name, statistic) tuples. If a long
+        IN list is split into several where clauses, the statistics for each
+        are combined, which is only supported for SUM, COUNT, MIN and MAX.
+        """
+
+        where_clauses = self._get_where_clauses()[1]
+        if len(where_clauses) == 1:
+            return self.feature_class.workspace.summarize(
+                self.feature_class.name, fields, where_clauses[0])
+
+        for (field_name, statistic) in fields:
+            if statistic.upper() not in self.COMBINED_STATISTICS:
+                raise ValueError(
+                    'The %s statistic cannot be combined across split IN '
+                    'lists' % (statistic,))
+
+        # The where clauses match disjoint sets of rows.
+        summaries = [
+            self.feature_class.workspace.summarize(
+                self.feature_class.name, fields, where_clause)
+            for where_clause in where_clauses]
+        summary = {}
+        for key in summaries[0].keys():
+            values = [s[key] for s in summaries if s[key] is not None]
+            combine = self.COMBINED_STATISTICS[key.split('_', 1)[0].upper()]
+            summary[key] = combine(values) if values else None
+        return summary
 
     def exists(self):
-        if self._cache:
-            return True
-        return self.first() is not None
+        if self._cache is not None:
+            return len(self._cache) > 0
+
+        for where_clause in self._get_where_clauses()[1]:
+            if self.feature_class.workspace.has_rows(
+                    self.feature_class.name, where_clause):
+                return True
+        return False
+
+    def _get_numpy_fields(self, field_names):
+        if numpy is None:
+            raise ImportError('NumPy is required to export arrays')
+
+        fields = self.feature_class.fields
+        if field_names is None:
+            field_names = [n for (n, f) in fields.items()
+                           if f.db_name in self.query.fields]
+
+        # Size text columns by the layer's fields rather than the model's,
+        # so that longer values are not truncated.
+        db_names = self._get_db_names(field_names)
+        layer_fields = self.feature_class.workspace.get_layer_fields(
+            self.feature_class.name)
+        return [(n, d, numpy.dtype(fields[n].get_numpy_dtype(
+                    layer_fields.get(d, None))))
+                for (n, d) in zip(field_names, db_names)]
+
+    def _get_numpy_null(self, dtype):
+        if dtype.kind == 'f':
+            return numpy.nan
+        elif dtype.kind in ('U', 'S'):
+            return dtype.type()
+        return None
 
-    def update(self):
-        raise NotImplementedError('QuerySet updates are not yet supported')
+    def _can_bulk_export(self, numpy_fields):
+        # The bulk export reads rows in object ID order and only supports
+        # numeric and text columns.
+        if not getattr(self.feature_class.workspace,
+                       'supports_table_to_numpy', False):
+            return False
+
+        oid_field = self.feature_class.fields.oid_field
+        order_by = [tuple(o) for o in (self.query._order_by or [])]
+        if order_by and (oid_field is None or
+                         order_by != [(oid_field.db_name, 'ASC')]):
+            return False
+
+        # Nulls in integer columns cannot be replaced with NaN.
+        layer_fields = self.feature_class.workspace.get_layer_fields(
+            self.feature_class.name)
+        for (field_name, db_name, dtype) in numpy_fields:
+            layer_field = layer_fields.get(db_name, None)
+            if dtype.kind == 'O' or layer_field is None or (
+                    dtype.kind == 'f' and
+                    layer_field.type not in ('Double', 'Single')):
+                return False
+        return True
+
+    def _bulk_export(self, numpy_fields):
+        db_names = [d for (n, d, t) in numpy_fields]
+        null_values = dict([(d, self._get_numpy_null(t))
+                            for (n, d, t) in numpy_fields if t.kind != 'i'])
+        arrays = [
+            self.feature_class.workspace.table_to_numpy(
+                self.feature_class.name, db_names, where_clause,
+                null_values)
+            for where_clause in self._get_where_clauses()[1]]
+
+        bulk_array = numpy.concatenate(arrays)
+        array = numpy.empty(
+            len(bulk_array), dtype=[(n, t) for (n, d, t) in numpy_fields])
+        for (field_name, db_name, dtype) in numpy_fields:
+            array[field_name] = bulk_array[db_name]
+
+        oid_field = self.feature_class.fields.oid_field
+        if oid_field is not None and oid_field.db_name in db_names:
+            index = db_names.index(oid_field.db_name)
+            array = array[numpy.argsort(
+                array[numpy_fields[index][0]], kind='mergesort')]
+        return array
+
+    def _fill_columns(self, numpy_fields):
+        # Fill preallocated columns from the cursor, doubling their size as
+        # needed.
+        capacity = self.NUMPY_BUFFER_SIZE
+        columns = [numpy.empty(capacity, dtype=t)
+                   for (n, d, t) in numpy_fields]
+        nulls = [self._get_numpy_null(t) for (n, d, t) in numpy_fields]
+        count = 0
+
+        rows = self._values_clone(
+            [n for (n, d, t) in numpy_fields], 'tuple')._iter_features()
+        for row in rows:
+            if count == capacity:
+                capacity *= 2
+                for column in columns:
+                    column.resize(capacity, refcheck=False)
+            for (column, value, null) in zip(columns, row, nulls):
+                column[count] = null if value is None else value
+            count += 1
+
+        for column in columns:
+            column.resize(count, refcheck=False)
+        return OrderedDict(
+            [(n, c) for ((n, d, t), c) in zip(numpy_fields, columns)])
+
+    def to_columns(self, fields=None):
+        """
+        Returns an ordered dictionary mapping field names to one-dimensional
+        NumPy arrays of values for the features in this QuerySet. By default,
+        all fields that are not deferred are included. Nulls are represented
+        as NaN in numeric columns and as empty strings in text columns.
+        """
+
+        numpy_fields = self._get_numpy_fields(fields)
+        if self._can_bulk_export(numpy_fields):
+            array = self._bulk_export(numpy_fields)
+            return OrderedDict([(n, array[n]) for (n, d, t) in numpy_fields])
+        return self._fill_columns(numpy_fields)
+
+    def to_numpy(self, fields=None):
+        """
+        Returns a NumPy structured array of values for the features in this
+        QuerySet, with dtypes based on the field types. By default, all
+        fields that are not deferred are included. Nulls are represented as
+        NaN in numeric columns and as empty strings in text columns.
+        """
+
+        numpy_fields = self._get_numpy_fields(fields)
+        if self._can_bulk_export(numpy_fields):
+            return self._bulk_export(numpy_fields)
+
+        columns = self._fill_columns(numpy_fields)
+        count = len(columns.values()[0]) if columns else 0
+        array = numpy.empty(
+            count, dtype=[(n, t) for (n, d, t) in numpy_fields])
+        for (field_name, column) in columns.items():
+            array[field_name] = column
+        return array
+
+    def _get_column_fields(self, identifiers):
+        # Returns the stored fields needed to evaluate the given identifiers
+        # over columns, or None if they depend on the features themselves.
+        fields = self.feature_class.fields
+        stored = set()
+        seen = set()
+        pending = list(identifiers)
+        while pending:
+            name = pending.pop()
+            if name == 'self':
+                return None
+            if name in seen or name not in fields:
+                continue
+            seen.add(name)
+
+            field = fields[name]
+            if _is_calculated(field):
+                # Fields without a column-wise calculation (such as method
+                # fields) are calculated one feature at a time.
+                if not field.can_calculate_many():
+                    return None
+                pending.extend(field.get_dependencies())
+            else:
+                stored.add(name)
+
+        return [n for n in fields.keys() if n in stored]
+
+    def _get_column_set(self, field_names):
+        # Read the given stored fields into a ColumnSet.
+        if not field_names:
+            return ColumnSet(self.feature_class, {}, self.count())
+
+        rows = list(self._values_clone(field_names, 'tuple')._iter_features())
+        columns = zip(*rows) or [()] * len(field_names)
+        return ColumnSet(
+            self.feature_class,
+            dict([(n, list(c)) for (n, c) in zip(field_names, columns)]),
+            len(rows))
+
+    def annotate_calculated(self, *field_names):
+        """
+        Calculate the given calculated fields (by default, all of them) for
+        every feature in this QuerySet, one column at a time. The stored
+        fields that they depend on are each read once. Returns an ordered
+        dictionary mapping the object ID field and the calculated fields to
+        lists of values, in the order of this QuerySet.
+        """
+
+        fields = self.feature_class.fields
+        if not field_names:
+            field_names = [n for (n, f) in fields.items()
+                           if _is_calculated(f)]
 
-    def delete(self):
-        raise NotImplementedError('QuerySet deletions are not yet supported')
+        for field_name in field_names:
+            if not _is_calculated(fields.get(field_name, None)):
+                raise ValueError('%s is not a calculated field of %s' % (
+                    field_name, self.feature_class.__name__))
+
+        column_names = list(field_names)
+        if fields.oid_field is not None:
+            column_names.insert(0, fields.oid_field.name)
+
+        stored_names = self._get_column_fields(column_names)
+        if stored_names is None:
+            # Fields that depend on the features themselves (such as method
+            # fields) are calculated one feature at a time.
+            features = list(self._clone())
+            return OrderedDict([(n, [getattr(f, n) for f in features])
+                                for n in column_names])
+
+        columns = self._get_column_set(stored_names)
+        return OrderedDict([(n, columns.get(n)) for n in column_names])
+
+    def eval_many(self, expression):
+        """
+        Evaluate the expression for every feature in this QuerySet, one
+        column at a time, and return a list of the results. Expressions that
+        refer to self are evaluated one feature at a time.
+        """
+
+        stored_names = self._get_column_fields(
+            compile_expression(expression).identifiers)
+        if stored_names is None:
+            return [f.eval(expression) for f in self._clone()]
+
+        return self._get_column_set(stored_names).eval(expression)
+
+    def _resolve_update_value(self, field, value):
+        # Mirror the conversions performed by BaseField.__set__.
+        if isinstance(value, CodedValue):
+            return value.value
+        elif isinstance(value, D):
+            return self.feature_class.workspace.get_coded_value(
+                field.domain_name, value.description)
+        return value
+
+    def update(self, **kwargs):
+        """
+        Set field values for every row matching this QuerySet using a single
+        update cursor inside one edit session, without creating features.
+        Values may be constants or F expressions, which are evaluated against
+        the original values of each row. Returns the number of rows updated.
+        """
+
+        fields = self.feature_class.fields
+        field_names = []
+        values = []
+        for (field_name, value) in kwargs.items():
+            field = fields.get(field_name, None)
+            if field is None:
+                raise AttributeError('%s does not have field "%s"' % (
+                    self.feature_class.__name__, field_name))
+            if _is_calculated(field):
+                raise ValueError('Calculated fields cannot be set')
+            field_names.append(field_name)
+            values.append(self._resolve_update_value(field, value))
+
+        # Read any additional fields referenced by expressions.
+        for value in values:
+            if isinstance(value, Expression):
+                for field_name in value.get_field_names():
+                    if field_name not in fields:
+                        raise AttributeError(
+                            '%s does not have field "%s"' % (
+                                self.feature_class.__name__, field_name))
+                    if field_name not in field_names:
+                        field_names.append(field_name)
+
+        db_names = [fields.get_db_name(n) for n in field_names]
+        workspace = self.feature_class.workspace
+        updated_count = 0
+
+        with workspace.edit():
+            for where_clause in self._get_where_clauses()[1]:
+                for (row, cursor) in workspace.iter_rows(
+                        self.feature_class.name, db_names, True, where_clause):
+                    row_values = dict(zip(field_names, row))
+                    new_values = [v.evaluate(row_values)
+                                  if isinstance(v, Expression) else v
+                                  for v in values]
+                    workspace.update_row(
+                        cursor, new_values + row[len(new_values):])
+                    updated_count += 1
+
+        self._cache = None
+        return updated_count
+
+    def _get_dependent_keys(self):
+        # Find foreign keys in related classes (including attachment and
+        # many-to-many relationship classes) that reference this class.
+        dependents = []
+        related_classes = self.feature_class.related_classes or {}
+        for related_class in related_classes.values():
+            for field in related_class.fields.values():
+                if field.__class__.__name__ == 'ForeignKey' and \
+                        field.origin_class is self.feature_class:
+                    dependents.append((related_class, field))
+        return dependents
+
+    def _delete_rows(self, cascade):
+        dependents = self._get_dependent_keys() if cascade else []
+        pk_names = list(set([fk.primary_key for (rc, fk) in dependents]))
+        pk_values = dict([(n, set()) for n in pk_names])
+        db_names = ['OID@'] + [
+            self.feature_class.fields.get_db_name(n) for n in pk_names]
+        deleted_count = 0
+
+        for where_clause in self._get_where_clauses()[1]:
+            for (row, cursor) in self.feature_class.workspace.iter_rows(
+                    self.feature_class.name, db_names, True, where_clause):
+                for (pk_name, value) in zip(pk_names, row[1:]):
+                    if value is not None:
+                        pk_values[pk_name].add(value)
+                self.feature_class.workspace.delete_row(cursor)
+                deleted_count += 1
+
+        # Delete dependent rows in batches of primary keys.
+        for (related_class, fk) in dependents:
+            fk_filter = '%s__in' % (fk.name,)
+            for pks in batches(sorted(pk_values[fk.primary_key]),
+                               self.PREFETCH_BATCH_SIZE):
+                deleted_count += related_class.objects.filter(
+                    {fk_filter: pks})._delete_rows(cascade)
+
+        return deleted_count
+
+    def delete(self, cascade=False):
+        """
+        Delete every row matching this QuerySet using a single update cursor
+        inside one edit session. If cascade is true, rows in related classes
+        and attachment tables that reference the deleted rows are also
+        deleted. Returns the total number of rows deleted.
+        """
+
+        with self.feature_class.workspace.edit():
+            deleted_count = self._delete_rows(cascade)
+
+        self._cache = None
+        return deleted_count
+
+    def bulk_create(self, features, batch_size=None):
+        """
+        Insert many new features in one edit session, opening an insert
+        cursor for each batch. Features may be any iterable, including a
+        generator. If any feature fails to insert, none are saved. Object
+        IDs are set on the features once they have all been inserted.
+        Returns the number of features created.
+        """
+
+        oid_field = self.feature_class.fields.oid_field
+        workspace = self.feature_class.workspace
+        field_names = None
+        created = []
+
+        batch_size = batch_size or self.BULK_BATCH_SIZE
+
+        with workspace.edit(versioned=False):
+            for batch in iter_batches(features, batch_size):
+                field_values = [f.serialize() for f in batch]
+                for values in field_values:
+                    if values.pop(oid_field.db_name, None) is not None:
+                        raise ValueError('Features with an object ID cannot '
+                                         'be bulk created')
+                if field_names is None:
+                    field_names = field_values[0].keys()
+
+                oids = workspace.insert_rows(
+                    self.feature_class.name, field_names,
+                    ([values.get(n, None) for n in field_names]
+                     for values in field_values))
+                created.extend(zip(batch, field_values, oids))
+
+        for (feature, values, oid) in created:
+            setattr(feature, oid_field.name, oid)
+            values[oid_field.db_name] = oid
+            feature.db_values.update(values)
+
+        return len(created)
+
+    def bulk_update(self, features, fields=None, batch_size=None):
+        """
+        Save unsaved changes to many existing features, opening one update
+        cursor per batch of object IDs. If field names are given, only
+        changes to those fields are saved. Returns the number of rows updated.
+        """
+
+        feature_fields = self.feature_class.fields
+        db_names = None
+        if fields is not None:
+            db_names = set([feature_fields.get_db_name(f) for f in fields])
+
+        field_values = {}
+        changed_features = {}
+        for feature in features:
+            oid = feature.oid
+            if oid is None:
+                raise ValueError(
+                    'Features must be saved before they can be bulk updated')
+
+            changes = dict([(n, v.new) for (n, v) in feature.diff().items()
+                            if db_names is None or n in db_names])
+            if changes:
+                field_values[oid] = changes
+                changed_features[oid] = feature
+
+        if not field_values:
+            return 0
+
+        updated_count = self.feature_class.workspace.update_rows(
+            self.feature_class.name, feature_fields.oid_field.db_name,
+            field_values, batch_size or self.BULK_BATCH_SIZE)
+
+        if updated_count != len(field_values):
+            raise LookupError('%i of %i rows were not found' % (
+                len(field_values) - updated_count, len(field_values)))
+
+        for (oid, changes) in field_values.items():
+            changed_features[oid].db_values.update(changes)
+
+        return updated_count
 
     def prefetch_related(self, *rels):
         for rel in rels:
             if rel not in self._prefetch_rel:
                 self._prefetch_rel.append(rel)
+        self._select_prefetched_keys()
+        return self
+
+    def _select_prefetched_keys(self):
+        # The foreign keys of prefetched features are always read, even if
+        # they are deferred, since they are needed to prefetch the features.
+        for rel_name in self._prefetch_rel:
+            rel = self.feature_class.__dict__.get(rel_name, None)
+            if rel.__class__.__name__ == 'ForeignKey' and \
+                    rel.db_name not in self.query.fields:
+                self.query.fields.append(rel.db_name)
+
+    def batch_deferred(self, enabled=True):
+        """
+        Enable or disable loading deferred values for all features in this
+        QuerySet when a deferred value is first accessed on one of them.
+        """
+
+        self._batch_deferred = enabled
         return self
 
     def prefetch_deferred(self, *field_names):
-        for field_name in field_names:
-            field = self.feature_class.fields.get(field_name, None)
-            if field is None:
-                raise AttributeError('%s does not have field "%s"' % (
-                    self.feature_class.__name__, field_name))
-            if field.db_name not in self.query.fields:
-                self.query.fields.append(field.db_name)
+        for db_name in self._get_db_names(field_names):
+            if db_name not in self.query.fields:
+                self.query.fields.append(db_name)
         return self
 
 
@@ -626,6 +1753,7 @@ class Manager(object):
             raise AttributeError('Manager is not accessible '
                                  'from feature instances')
 
+        owner.complete_registration()
         if owner.workspace is None:
             raise AttributeError(
                 'Feature class %s must be registered '
@@ -642,13 +1770,23 @@ class RelatedManager(Manager):
         self.name = name
         self.destination_class = destination_class
         self.foreign_key = foreign_key
-        self.primary_key = primary_key
+        self._primary_key = primary_key
+
+    @property
+    def primary_key(self):
+        # The primary key of a relation to a lazily registered class is
+        # known once the class has been registered.
+        if self._primary_key is None:
+            self._primary_key = \
+                self.destination_class.fields[self.foreign_key].primary_key
+        return self._primary_key
 
     def __get__(self, instance, owner):
         if instance is None:
             raise AttributeError('Related Manager is only accessible '
                                  'from feature instances')
 
+        self.destination_class.complete_registration()
         if self.destination_class.workspace is None:
             raise AttributeError(
                 'Related class must be registered before '
@@ -657,6 +1795,8 @@ class RelatedManager(Manager):
         qs = self.queryset_class(self.destination_class).filter({
             self.foreign_key: getattr(instance, self.primary_key)
         })
+        qs._query_source = QuerySource(
+            'RelatedManager.__get__', instance.__class__.__name__, self.name)
 
         # If we have prefetched related features, populate the QuerySet cache.
         qs._cache = instance._prefetch_cache.get(self.name, None)
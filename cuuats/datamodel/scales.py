@@ -1,3 +1,22 @@
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _as_numeric_array(values):
+    # Returns the values as a NumPy array if they are all numbers, so that
+    # they can be scored without a Python loop.
+    if numpy is None:
+        return None
+    array = numpy.asarray(values)
+    if array.dtype.kind not in 'biuf':
+        return None
+    return array
+
+
 class ScaleLevel(object):
     """
     A value level used in scales.
@@ -43,6 +62,14 @@ class BaseScale(object):
 
         raise NotImplemented
 
+    def get_level_many(self, values):
+        """
+        Returns a list of the ScaleLevel objects or numbers corresponding to
+        each of the input values.
+        """
+
+        return [self.get_level(value) for value in values]
+
     def score(self, value):
         """
         Returns the score for the given value.
@@ -53,6 +80,14 @@ class BaseScale(object):
             return level.value
         return level
 
+    def score_many(self, values):
+        """
+        Returns a list of the scores for each of the given values.
+        """
+
+        return [level.value if isinstance(level, ScaleLevel) else level
+                for level in self.get_level_many(values)]
+
 
 class StaticScale(BaseScale):
     """
@@ -77,6 +112,14 @@ class StaticScale(BaseScale):
 
         return self.level
 
+    def get_level_many(self, values):
+        """
+        Returns a list of the ScaleLevel objects or numbers corresponding to
+        each of the input values.
+        """
+
+        return [self.level for value in values]
+
 
 class BreaksScale(BaseScale):
     """
@@ -102,16 +145,60 @@ class BreaksScale(BaseScale):
 
         return self.levels
 
+    def _get_upper_breaks(self):
+        # Built from the current breaks, since they may have been changed
+        # after the scale was created.
+        return list(self.breaks) + [float('Inf')]
+
     def get_level(self, value):
         """
         Retuns a ScaleLevel object or a number corresponding to the
         input value.
         """
 
-        breaks = self.breaks + [float('Inf')]
-        for (break_value, level) in zip(breaks, self.levels):
-            if (value < break_value) or (self.right and value == break_value):
-                return level
+        return self._get_level(value, self._get_upper_breaks())
+
+    def _get_level(self, value, upper_breaks):
+        # Find the first break that the value is less than (or equal to, if
+        # right is true). Values such as NaN that are not less than the
+        # upper break do not have a level.
+        if self.right:
+            index = bisect.bisect_left(upper_breaks, value)
+        else:
+            index = bisect.bisect_right(upper_breaks, value)
+
+        if index < len(self.levels):
+            break_value = upper_breaks[index]
+            if value < break_value or (self.right and value == break_value):
+                return self.levels[index]
+        return None
+
+    def get_level_many(self, values):
+        """
+        Returns a list of the ScaleLevel objects or numbers corresponding to
+        each of the input values. If NumPy is installed and the values are
+        all numbers, they are scored using NumPy.
+        """
+
+        upper_breaks = self._get_upper_breaks()
+        array = _as_numeric_array(values)
+        if array is None:
+            return [self._get_level(value, upper_breaks) for value in values]
+
+        upper_breaks = numpy.array(upper_breaks)
+        indexes = numpy.searchsorted(
+            upper_breaks, array, side='left' if self.right else 'right')
+        indexes = numpy.minimum(indexes, len(self.levels) - 1)
+        break_values = upper_breaks[indexes]
+        in_level = array < break_values
+        if self.right:
+            in_level |= array == break_values
+
+        levels = numpy.empty(len(self.levels) + 1, dtype=object)
+        for (index, level) in enumerate(self.levels):
+            levels[index] = level
+        levels[-1] = None
+        return levels[numpy.where(in_level, indexes, -1)].tolist()
 
 
 class DictScale(BaseScale):
@@ -0,0 +1,301 @@
+"""
+Persistent cache of workspace schemas (fields, domains and relationship
+classes), so that feature classes can be registered without describing the
+workspace each time a process starts.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+# Field and domain descriptions use the same attribute names as the objects
+# returned by arcpy.ListFields and arcpy.da.ListDomains.
+FieldInfo = namedtuple(
+    'FieldInfo', ['name', 'type', 'aliasName', 'required', 'domain',
+                  'length', 'scale', 'precision'])
+
+DomainInfo = namedtuple(
+    'DomainInfo', ['name', 'domainType', 'codedValues', 'range'])
+
+
+def field_info(field):
+    """
+    Returns a FieldInfo describing an arcpy Field.
+    """
+
+    return FieldInfo(*[getattr(field, a, None) for a in FieldInfo._fields])
+
+
+def domain_info(domain):
+    """
+    Returns a DomainInfo describing an arcpy Domain.
+    """
+
+    coded_values = getattr(domain, 'codedValues', None) or {}
+    value_range = getattr(domain, 'range', None)
+    return DomainInfo(
+        domain.name, domain.domainType, dict(coded_values),
+        tuple(value_range) if value_range else None)
+
+
+def get_modified_time(path):
+    """
+    Returns the latest modification time of a workspace. For a file
+    geodatabase, this is the latest modification time of the files it
+    contains. Lock files, which come and go as the geodatabase is read, are
+    ignored, as is the modification time of the directory itself.
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+
+    mtimes = [None]
+    for file_name in os.listdir(path):
+        if file_name.endswith('.lock'):
+            continue
+        mtimes.append(os.path.getmtime(os.path.join(path, file_name)))
+    return max(mtimes)
+
+
+class SchemaCache(object):
+    """
+    A schema snapshot for one workspace, stored in a JSON file keyed by the
+    workspace path. The snapshot is discarded when the workspace has been
+    modified since it was taken, or when the version stamp differs. The
+    modification time of an SDE connection file does not change with the
+    schema, so enterprise geodatabases should use a version stamp.
+    """
+
+    # Incremented when the file format changes.
+    FORMAT_VERSION = 1
+
+    def __init__(self, workspace_path, cache_dir=None, version=None):
+        self.workspace_path = workspace_path
+        self.cache_dir = cache_dir or os.path.join(
+            tempfile.gettempdir(), 'cuuats_schema')
+        self.version = version
+        self._lock = threading.Lock()
+        self._batch_depth = 0
+        self._dirty = False
+        self.load()
+
+    @property
+    def cache_path(self):
+        """
+        The path of the file containing the snapshot.
+        """
+
+        key = os.path.normcase(os.path.abspath(self.workspace_path))
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return os.path.join(
+            self.cache_dir, '%s.json' % (hashlib.sha1(key).hexdigest(),))
+
+    def _get_stamp(self):
+        return {
+            'format': self.FORMAT_VERSION,
+            'workspace': self.workspace_path,
+            'version': self.version,
+            'modified': get_modified_time(self.workspace_path),
+        }
+
+    def _empty(self):
+        self.stamp = self._get_stamp()
+        self.domains = None
+        self.layer_names = None
+        self.fields = {}
+        self.relationship_names = {}
+        self.relationships = {}
+
+    def load(self):
+        """
+        Load the snapshot from disk, discarding it if it is out of date.
+        """
+
+        self._empty()
+        try:
+            with open(self.cache_path, 'rb') as cache_file:
+                data = json.load(cache_file)
+        except (IOError, ValueError):
+            return
+
+        if data.get('stamp') != self.stamp:
+            return
+
+        if data['domains'] is not None:
+            self.domains = [
+                DomainInfo(n, t, dict([tuple(c) for c in v]),
+                           tuple(r) if r else None)
+                for (n, t, v, r) in data['domains']]
+        self.layer_names = data.get('layer_names', None)
+        self.fields = dict(
+            [(l, [FieldInfo(*f) for f in fields])
+             for (l, fields) in data['fields'].items()])
+        self.relationship_names = data['relationship_names']
+        self.relationships = data['relationships']
+
+    def save(self):
+        """
+        Write the snapshot to disk. The file is replaced atomically where
+        possible, so that other processes never read a partial snapshot.
+        """
+
+        data = {
+            'stamp': self.stamp,
+            'domains': None if self.domains is None else [
+                (d.name, d.domainType, d.codedValues.items(), d.range)
+                for d in self.domains],
+            'layer_names': self.layer_names,
+            'fields': self.fields,
+            'relationship_names': self.relationship_names,
+            'relationships': self.relationships,
+        }
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        (fd, temp_path) = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as temp_file:
+            json.dump(data, temp_file)
+        try:
+            os.rename(temp_path, self.cache_path)
+        except OSError:
+            # Windows does not allow renaming over an existing file.
+            os.remove(self.cache_path)
+            os.rename(temp_path, self.cache_path)
+
+    def _changed(self):
+        # Called with the lock held whenever the snapshot changes.
+        self._dirty = True
+        if not self._batch_depth:
+            self.save()
+            self._dirty = False
+
+    @contextmanager
+    def batch(self):
+        """
+        Save the changes made within the context once, when the outermost
+        batch exits, instead of after each change.
+        """
+
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._dirty:
+                    self.save()
+                    self._dirty = False
+
+    def get_domains(self):
+        """
+        Returns a list of DomainInfo tuples, or None if the domains have not
+        been cached.
+        """
+
+        return self.domains
+
+    def set_domains(self, domains):
+        with self._lock:
+            self.domains = list(domains)
+            self._changed()
+
+    def get_layer_names(self):
+        """
+        Returns the names of the tables and feature classes in the
+        workspace, or None if they have not been cached.
+        """
+
+        return self.layer_names
+
+    def set_layer_names(self, layer_names):
+        with self._lock:
+            self.layer_names = list(layer_names)
+            self._changed()
+
+    def get_fields(self, layer_name):
+        """
+        Returns a list of FieldInfo tuples for the layer, or None if the
+        fields have not been cached.
+        """
+
+        return self.fields.get(layer_name, None)
+
+    def set_fields(self, layer_name, fields):
+        with self._lock:
+            self.fields[layer_name] = list(fields)
+            self._changed()
+
+    def get_relationship_names(self, layer_name):
+        """
+        Returns the names of the relationship classes that the layer
+        participates in, or None if they have not been cached.
+        """
+
+        return self.relationship_names.get(layer_name, None)
+
+    def set_relationship_names(self, layer_name, rc_names):
+        with self._lock:
+            self.relationship_names[layer_name] = list(rc_names)
+            self._changed()
+
+    def get_relationship(self, rc_name):
+        """
+        Returns a list of the values of the RelationshipInfo for the
+        relationship class, or None if it has not been cached.
+        """
+
+        return self.relationships.get(rc_name, None)
+
+    def set_relationship(self, rc_name, values):
+        with self._lock:
+            self.relationships[rc_name] = list(values)
+            self._changed()
+
+    def discard_layer(self, layer_name):
+        """
+        Discard cached information about a layer whose schema has changed.
+        """
+
+        with self._lock:
+            self.fields.pop(layer_name, None)
+            self.relationship_names.pop(layer_name, None)
+            self._changed()
+
+    def clear(self):
+        """
+        Discard the snapshot, including the file on disk.
+        """
+
+        with self._lock:
+            self._empty()
+            self._dirty = False
+            if os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+
+
+class MemorySchemaCache(SchemaCache):
+    """
+    A schema snapshot that is only kept in memory, so that each layer and
+    relationship class is described once during a single operation.
+    """
+
+    def load(self):
+        self._empty()
+
+    def save(self):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._empty()
@@ -1,26 +1,42 @@
 import unittest
+from .test_benchmarks import TestBenchmarks, TestDatasetGenerator
 from .test_domains import TestCodedValue, TestDescription
+from .test_expressions import TestExpressionCache
+from .test_factory import TestLoadWorkspaceModels
 from .test_features import TestFeature, TestRegisterFeature
 from .test_fields import TestFields
 from .test_foreignkey import TestForiegnKey
+from .test_instrumentation import TestInstrumentation
 from .test_manytomany import TestManyToManyField
-from .test_query import TestQuerySet
+from .test_profiling import TestQueryProfiler
+from .test_query import TestQ, TestQuerySet
 from .test_scales import TestBreaksScale, TestDictScale
+from .test_schema import TestSchemaCache
+from .test_sqlite import TestSQLiteBackend
 from .test_workspaces import TestWorkspace
 
 
 def test_suite():
     return unittest.TestSuite([
+        TestBenchmarks(),
+        TestDatasetGenerator(),
         TestCodedValue(),
         TestDescription(),
+        TestExpressionCache(),
+        TestLoadWorkspaceModels(),
         TestFeature(),
         TestRegisterFeature(),
         TestFields(),
         TestForiegnKey(),
+        TestInstrumentation(),
         TestManyToManyField(),
+        TestQueryProfiler(),
+        TestQ(),
         TestQuerySet(),
         TestBreaksScale(),
         TestDictScale(),
+        TestSchemaCache(),
+        TestSQLiteBackend(),
         TestWorkspace()
         ])
 
@@ -1,16 +1,22 @@
-import arcpy
 import gc
 import os
 import shutil
 import tempfile
+from cuuats.datamodel.backends.sqlite import SQLiteBackend
 from cuuats.datamodel.workspaces import Workspace
 from cuuats.datamodel.fields import OIDField, GeometryField, \
     StringField, NumericField, ScaleField
-from cuuats.datamodel.features import BaseFeature
+from cuuats.datamodel.features import BaseFeature, relate
 from cuuats.datamodel.scales import BreaksScale
 from cuuats.datamodel.domains import D
 from cuuats.datamodel.workspaces import WorkspaceManager
 
+# Only WorkspaceFixture requires ArcGIS.
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
 
 def hasLicense(*licenses):
     """Is the required license in use?"""
@@ -185,3 +191,87 @@ class WorkspaceFixture(object):
         WorkspaceManager().clear()
         gc.collect()
         shutil.rmtree(self.workspace_dir)
+
+
+class SQLiteFixture(object):
+    """
+    An in-memory SQLite workspace with Widget and Warehouse layers, for
+    tests that do not require ArcGIS. Test cases may override the data.
+    """
+
+    DOMAIN_NAME = 'YesOrNo'
+    DOMAIN_VALUES = {
+        50: 'No',
+        100: 'Yes',
+    }
+    WIDGET_FIELDS = (
+        ('widget_name', {'field_type': 'TEXT', 'field_length': 100}),
+        ('widget_available', {'field_type': 'SHORT',
+                              'field_domain': DOMAIN_NAME}),
+        ('widget_price', {'field_type': 'DOUBLE'}),
+        ('warehouse_id', {'field_type': 'LONG'}),
+    )
+    WIDGET_DATA = (
+        ('Widget A', 100, 10.5, 1, (2.5, 3.0)),
+        ('Widget B', 50, None, 1, (-2.0, 5.5)),
+        ('Widget C', None, 4.5, None, (0.0, 4.0)),
+    )
+    WAREHOUSE_FIELDS = (
+        ('warehouse_name', {'field_type': 'TEXT', 'field_length': 100}),
+    )
+    WAREHOUSE_DATA = (
+        ('Central', (1.0, 3.3)),
+    )
+
+    def setUp(self):
+        self.backend = SQLiteBackend(':memory:')
+        self.backend.create_domain(
+            self.DOMAIN_NAME, coded_values=self.DOMAIN_VALUES)
+        self.backend.create_layer(
+            'Warehouse', self.WAREHOUSE_FIELDS, 'POINT')
+        self.backend.create_layer('Widget', self.WIDGET_FIELDS, 'POINT')
+        self.backend.create_relationship(
+            'Warehouse_Widget', 'Warehouse', 'Widget', 'OBJECTID',
+            'warehouse_id')
+
+        self.workspace = Workspace(':memory:', backend=self.backend)
+        self.workspace.insert_rows(
+            'Warehouse', [f[0] for f in self.WAREHOUSE_FIELDS] + ['SHAPE@'],
+            self.WAREHOUSE_DATA)
+        self.workspace.insert_rows(
+            'Widget', [f[0] for f in self.WIDGET_FIELDS] + ['SHAPE@'],
+            self.WIDGET_DATA)
+
+        self.manager = WorkspaceManager()
+        self.manager.workspaces[':memory:'] = self.workspace
+
+    def register_models(self, lazy=False, **attributes):
+        """
+        Create and register Warehouse and Widget feature classes, adding
+        the given attributes (such as fields) to Widget. If lazy is true,
+        Widget is registered lazily.
+        """
+
+        class Warehouse(BaseFeature):
+            OBJECTID = OIDField('Object ID')
+            warehouse_name = StringField('Warehouse Name')
+
+        class Widget(BaseFeature):
+            OBJECTID = OIDField('Object ID')
+            widget_name = StringField('Widget Name', deferred=True)
+            widget_available = NumericField(
+                'Available', domain_name=self.DOMAIN_NAME)
+            widget_price = NumericField('Price')
+
+        for (name, value) in attributes.items():
+            setattr(Widget, name, value)
+
+        relate(Warehouse, Widget, 'OBJECTID', 'warehouse_id', 'warehouse')
+        Warehouse.register(':memory:/Warehouse')
+        Widget.register(':memory:/Widget', lazy=lazy)
+        self.Warehouse = Warehouse
+        self.Widget = Widget
+        return (Warehouse, Widget)
+
+    def tearDown(self):
+        self.manager.clear()
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from cuuats.datamodel.benchmarks import suite
+from cuuats.datamodel.benchmarks.generator import DatasetGenerator
+from cuuats.datamodel.benchmarks.orm import BENCHMARKS
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run(self):
+        results = suite.run(size=20, repeat=1)
+        self.assertEqual(
+            sorted(results.keys()), sorted([n for (n, b) in BENCHMARKS]))
+        self.assertEqual(results['scoring']['items'], 20)
+        self.assertTrue(results['scoring']['throughput'] > 0)
+
+        with self.assertRaises(KeyError):
+            suite.run(size=20, repeat=1, names=['missing'])
+
+    def test_compare(self):
+        results = {
+            'fast': {'throughput': 150.0},
+            'slow': {'throughput': 70.0},
+            'new': {'throughput': 10.0},
+        }
+        baseline_results = {
+            'fast': {'throughput': 100.0},
+            'slow': {'throughput': 100.0},
+        }
+        self.assertEqual(
+            suite.compare(results, baseline_results, 0.2),
+            [('fast', 1.5, False), ('slow', 0.7, True)])
+        self.assertEqual(
+            suite.compare(results, baseline_results, 0.5),
+            [('fast', 1.5, False), ('slow', 0.7, False)])
+
+    def test_baseline(self):
+        path = os.path.join(self.directory, 'baseline.json')
+        self.assertEqual(suite.main(
+            ['scoring', '--size', '20', '--repeat', '1', '--save', path]), 0)
+        baseline = suite.load_baseline(path)
+        self.assertEqual(baseline['size'], 20)
+        self.assertEqual(baseline['results'].keys(), ['scoring'])
+
+        baseline['results']['scoring']['throughput'] *= 100
+        with open(path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+        self.assertEqual(suite.main(
+            ['scoring', '--size', '20', '--repeat', '1', '--baseline', path,
+             '--threshold', '0.5']), 1)
+
+        baseline['format'] = 0
+        with open(path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+        with self.assertRaises(ValueError):
+            suite.load_baseline(path)
+
+
+class TestDatasetGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _generate(self, name, **kwargs):
+        return DatasetGenerator(**kwargs).generate(
+            os.path.join(self.directory, name))
+
+    def _read(self, workspace):
+        return dict([
+            (layer_name, [r for (r, c) in workspace.iter_rows(
+                layer_name, workspace.get_layer_fields(layer_name).keys())])
+            for layer_name in workspace.list_layers()])
+
+    def test_generate(self):
+        workspace = self._generate(
+            'a.sqlite', widgets=200, attachment_rate=0.5, attachment_size=64,
+            seed=1, batch_size=30)
+        self.assertEqual(
+            [(n, workspace.count_rows(n)) for n in workspace.list_layers()
+             if n != 'WidgetTag' and n != 'Widget__ATTACH'],
+            [('Warehouse', 4), ('Route', 20), ('Tag', 10), ('Widget', 200)])
+        self.assertEqual(
+            workspace.get_layer_fields('Route')['route_mode'].domain, 'Mode')
+        self.assertEqual(
+            [r.destination for r in workspace.list_relationships('Warehouse')],
+            ['Route', 'Widget'])
+
+        tag_counts = [len(list(workspace.iter_rows(
+            'WidgetTag', ['tag_id'], where_clause='widget_id = %i' % (i,))))
+            for i in range(1, 201)]
+        self.assertTrue(1 <= min(tag_counts) and max(tag_counts) <= 3)
+
+        attachments = [r for (r, c) in workspace.iter_rows(
+            workspace.get_attachment_info('Widget').destination,
+            ['DATA_SIZE', 'DATA'])]
+        self.assertTrue(0 < len(attachments) < 200)
+        self.assertEqual(set([(s, len(d)) for (s, d) in attachments]),
+                         set([(64, 64)]))
+
+        (line,) = workspace.get_row('Route', ['SHAPE@'], 'OBJECTID = 1')
+        self.assertTrue(2 <= len(line) <= 8)
+
+        # The same seed produces the same data.
+        other = self._generate(
+            'b.sqlite', widgets=200, attachment_rate=0.5, attachment_size=64,
+            seed=1)
+        self.assertEqual(self._read(other), self._read(workspace))
+        other = self._generate(
+            'c.sqlite', widgets=200, attachment_rate=0.5, attachment_size=64,
+            seed=2)
+        self.assertNotEqual(self._read(other)['Widget'],
+                            self._read(workspace)['Widget'])
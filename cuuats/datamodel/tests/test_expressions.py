@@ -0,0 +1,39 @@
+import unittest
+from collections import OrderedDict
+from cuuats.datamodel.expressions import ExpressionCache
+
+
+class TestExpressionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ExpressionCache(max_size=2)
+
+    def test_get(self):
+        compiled = self.cache.get('a + b * 2')
+        self.assertEqual(compiled.evaluate({'a': 1, 'b': 2}), 5)
+        self.assertEqual(compiled.identifiers, frozenset(['a', 'b']))
+        self.assertTrue(self.cache.get('a + b * 2') is compiled)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+        with self.assertRaises(SyntaxError):
+            self.cache.get('a +')
+
+    def test_eviction(self):
+        first = self.cache.get('1')
+        self.cache.get('2')
+        self.cache.get('1')
+        self.cache.get('3')
+        self.assertEqual(len(self.cache), 2)
+        self.assertTrue(self.cache.get('1') is first)
+        self.assertEqual(self.cache.get_stats()['misses'], 3)
+
+    def test_get_field_names(self):
+        compiled = self.cache.get('b > 1 and self.c')
+        fields = OrderedDict([('a', None), ('b', None), ('c', None)])
+        self.assertEqual(compiled.get_field_names(fields), ['b', 'c'])
+        self.assertEqual(len(compiled._field_names), 1)
+
+        # Entries are removed when their field sets are discarded.
+        del fields
+        self.assertEqual(compiled._field_names, {})
@@ -0,0 +1,73 @@
+import arcpy
+import os
+import unittest
+from cuuats.datamodel.factory import clear_workspace_models, \
+    load_workspace_models
+from cuuats.datamodel.fields import ForeignKey
+from cuuats.datamodel.tests.base import WorkspaceFixture
+
+
+def setUpModule():
+    WorkspaceFixture.setUpModule()
+
+
+class TestLoadWorkspaceModels(WorkspaceFixture, unittest.TestCase):
+    REL_NAME = 'Warehouse_Widget'
+
+    def setUp(self):
+        super(TestLoadWorkspaceModels, self).setUp()
+        arcpy.CreateRelationshipClass_management(
+            origin_table=self.rc_path,
+            destination_table=self.fc_path,
+            out_relationship_class=os.path.join(self.gdb_path, self.REL_NAME),
+            relationship_type='SIMPLE',
+            forward_label='Widget',
+            backward_label='Warehouse',
+            message_direction='NONE',
+            cardinality='ONE_TO_MANY',
+            attributed='NONE',
+            origin_primary_key='warehouse_zipcode',
+            origin_foreign_key='widget_number')
+
+    def tearDown(self):
+        clear_workspace_models()
+        super(TestLoadWorkspaceModels, self).tearDown()
+
+    def test_load_workspace_models(self):
+        models = load_workspace_models(self.gdb_path)
+        self.assertEqual(
+            sorted(models.keys()),
+            sorted([self.FEATURE_CLASS_NAME, self.RELATED_CLASS_NAME]))
+
+        Widget = models[self.FEATURE_CLASS_NAME]
+        Warehouse = models[self.RELATED_CLASS_NAME]
+        self.assertEqual(Widget.__module__, __name__)
+        self.assertTrue(
+            isinstance(Widget.fields['widget_number'], ForeignKey))
+        self.assertTrue(Widget.fields['widget_number'].origin_class
+                        is Warehouse)
+        self.assertEqual(Widget.objects.count(), 3)
+
+        # Classes are only created once.
+        widget_only = load_workspace_models(
+            self.gdb_path, include=['widg*'])
+        self.assertEqual(widget_only.keys(), [self.FEATURE_CLASS_NAME])
+        self.assertTrue(widget_only[self.FEATURE_CLASS_NAME] is Widget)
+
+    def test_exclude(self):
+        models = load_workspace_models(
+            self.gdb_path, exclude=[self.RELATED_CLASS_NAME])
+        self.assertEqual(models.keys(), [self.FEATURE_CLASS_NAME])
+        self.assertFalse(isinstance(
+            models[self.FEATURE_CLASS_NAME].fields['widget_number'],
+            ForeignKey))
+
+    def test_register_later(self):
+        models = load_workspace_models(self.gdb_path, register=False)
+        self.assertTrue(all([m.workspace is None for m in models.values()]))
+
+        # Classes created without registration are registered later.
+        self.assertEqual(load_workspace_models(self.gdb_path), models)
+        self.assertEqual(models[self.FEATURE_CLASS_NAME].objects.count(), 3)
+        self.assertEqual(
+            models[self.FEATURE_CLASS_NAME].workspace.schema_cache, None)
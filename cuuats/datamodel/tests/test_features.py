@@ -3,6 +3,8 @@ import unittest
 from cuuats.datamodel.tests.base import WorkspaceFixture
 from cuuats.datamodel.fields import StringField
 from cuuats.datamodel.domains import D
+from cuuats.datamodel.field_values import DeferredValue
+from cuuats.datamodel.features import get_lazy_registration_stats
 
 
 def setUpModule():
@@ -132,6 +134,38 @@ class TestFeature(WorkspaceFixture, unittest.TestCase):
         self.assertTrue(price_msg not in self.instance.validate(),
                         'required_if validation message incorrectly generated')
 
+    def test_deferred_siblings(self):
+        features = list(self.cls.objects.all())
+        self.assertTrue(features[0].Shape is not None)
+        for feature in features:
+            self.assertFalse(
+                isinstance(feature.values['Shape'], DeferredValue),
+                'deferred value not loaded for sibling feature')
+
+        features = list(self.cls.objects.all().batch_deferred(False))
+        self.assertTrue(features[0].Shape is not None)
+        self.assertTrue(
+            isinstance(features[1].values['Shape'], DeferredValue),
+            'deferred value loaded for sibling feature when disabled')
+
+    def test_cache_calculated(self):
+        self.cls.cache_calculated = True
+        self.cls.reset_calculated_stats()
+        try:
+            self.assertEqual(self.instance.widget_number_score, 2)
+            self.assertEqual(self.instance.widget_number_score, 2)
+            self.instance.widget_name = 'Other Widget'
+            self.assertEqual(self.instance.widget_number_score, 2)
+            self.instance.widget_number = 5000
+            self.assertEqual(self.instance.widget_number_score, 4)
+
+            stats = self.cls.get_calculated_stats()
+            self.assertEqual(stats['misses'], 2)
+            self.assertEqual(stats['hits'], 2)
+            self.assertEqual(stats['invalidations'], 1)
+        finally:
+            self.cls.cache_calculated = False
+
     def test_diff(self):
         feature = self.cls.objects.get(OBJECTID=1)
         feature.save()
@@ -161,3 +195,24 @@ class TestRegisterFeature(WorkspaceFixture, unittest.TestCase):
         self.assertEqual(
             len(self.cls.__dict__['widget_available'].choices), 3,
             'choices from domain is not assigned correctly')
+
+    def test_register_lazy(self):
+        self.cls.register(self.fc_path, lazy=True)
+        self.assertEqual(self.cls.workspace, None)
+        self.assertTrue(self.cls.__name__ in
+                        get_lazy_registration_stats()['pending'])
+        self.assertIsNotNone(
+            get_lazy_registration_stats()['estimated_seconds_saved'])
+
+        self.assertEqual(self.cls.objects.count(), 3)
+        self.assertEqual(self.cls.workspace.path, self.workspace.path)
+        self.assertEqual(
+            len(self.cls.__dict__['widget_available'].choices), 3,
+            'choices from domain is not assigned correctly')
+        self.assertFalse(self.cls.__name__ in
+                         get_lazy_registration_stats()['pending'])
+
+        # Creating an instance also completes the registration.
+        self.related_cls.register(self.rc_path, lazy=True)
+        warehouse = self.related_cls(warehouse_name='Warehouse')
+        self.assertEqual(warehouse.workspace.path, self.workspace.path)
@@ -1,6 +1,7 @@
 import unittest
 from cuuats.datamodel.fields import BaseField, OIDField, GeometryField, \
     StringField, NumericField, MethodField, WeightsField
+from cuuats.datamodel.schema import FieldInfo
 
 
 class TestFields(unittest.TestCase):
@@ -72,6 +73,16 @@ class TestFields(unittest.TestCase):
         self.assertTrue('String Field is missing' in field.validate(''),
                         'no validation message for empty string')
 
+    def test_numpy_dtype(self):
+        field = self.inst_a.get_field('string_field')
+        self.assertEqual(field.get_numpy_dtype(), 'U100')
+        self.assertEqual(field.get_numpy_dtype(FieldInfo(
+            'string_field', 'String', '', False, '', 500, 0, 0)), 'U500')
+        self.assertEqual(field.get_numpy_dtype(FieldInfo(
+            'string_field', 'String', '', False, '', 0, 0, 0)), 'U100')
+        self.assertEqual(
+            self.inst_a.get_field('numeric_field').get_numpy_dtype(), 'f8')
+
     def test_numeric_field_validation(self):
         field = self.inst_a.get_field('numeric_field')
         self.assertTrue('Numeric Field out of range' in field.validate(25),
@@ -57,6 +57,20 @@ class TestForiegnKey(WorkspaceFixture, unittest.TestCase):
                 warehouse_id, self.FK_VALUES[widget.OBJECTID - 1],
                 'prefetched foreign key value has the wrong ID')
 
+    def test_foreign_key_prefetch_chunks(self):
+        widgets = self.cls.objects.prefetch_related('warehouse_id')
+        widget_ids = []
+        for widget in widgets.iterator(chunk_size=2):
+            prefetched = widget._prefetch_cache[self.FK_FIELD]
+            self.assertEqual(
+                getattr(prefetched, self.PK_FIELD),
+                self.FK_VALUES[widget.OBJECTID - 1],
+                'prefetched foreign key value has the wrong ID')
+            widget_ids.append(widget.OBJECTID)
+
+        self.assertEqual(widget_ids, [1, 2, 3])
+        self.assertEqual(widgets._cache, None, 'iterator populated the cache')
+
     def test_foreign_key_query(self):
         widgets = list(self.cls.objects.filter(warehouse_id=2))
         self.assertEqual(
@@ -104,3 +118,14 @@ class TestForiegnKey(WorkspaceFixture, unittest.TestCase):
         self.assertEqual(
             warehouses[0].OBJECTID, 1,
             'related manager query returns the wrong object')
+
+    def test_delete_cascade(self):
+        deleted_count = self.related_cls.objects.filter(
+            OBJECTID=1).delete(cascade=True)
+        self.assertEqual(
+            deleted_count, 1 + self.FK_VALUES.count(1),
+            'cascading delete removed the wrong number of rows')
+
+        self.assertEqual(
+            [w.OBJECTID for w in self.cls.objects.all()], [3],
+            'cascading delete did not remove related features')
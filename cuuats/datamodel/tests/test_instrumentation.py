@@ -0,0 +1,91 @@
+import unittest
+from cuuats.datamodel import instrumentation
+from cuuats.datamodel.fields import ScaleField
+from cuuats.datamodel.instrumentation import FieldStats, get_field_stats, \
+    instrument_fields
+from cuuats.datamodel.scales import BreaksScale
+from cuuats.datamodel.tests.base import SQLiteFixture
+
+
+class TestInstrumentation(SQLiteFixture, unittest.TestCase):
+    WAREHOUSE_DATA = (
+        ('North', (0.0, 0.0)),
+        ('South', (1.0, 1.0)),
+    )
+    WIDGET_DATA = tuple(
+        ('Widget %i' % (i,), (50, 100)[i % 2], float(i), i % 2 + 1,
+         (float(i), 0.0))
+        for i in range(4))
+
+    def setUp(self):
+        super(TestInstrumentation, self).setUp()
+        self.backend.add_field(
+            'Widget', 'price_score', {'field_type': 'SHORT'})
+        self.register_models(price_score=ScaleField(
+            'Price Score', condition='widget_price > 0',
+            value_field='widget_price * 2', default=0,
+            scale=BreaksScale([2, 4], [3, 2, 1])))
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+        super(TestInstrumentation, self).tearDown()
+
+    def test_field_stats(self):
+        widgets = list(self.Widget.objects.all())
+        with instrument_fields():
+            for widget in widgets:
+                widget.widget_name
+                widget.widget_available
+                widget.price_score
+                widget.warehouse.warehouse_name
+            widgets[0].widget_name
+
+        stats = dict([(s.field_name, s)
+                      for s in get_field_stats(self.Widget)])
+        self.assertEqual(
+            sorted(stats.keys()),
+            ['eval(widget_price * 2)', 'eval(widget_price > 0)',
+             'price_score', 'warehouse', 'widget_available',
+             'widget_name', 'widget_price'])
+        # Deferred values are loaded for all of the widgets at once.
+        self.assertEqual(stats['widget_name'][:5],
+                         ('Widget', 'widget_name', 5, 1, 0))
+        self.assertEqual(stats['widget_available'].decodes, 4)
+        self.assertEqual(stats['warehouse'].fk_fetches, 4)
+        self.assertEqual(stats['price_score'].reads, 4)
+        self.assertEqual(stats['price_score'].evaluations, 4)
+        self.assertTrue(stats['price_score'].evaluation_seconds > 0)
+        self.assertEqual(stats['eval(widget_price * 2)'].evaluations, 3)
+        self.assertEqual(stats['widget_price'].reads, 7)
+
+        # The fetched warehouses are counted under their own class.
+        self.assertEqual(
+            [(s.field_name, s.reads) for s in get_field_stats()
+             if s.class_name == 'Warehouse'],
+            [('warehouse_name', 4)])
+
+        report = instrumentation.report(sort_by='evaluations', limit=2)
+        self.assertEqual(len(report.splitlines()), 3)
+        self.assertTrue('Widget.price_score' in report)
+        with self.assertRaises(ValueError):
+            instrumentation.report(sort_by='missing')
+
+    def test_disabled(self):
+        widget = self.Widget.objects.get(OBJECTID=1)
+        widget.widget_name
+        widget.price_score
+        self.assertEqual(get_field_stats(), [])
+
+        # Counts are kept after disabling until they are reset.
+        with instrument_fields():
+            widget.widget_price
+        widget.widget_price
+        with instrument_fields(clear=False):
+            widget.widget_price
+        self.assertEqual(
+            get_field_stats(),
+            [FieldStats('Widget', 'widget_price', 2, 0, 0, 0, 0, 0)])
+
+        instrumentation.reset()
+        self.assertEqual(get_field_stats(), [])
@@ -0,0 +1,159 @@
+import logging
+import unittest
+from contextlib import contextmanager
+from cuuats.datamodel.profiling import QueryProfiler, QuerySource, \
+    add_query_hook, normalize_sql, remove_query_hook
+from cuuats.datamodel.tests.base import SQLiteFixture
+from cuuats.datamodel.workspaces import Workspace
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@contextmanager
+def capture_logs():
+    """
+    Replace the handlers of the root logger with a RecordingHandler, so
+    that messages are recorded instead of written to the test output.
+    """
+
+    root = logging.getLogger()
+    (handlers, level) = (root.handlers, root.level)
+    handler = RecordingHandler()
+    root.handlers = [handler]
+    root.setLevel(logging.WARNING)
+    try:
+        yield handler.records
+    finally:
+        root.handlers = handlers
+        root.setLevel(level)
+
+
+class TestQueryProfiler(SQLiteFixture, unittest.TestCase):
+    WAREHOUSE_DATA = (
+        ('North', (0.0, 0.0)),
+        ('South', (1.0, 1.0)),
+    )
+    WIDGET_DATA = tuple(
+        ('Widget %i' % (i,), 100, float(i), i % 2 + 1, (float(i), 0.0))
+        for i in range(6))
+
+    def setUp(self):
+        super(TestQueryProfiler, self).setUp()
+        self.register_models()
+
+    def test_records(self):
+        with self.workspace.profile() as profiler:
+            widgets = list(self.Widget.objects.filter(widget_price__gt=2))
+            self.workspace.get_row('Widget', ['OID@'], 'OBJECTID = 1')
+
+        self.assertEqual(len(profiler.records), 2)
+        record = profiler.records[0]
+        self.assertEqual(record.layer_name, 'Widget')
+        self.assertEqual(record.field_names,
+                         ['OBJECTID', 'widget_available', 'widget_price',
+                          'warehouse_id'])
+        self.assertTrue('WHERE widget_price > 2' in record.sql)
+        self.assertEqual(record.row_count, len(widgets))
+        self.assertTrue(0 <= record.first_row_time <= record.total_time)
+        self.assertEqual(record.call_site.filename.rstrip('c'),
+                         __file__.rstrip('c'))
+        self.assertEqual(record.call_site.function, 'test_records')
+        self.assertEqual(record.source, None)
+        self.assertEqual(profiler.records[1].row_count, 1)
+
+        # Queries are not recorded once the profiler has exited.
+        list(self.Widget.objects.all())
+        self.assertEqual(len(profiler.records), 2)
+
+    def test_hooks(self):
+        records = []
+        add_query_hook(records.append)
+        try:
+            list(self.Widget.objects.all())
+            self.assertEqual(self.Widget.objects.first().OBJECTID, 1)
+        finally:
+            remove_query_hook(records.append)
+        list(self.Widget.objects.all())
+
+        self.assertEqual([r.row_count for r in records], [6, 1])
+        self.assertTrue(all([r.finished for r in records]))
+
+        # Profilers for other workspaces ignore these queries.
+        with QueryProfiler(Workspace(':memory:')) as profiler:
+            list(self.Widget.objects.all())
+        self.assertEqual(profiler.records, [])
+
+    def test_slow_queries(self):
+        with capture_logs() as log_records:
+            with self.workspace.profile(slow_threshold=0) as profiler:
+                list(self.Widget.objects.all())
+        self.assertEqual(profiler.slow_queries, profiler.records)
+        self.assertTrue('Slow queries:' in profiler.report())
+        (log_record,) = log_records
+        self.assertEqual(log_record.levelno, logging.WARNING)
+        self.assertTrue(log_record.getMessage().startswith('Slow query ('))
+        self.assertTrue('FROM Widget' in log_record.getMessage())
+
+        with capture_logs() as log_records:
+            with self.workspace.profile(
+                    slow_threshold=None, first_row_threshold=60) as profiler:
+                list(self.Widget.objects.all())
+        self.assertEqual(profiler.slow_queries, [])
+        self.assertEqual(log_records, [])
+
+    def test_n_plus_one(self):
+        with self.workspace.profile() as profiler:
+            for widget in self.Widget.objects.all():
+                widget.warehouse.warehouse_name
+            for warehouse in self.Warehouse.objects.all():
+                list(warehouse.widget_set)
+
+        (result,) = profiler.find_n_plus_one()
+        self.assertEqual(result.source, QuerySource(
+            'ForeignKey.__get__', 'Widget', 'warehouse'))
+        self.assertEqual(result.count, 6)
+        self.assertEqual(result.layer_name, 'Warehouse')
+        self.assertTrue("prefetch_related('warehouse')" in result.suggestion)
+        self.assertTrue('Likely N+1 queries:' in profiler.report())
+
+        with self.workspace.profile(n_plus_one_threshold=2) as profiler:
+            for warehouse in self.Warehouse.objects.all():
+                list(warehouse.widget_set.filter(widget_price__gt=0))
+        self.assertEqual(
+            [r.source for r in profiler.find_n_plus_one()],
+            [QuerySource('RelatedManager.__get__', 'Warehouse',
+                         'widget_set')])
+
+        with self.workspace.profile() as profiler:
+            for widget in self.Widget.objects.all().prefetch_related(
+                    'warehouse').prefetch_deferred('widget_name'):
+                widget.warehouse.warehouse_name
+                widget.widget_name
+        self.assertEqual(profiler.find_n_plus_one(), [])
+        self.assertEqual(len(profiler.records), 2)
+
+    def test_deferred_n_plus_one(self):
+        widgets = [self.Widget.objects.get(OBJECTID=i) for i in range(1, 5)]
+        with self.workspace.profile() as profiler:
+            for widget in widgets:
+                widget.widget_name
+
+        (result,) = profiler.find_n_plus_one()
+        self.assertEqual(result.source, QuerySource(
+            'get_deferred_values', 'Widget', ('widget_name',)))
+        self.assertTrue("prefetch_deferred('widget_name')" in
+                        result.suggestion)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT a FROM t WHERE b = 'it''s' AND c IN "
+                          "(1, 2.5, 3) AND d2 = 10"),
+            'SELECT a FROM t WHERE b = ? AND c IN (?) AND d2 = ?')
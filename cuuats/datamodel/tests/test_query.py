@@ -1,8 +1,18 @@
+import itertools
+import operator
 import unittest
+from cuuats.datamodel.domains import D
+from cuuats.datamodel.field_values import DeferredValue
+from cuuats.datamodel.query import F, Q, QuerySet, ChunkSizer, SQLCompiler
 from cuuats.datamodel.tests.base import WorkspaceFixture
 from cuuats.datamodel.exceptions import ObjectDoesNotExist, \
     MultipleObjectsReturned
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 def setUpModule():
     WorkspaceFixture.setUpModule()
@@ -31,6 +41,85 @@ class TestQuerySet(WorkspaceFixture, unittest.TestCase):
             with self.assertRaises(MultipleObjectsReturned):
                 self.cls.objects.get(widget_description=None)
 
+        def test_count_exists(self):
+            self.assertEqual(self.cls.objects.count(), 3)
+            self.assertEqual(
+                self.cls.objects.filter(widget_number=None).count(), 2)
+            self.assertTrue(self.cls.objects.filter(OBJECTID=1).exists())
+            self.assertFalse(self.cls.objects.filter(OBJECTID=5).exists())
+
+        def test_values(self):
+            qs = self.cls.objects.filter(OBJECTID__in=[1, 2])
+            self.assertEqual(list(qs.values('OBJECTID', 'widget_number')), [
+                {'OBJECTID': 1, 'widget_number': 12345},
+                {'OBJECTID': 2, 'widget_number': None}])
+            self.assertEqual(list(qs.values_list('widget_number')),
+                             [(12345,), (None,)])
+            self.assertEqual(
+                list(qs.values_list('widget_name', flat=True)),
+                ['Widget A+ Awesome', 'B-Widgety Widget'])
+            rows = list(qs.namedtuples('OBJECTID', 'widget_name'))
+            self.assertEqual(rows[1].OBJECTID, 2)
+            self.assertEqual(rows[1].widget_name, 'B-Widgety Widget')
+            self.assertEqual(len(list(qs.values())), 2)
+
+            with self.assertRaises(TypeError):
+                qs.values_list('OBJECTID', 'widget_name', flat=True)
+            with self.assertRaises(AttributeError):
+                qs.values('not_a_field')
+
+        def test_only_defer(self):
+            qs = self.cls.objects.all()
+            fields = list(qs.query.fields)
+
+            features = list(qs.only('widget_name'))
+            self.assertEqual(qs.query.fields, fields)
+            self.assertTrue(isinstance(
+                features[0].values['widget_number'], DeferredValue))
+            self.assertEqual(features[0].widget_number, 12345)
+            self.assertEqual(features[0].OBJECTID, 1)
+            self.assertFalse(isinstance(
+                features[1].values['widget_number'], DeferredValue))
+
+            features = list(qs.defer('widget_number', 'OBJECTID'))
+            self.assertEqual(qs.query.fields, fields)
+            self.assertTrue(isinstance(
+                features[0].values['widget_number'], DeferredValue))
+            self.assertEqual(features[0].widget_name, 'Widget A+ Awesome')
+            self.assertEqual(features[0].widget_number, 12345)
+
+            qs.only('widget_name').prefetch_deferred('widget_number')
+            self.assertEqual(qs.query.fields, fields)
+
+        @unittest.skipIf(numpy is None, 'NumPy is not installed')
+        def test_to_numpy(self):
+            array = self.cls.objects.to_numpy(
+                ['OBJECTID', 'widget_number', 'widget_name'])
+            self.assertEqual(list(array['OBJECTID']), [1, 2, 3])
+            self.assertEqual(array['widget_number'][0], 12345)
+            self.assertTrue(numpy.isnan(array['widget_number'][1]))
+            self.assertEqual(array['widget_name'][1], 'B-Widgety Widget')
+
+            columns = self.cls.objects.filter(OBJECTID__in=[2, 3]).order_by(
+                [('OBJECTID', 'DESC')]).to_columns(['OBJECTID', 'Shape'])
+            self.assertEqual(list(columns['OBJECTID']), [3, 2])
+            self.assertEqual(len(columns['Shape']), 2)
+
+        def test_annotate_calculated(self):
+            features = list(self.cls.objects.all())
+            columns = self.cls.objects.annotate_calculated()
+            self.assertEqual(columns.keys(),
+                             ['OBJECTID', 'widget_number_score'])
+            self.assertEqual(columns['OBJECTID'], [1, 2, 3])
+            self.assertEqual(columns['widget_number_score'],
+                             [f.widget_number_score for f in features])
+            self.assertEqual(
+                self.cls.objects.eval_many('widget_number_score * 2'),
+                [f.eval('widget_number_score * 2') for f in features])
+
+            with self.assertRaises(ValueError):
+                self.cls.objects.annotate_calculated('widget_name')
+
         def test_get_save(self):
             inst_a = self.cls.objects.get(OBJECTID=1)
             inst_b = self.cls.objects.get(OBJECTID=2)
@@ -51,3 +140,203 @@ class TestQuerySet(WorkspaceFixture, unittest.TestCase):
                 self.FEATURE_CLASS_NAME, ['widget_number'])]
             self.assertTrue(10 in widget_numbers)
             self.assertTrue(20 in widget_numbers)
+
+        def test_bulk_update(self):
+            features = list(self.cls.objects.all())
+            for feature in features:
+                feature.widget_number = 42
+            features[0].widget_name = 'Bulk Widget'
+
+            updated_count = self.cls.objects.bulk_update(
+                features, fields=['widget_number'])
+            self.assertEqual(updated_count, len(features))
+            self.assertTrue('widget_name' in features[0].diff())
+            self.assertTrue('widget_number' not in features[0].diff())
+
+            widget_numbers = [r[0] for (r, c) in self.workspace.iter_rows(
+                self.FEATURE_CLASS_NAME, ['widget_number'])]
+            self.assertEqual(widget_numbers, [42] * len(features))
+            self.assertEqual(
+                self.cls.objects.get(OBJECTID=1).widget_name,
+                self.FEATURE_CLASS_DATA[0][0])
+
+            self.cls.objects.bulk_update(features)
+            self.assertEqual(self.cls.objects.bulk_update(features), 0)
+
+        def test_bulk_create(self):
+            feature_count = self.cls.objects.count()
+            features = [self.cls(widget_name='Bulk Widget %i' % (i,))
+                        for i in range(5)]
+
+            created_count = self.cls.objects.bulk_create(
+                iter(features), batch_size=2)
+            self.assertEqual(created_count, 5)
+            self.assertEqual(self.cls.objects.count(), feature_count + 5)
+
+            for feature in features:
+                self.assertTrue(feature.OBJECTID is not None)
+                self.assertEqual(
+                    self.cls.objects.get(OBJECTID=feature.OBJECTID)
+                    .widget_name, feature.widget_name)
+
+            with self.assertRaises(ValueError):
+                self.cls.objects.bulk_create(features)
+
+        def test_update(self):
+            updated_count = self.cls.objects.filter(
+                widget_available=D('Yes')).update(
+                    widget_available=D('No'),
+                    widget_number=F('widget_number') * 2 + 1)
+            self.assertEqual(updated_count, 1)
+
+            feature = self.cls.objects.get(OBJECTID=1)
+            self.assertEqual(feature.widget_available, D('No'))
+            self.assertEqual(feature.widget_number, 24691)
+
+            self.assertEqual(
+                self.cls.objects.filter(widget_number=None).update(
+                    widget_price=F('widget_number') + 1), 2)
+            self.assertEqual(
+                self.cls.objects.filter(widget_price=None).count(), 2)
+
+            with self.assertRaises(ValueError):
+                self.cls.objects.update(widget_number_score=1)
+
+        def test_delete(self):
+            feature_count = self.cls.objects.count()
+            deleted_count = self.cls.objects.filter(
+                widget_number=None).delete()
+            self.assertEqual(deleted_count, 2)
+            self.assertEqual(self.cls.objects.count(), feature_count - 2)
+            self.assertEqual(
+                self.cls.objects.filter(widget_number=None).delete(), 0)
+
+        def test_in_chunks(self):
+            QuerySet._chunk_sizers[self.cls] = ChunkSizer(size=1, min_size=1)
+            try:
+                qs = self.cls.objects.filter(OBJECTID__in=[3, 1, 2, 1, 10])
+                self.assertEqual(len(qs.query.split_where(1)), 4)
+                self.assertEqual([f.OBJECTID for f in qs], [1, 2, 3])
+                self.assertEqual(
+                    [f.OBJECTID for f in qs.order_by([('OBJECTID', 'DESC')])],
+                    [3, 2, 1])
+                self.assertEqual(qs.count(), 3)
+                self.assertTrue(qs.exists())
+                self.assertEqual(len(list(qs.iterator(limit=2))), 2)
+                self.assertEqual(qs.aggregate([('OBJECTID', 'COUNT')]),
+                                 {'COUNT_OBJECTID': 3})
+            finally:
+                del QuerySet._chunk_sizers[self.cls]
+
+        def test_compiler_cache(self):
+            compiler = SQLCompiler(self.cls)
+            compiler.CACHE_SIZE = 2
+            SQLCompiler.clear_cache()
+            (q0, q1, q2) = [Q(widget_number=i) for i in range(3)]
+
+            # The least recently used where clause is discarded.
+            for q in [q0, q1, q0, q2]:
+                compiler.compile(q)
+            self.assertEqual(
+                SQLCompiler._cache[self.cls].keys(),
+                [(q0.get_key(), False), (q2.get_key(), False)])
+
+            # Where clauses memoized by queries are recompiled once the
+            # cache is cleared by registering the class again.
+            query = self.cls.objects.filter(widget_number=12345).query
+            where = query.where
+            generation = SQLCompiler.generation
+            self.cls.register(self.fc_path)
+            self.assertEqual(SQLCompiler.generation, generation + 1)
+            self.assertFalse(self.cls in SQLCompiler._cache)
+            self.assertEqual(query.where, where)
+            self.assertEqual(len(SQLCompiler._cache[self.cls]), 1)
+
+
+class TestQ(unittest.TestCase):
+
+    def _make(self, op, children, negated=False, rel_name=None):
+        q = Q()
+        q.operator = op
+        q.children = children
+        q.negated = negated
+        q.rel_name = rel_name
+        return q
+
+    def _matches(self, q, row):
+        # Evaluate a Q without relationships against a dictionary of values.
+        results = [self._matches(c, row) if isinstance(c, Q) else
+                   row[c.field_name] == c.value for c in q.children]
+        result = all(results) if q.operator == 'AND' else any(results)
+        return result != q.negated
+
+    def assertSimplifiesTo(self, q, expected):
+        self.assertEqual(q.simplify().get_key(), expected.get_key())
+
+    def assertEquivalent(self, q):
+        for values in itertools.product([0, 1], repeat=3):
+            row = dict(zip('abc', values))
+            self.assertEqual(self._matches(q.simplify(), row),
+                             self._matches(q, row))
+
+    def test_simplify(self):
+        (a, b, c) = (Q(a=1), Q(b=1), Q(c=1))
+        (ca, cb, cc) = (a.children[0], b.children[0], c.children[0])
+        x = a | b
+
+        # These are simplified as they were before simplification became
+        # iterative.
+        self.assertSimplifiesTo(
+            (a & b) & c, self._make('AND', [ca, cb, cc]))
+        self.assertSimplifiesTo(
+            a | (b | c), self._make('OR', [ca, cb, cc]))
+        self.assertSimplifiesTo(
+            (a | b) & c, self._make('AND', [self._make('OR', [ca, cb]), cc]))
+        self.assertSimplifiesTo(
+            (x & c) & x, self._make('AND', [
+                self._make('OR', [ca, cb]), cc, self._make('OR', [ca, cb])]))
+        self.assertSimplifiesTo(
+            Q(r__b=1) & Q(r__c=1), self._make('AND', [cb, cc], rel_name='r'))
+
+        # Conditions on the same relationship are combined even if they are
+        # not adjacent.
+        self.assertSimplifiesTo(
+            Q(r__b=1) & a & Q(r__c=1), self._make('AND', [
+                self._make('AND', [cb, cc], rel_name='r'), ca]))
+
+        # Negated Qs are not flattened into their parents, and double
+        # negation cancels out.
+        self.assertSimplifiesTo(
+            ~(~a & ~b) & c, self._make('AND', [
+                self._make('AND', [
+                    self._make('AND', [ca], negated=True),
+                    self._make('AND', [cb], negated=True)], negated=True),
+                cc]))
+        self.assertSimplifiesTo(~~a, self._make('AND', [ca]))
+
+        for q in [~(a & ~(b | ~c)), ~(~a | ~b) & ~(~a | ~b),
+                  (x & ~x) | ~(x | c), ~((x & c) | ~(x & ~c)) | x]:
+            self.assertEquivalent(q)
+
+        # Deeply nested trees do not exceed the recursion limit.
+        q = reduce(operator.and_, [Q(a=i % 2) for i in range(5000)])
+        self.assertEqual(len(q.simplify()), 5000)
+        self.assertTrue(q.simplify() is q.simplify())
+
+    def test_get_key(self):
+        self.assertEqual((Q(a=1) | Q(b=2)).get_key(),
+                         (Q(a=1) | Q(b=2)).get_key())
+        self.assertNotEqual((Q(a=1) | Q(b=2)).get_key(),
+                            (Q(a=1) & Q(b=2)).get_key())
+        self.assertNotEqual(Q(a=1).get_key(), (~Q(a=1)).get_key())
+        self.assertNotEqual(Q(r__a=1).get_key(), Q(a=1).get_key())
+
+        # Equal values of different types may compile differently.
+        self.assertEqual(len(set([Q(a=v).get_key() for v in
+                                  [1, 1.0, True, '1', D('1')]])), 5)
+        self.assertEqual(Q(a__in=[1, 2]).get_key(),
+                         Q(a__in=(1, 2)).get_key())
+
+        q = reduce(operator.or_, [Q(a=i) for i in range(5000)]).simplify()
+        self.assertEqual(len(q.get_key()), 5001)
+        self.assertTrue(q.get_key() is q.get_key())
@@ -1,6 +1,11 @@
 import unittest
 from cuuats.datamodel.scales import BreaksScale, DictScale
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TestBreaksScale(unittest.TestCase):
 
@@ -30,6 +35,29 @@ class TestBreaksScale(unittest.TestCase):
         self.assertEqual(self.breaks_left.score(20), 5)
         self.assertEqual(self.breaks_left.score(100), 5)
 
+    def test_score_many(self):
+        values = [-10, 5, 6, 19, 20, 100, float('inf'), float('nan')]
+        for scale in (self.breaks_right, self.breaks_left):
+            self.assertEqual(scale.score_many(values),
+                             [scale.score(v) for v in values])
+        self.assertEqual(self.breaks_left.score_many(values)[-2:],
+                         [None, None])
+        self.assertEqual(self.breaks_right.score_many([None, 'a', 6]),
+                         [self.breaks_right.score(v) for v in [None, 'a', 6]])
+
+    def test_change_breaks(self):
+        self.breaks_right.score_many([1, 2])
+        self.breaks_right.breaks[0] = 1
+        self.assertEqual(self.breaks_right.score(2), 2)
+        self.assertEqual(self.breaks_right.score_many([1, 2]), [1, 2])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_score_many_numpy(self):
+        values = [-10, 5, 6, 19, 20, 100, float('inf'), float('nan')]
+        for scale in (self.breaks_right, self.breaks_left):
+            self.assertEqual(scale.score_many(numpy.array(values)),
+                             [scale.score(v) for v in values])
+
 
 class TestDictScale(unittest.TestCase):
 
@@ -44,3 +72,12 @@ class TestDictScale(unittest.TestCase):
         self.assertEqual(self.scale.score('one'), 1)
         self.assertEqual(self.scale.score('three'), 3)
         self.assertEqual(self.scale.score('notakey'), 0)
+
+    def test_score_many(self):
+        values = ['one', 'notakey', 'three', 'one']
+        self.assertEqual(self.scale.score_many(values), [1, 0, 3, 1])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_score_many_numpy(self):
+        values = numpy.array(['one', 'notakey', 'three', 'one'])
+        self.assertEqual(self.scale.score_many(values), [1, 0, 3, 1])
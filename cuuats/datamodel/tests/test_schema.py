@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+from cuuats.datamodel.schema import DomainInfo, FieldInfo, \
+    MemorySchemaCache, SchemaCache
+
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.gdb_path = os.path.join(self.temp_dir, 'fixture.gdb')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        os.mkdir(self.gdb_path)
+        with open(os.path.join(self.gdb_path, 'a00000001.gdbtable'), 'w'):
+            pass
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_cache(self, version=None):
+        return SchemaCache(self.gdb_path, self.cache_dir, version)
+
+    def populate(self, cache):
+        cache.set_domains([
+            DomainInfo('YesOrNo', 'CodedValue', {50: 'No', 100: 'Yes'}, None),
+            DomainInfo('Percent', 'Range', {}, (0.0, 100.0)),
+        ])
+        cache.set_layer_names(['Widget', 'Warehouse'])
+        cache.set_fields('Widget', [
+            FieldInfo('OBJECTID', 'OID', 'OBJECTID', True, '', 4, 0, 0),
+            FieldInfo('widget_available', 'SmallInteger', '', False,
+                      'YesOrNo', 2, 0, 0),
+        ])
+        cache.set_relationship_names('Widget', ['WidgetWarehouse'])
+        cache.set_relationship(
+            'WidgetWarehouse',
+            ['Warehouse', 'Widget', 'OBJECTID', 'warehouse_id', False])
+
+    def test_round_trip(self):
+        self.populate(self.make_cache())
+        cache = self.make_cache()
+
+        domains = dict([(d.name, d) for d in cache.get_domains()])
+        self.assertEqual(domains['YesOrNo'].codedValues,
+                         {50: 'No', 100: 'Yes'})
+        self.assertEqual(domains['Percent'].range, (0.0, 100.0))
+
+        self.assertEqual(cache.get_layer_names(), ['Widget', 'Warehouse'])
+        fields = cache.get_fields('Widget')
+        self.assertEqual([f.name for f in fields],
+                         ['OBJECTID', 'widget_available'])
+        self.assertEqual(fields[1].domain, 'YesOrNo')
+        self.assertEqual(cache.get_fields('Warehouse'), None)
+
+        self.assertEqual(cache.get_relationship_names('Widget'),
+                         ['WidgetWarehouse'])
+        self.assertEqual(cache.get_relationship('WidgetWarehouse')[3],
+                         'warehouse_id')
+
+    def test_batch(self):
+        cache = self.make_cache()
+        saves = []
+        save = cache.save
+        cache.save = lambda: saves.append(save())
+        with cache.batch():
+            with cache.batch():
+                self.populate(cache)
+            self.assertEqual(saves, [])
+            self.assertEqual(self.make_cache().get_domains(), None)
+        self.assertEqual(len(saves), 1)
+        self.assertEqual(self.make_cache().get_layer_names(),
+                         ['Widget', 'Warehouse'])
+
+        # Changes outside of a batch are saved immediately.
+        cache.set_layer_names(['Widget'])
+        self.assertEqual(len(saves), 2)
+        with cache.batch():
+            pass
+        self.assertEqual(len(saves), 2)
+
+    def test_invalidation(self):
+        self.populate(self.make_cache())
+        self.assertEqual(self.make_cache(version=2).get_domains(), None)
+
+        # Lock files do not invalidate the cache.
+        lock_path = os.path.join(self.gdb_path, 'a00000001.sr.lock')
+        with open(lock_path, 'w'):
+            pass
+        os.utime(lock_path, (0, 2 ** 31 - 1))
+        self.assertNotEqual(self.make_cache().get_domains(), None)
+
+        table_path = os.path.join(self.gdb_path, 'a00000001.gdbtable')
+        os.utime(table_path, (0, 2 ** 31 - 1))
+        self.assertEqual(self.make_cache().get_domains(), None)
+
+    def test_discard_layer(self):
+        cache = self.make_cache()
+        self.populate(cache)
+        cache.discard_layer('Widget')
+        self.assertEqual(cache.get_fields('Widget'), None)
+        self.assertEqual(self.make_cache().get_fields('Widget'), None)
+        self.assertNotEqual(self.make_cache().get_domains(), None)
+
+    def test_clear(self):
+        cache = self.make_cache()
+        self.populate(cache)
+        cache.clear()
+        self.assertFalse(os.path.exists(cache.cache_path))
+        self.assertEqual(self.make_cache().get_domains(), None)
+
+    def test_memory(self):
+        cache = MemorySchemaCache(self.gdb_path, self.cache_dir)
+        self.populate(cache)
+        self.assertEqual(cache.get_layer_names(), ['Widget', 'Warehouse'])
+        self.assertFalse(os.path.exists(self.cache_dir))
+        cache.clear()
+        self.assertEqual(cache.get_fields('Widget'), None)
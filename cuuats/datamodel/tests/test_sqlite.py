@@ -0,0 +1,222 @@
+import unittest
+from cuuats.datamodel.domains import D
+from cuuats.datamodel.fields import CalculatedField, GeometryField
+from cuuats.datamodel.query import ChunkSizer, F, QuerySet
+from cuuats.datamodel.tests.base import SQLiteFixture
+
+
+class TestSQLiteBackend(SQLiteFixture, unittest.TestCase):
+
+    def test_metadata(self):
+        self.assertEqual(self.workspace.list_layers(), ['Warehouse', 'Widget'])
+        fields = self.workspace.get_layer_fields('Widget')
+        self.assertEqual(fields.keys(), [
+            'OBJECTID', 'Shape', 'widget_name', 'widget_available',
+            'widget_price', 'warehouse_id'])
+        self.assertEqual(fields['widget_available'].domain, 'YesOrNo')
+        self.assertEqual(fields['widget_price'].type, 'Double')
+        self.assertEqual(
+            self.workspace.get_coded_value('YesOrNo', 'Yes'), 100)
+
+        (rc_info,) = self.workspace.list_relationships('Widget')
+        self.assertEqual(rc_info.origin, 'Warehouse')
+        self.assertEqual(rc_info.foreign_key, 'warehouse_id')
+        self.assertEqual(self.workspace.get_attachment_info('Widget'), None)
+
+        table_name = self.backend.enable_attachments('Widget')
+        self.assertEqual(
+            self.workspace.get_attachment_info('Widget').destination,
+            table_name)
+
+    def test_cursors(self):
+        rows = list(self.workspace.iter_rows(
+            'Widget', ['OID@', 'widget_name', 'SHAPE@XY'],
+            where_clause='widget_price > 4', postfix='ORDER BY OBJECTID DESC'))
+        self.assertEqual([r for (r, c) in rows], [
+            [3, 'Widget C', (0.0, 4.0)], [1, 'Widget A', (2.5, 3.0)]])
+
+        for (row, cursor) in self.workspace.iter_rows(
+                'Widget', ['SHAPE@WKT'], True, 'OBJECTID = 1'):
+            self.assertEqual(row, ['POINT (2.5 3.0)'])
+            self.workspace.update_row(cursor, ['LINESTRING (1 2, 3 4.5)'])
+        self.assertEqual(
+            self.workspace.get_row('Widget', ['SHAPE@'], 'OBJECTID = 1'),
+            [((1.0, 2.0), (3.0, 4.5))])
+
+        for (row, cursor) in self.workspace.iter_rows(
+                'Widget', ['OID@', 'widget_price'], True):
+            if row[0] == 2:
+                self.workspace.delete_row(cursor)
+            else:
+                self.workspace.update_row(cursor, [row[0], row[1] * 2])
+
+        self.assertEqual(
+            self.workspace.summarize(
+                'Widget', [('widget_price', 'SUM'), ('OBJECTID', 'COUNT')]),
+            {'SUM_widget_price': 30.0, 'COUNT_OBJECTID': 2})
+        self.assertEqual(self.workspace.count_rows('Widget'), 2)
+
+        with self.assertRaises(TypeError):
+            self.workspace.update_row(
+                self.backend.search_cursor('Widget', ['OID@']), [1])
+
+    def test_edit(self):
+        with self.assertRaises(ValueError):
+            with self.workspace.edit():
+                self.workspace.insert_row('Widget', ['widget_name'], ['D'])
+                raise ValueError('Abort the edit session')
+        self.assertEqual(self.workspace.count_rows('Widget'), 3)
+
+        with self.workspace.edit():
+            self.workspace.insert_row('Widget', ['widget_name'], ['D'])
+        self.assertEqual(self.workspace.count_rows('Widget'), 4)
+        self.assertFalse(self.workspace.editor.isEditing)
+
+        # Updates are discarded if any row fails.
+        (Warehouse, Widget) = self.register_models()
+        with self.assertRaises(ZeroDivisionError):
+            Widget.objects.update(
+                widget_price=F('widget_price') / (F('OBJECTID') - 3))
+        self.assertEqual(
+            [r for (r, c) in self.workspace.iter_rows(
+                'Widget', ['widget_price'], where_clause='OBJECTID < 4')],
+            [[10.5], [None], [4.5]])
+
+        # A failure in a later batch also discards earlier batches.
+        features = [Widget(widget_name='New %i' % (i,)) for i in range(3)]
+        features[2].OBJECTID = 1
+        with self.assertRaises(ValueError):
+            Widget.objects.bulk_create(features, batch_size=2)
+        self.assertEqual(self.workspace.count_rows('Widget'), 4)
+        self.assertEqual(features[0].OBJECTID, None)
+
+        # Edit sessions opened inside another are part of it.
+        with self.workspace.edit():
+            Widget.objects.filter(OBJECTID=1).update(widget_price=1.0)
+            self.assertTrue(self.workspace.editor.isEditing)
+        self.assertEqual(Widget.objects.get(OBJECTID=1).widget_price, 1.0)
+
+    def test_spatial_relationship(self):
+        self.backend.create_layer('Zone', [], 'POLYGON')
+        self.backend.add_field('Widget', 'zone_id', {'field_type': 'LONG'})
+        self.backend.create_relationship(
+            'Zone_Widget', 'Zone', 'Widget', 'OBJECTID', 'zone_id')
+        self.workspace.insert_rows('Zone', ['SHAPE@'], [
+            ([(0, 0), (3, 0), (3, 3.5), (0, 3.5), (0, 0)],),
+            ([(10, 10), (11, 10), (11, 11), (10, 10)],),
+        ])
+
+        self.workspace.update_spatial_relationship('Zone_Widget')
+        self.assertEqual(
+            [r for (r, c) in self.workspace.iter_rows(
+                'Widget', ['OID@', 'zone_id'])],
+            [[1, 1], [2, None], [3, None]])
+
+        self.workspace.update_spatial_relationship(
+            'Zone_Widget', 'WITHIN_A_DISTANCE', '1 Meters')
+        self.assertEqual(
+            [r for (r, c) in self.workspace.iter_rows(
+                'Widget', ['OID@', 'zone_id'])],
+            [[1, 1], [2, None], [3, 1]])
+
+        with self.assertRaises(NotImplementedError):
+            self.workspace.update_spatial_relationship(
+                'Zone_Widget', 'CONTAINS')
+
+        with self.workspace.make_layer('Widget', 'widget_price > 5') as name:
+            self.assertEqual(self.backend.get_count(name), 1)
+
+    def test_queryset(self):
+        (Warehouse, Widget) = self.register_models(
+            shape=GeometryField('Shape', db_name='SHAPE@XY'))
+
+        widgets = list(Widget.objects.filter(
+            widget_available=D('Yes'),
+            warehouse__warehouse_name='Central'))
+        self.assertEqual([w.widget_name for w in widgets], ['Widget A'])
+        self.assertEqual(widgets[0].shape, (2.5, 3.0))
+        self.assertEqual(widgets[0].warehouse.warehouse_name, 'Central')
+
+        # Prefetched foreign keys are read even if they are deferred.
+        for widgets in [
+                Widget.objects.only('widget_name').prefetch_related(
+                    'warehouse'),
+                Widget.objects.prefetch_related('warehouse').defer(
+                    'warehouse')]:
+            self.assertEqual(
+                [w._prefetch_cache['warehouse'] and
+                 w._prefetch_cache['warehouse'].warehouse_name
+                 for w in widgets],
+                ['Central', 'Central', None])
+
+        widget = Widget.objects.get(widget_name='Widget C')
+        widget.widget_price = 6.0
+        widget.save()
+        self.assertEqual(
+            Widget.objects.filter(widget_price__gt=5).count(), 2)
+
+    def test_lazy_reverse_relation(self):
+        (Warehouse, Widget) = self.register_models(lazy=True)
+        warehouse = Warehouse.objects.get(warehouse_name='Central')
+        self.assertTrue('_lazy_path' in Widget.__dict__)
+
+        self.assertEqual(
+            sorted([w.widget_name for w in warehouse.widget_set]),
+            ['Widget A', 'Widget B'])
+        self.assertEqual(Widget.workspace, self.workspace)
+
+        # Relations are also followed by queries on the origin class.
+        (Warehouse, Widget) = self.register_models(lazy=True)
+        self.assertEqual(
+            [w.warehouse_name for w in Warehouse.objects.filter(
+                widget_set__widget_name='Widget B')],
+            ['Central'])
+        self.assertEqual(Widget.workspace, self.workspace)
+
+    def test_aggregate(self):
+        (Warehouse, Widget) = self.register_models()
+        fields = [('widget_price', 'SUM'), ('widget_price', 'MIN'),
+                  ('widget_price', 'MAX'), ('OBJECTID', 'COUNT')]
+        qs = Widget.objects.filter(OBJECTID__in=[3, 1, 2])
+        summary = {'SUM_widget_price': 15.0, 'MIN_widget_price': 4.5,
+                   'MAX_widget_price': 10.5, 'COUNT_OBJECTID': 3}
+        self.assertEqual(qs.aggregate(fields), summary)
+
+        # Statistics for split IN lists are combined.
+        QuerySet._chunk_sizers[Widget] = ChunkSizer(size=1, min_size=1)
+        try:
+            self.assertEqual(len(qs._get_where_clauses()[1]), 3)
+            self.assertEqual(qs.aggregate(fields), summary)
+            self.assertEqual(
+                Widget.objects.filter(OBJECTID__in=[2, 5]).aggregate(
+                    [('widget_price', 'SUM'), ('OBJECTID', 'COUNT')]),
+                {'SUM_widget_price': None, 'COUNT_OBJECTID': 1})
+            with self.assertRaises(ValueError):
+                qs.aggregate([('widget_price', 'MEAN')])
+        finally:
+            del QuerySet._chunk_sizers[Widget]
+
+    def test_calculated_fields(self):
+        class Doubler(CalculatedField):
+            def calculate(self, instance):
+                return instance.widget_price * 2
+
+        self.backend.add_field(
+            'Widget', 'double_price', {'field_type': 'DOUBLE'})
+        (Warehouse, Widget) = self.register_models(
+            cache_calculated=True, double_price=Doubler('Double Price'))
+
+        # Subclasses that only define calculate() are calculated one
+        # feature at a time.
+        self.assertFalse(Widget.fields['double_price'].can_calculate_many())
+        self.assertEqual(
+            Widget.objects.filter(widget_price__gt=0).annotate_calculated(
+                'double_price')['double_price'],
+            [21.0, 9.0])
+
+        # Their values may depend on anything, so they are not cached.
+        self.assertTrue(Widget.fields.is_volatile('double_price'))
+        widget = Widget.objects.get(OBJECTID=1)
+        self.assertEqual(widget.double_price, 21.0)
+        widget.widget_price = 100
+        self.assertEqual(widget.double_price, 200)
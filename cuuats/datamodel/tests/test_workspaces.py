@@ -1,6 +1,9 @@
 import arcpy
+import os
 import unittest
+from cuuats.datamodel.schema import SchemaCache
 from cuuats.datamodel.tests.base import WorkspaceFixture
+from cuuats.datamodel.workspaces import Workspace
 
 
 def setUpModule():
@@ -29,6 +32,30 @@ class TestWorkspace(WorkspaceFixture, unittest.TestCase):
             self.FEATURE_CLASS_NAME, 'widget_number = 12345')
         self.assertEqual(count, 1)
 
+    def test_count_rows_cache(self):
+        where_clause = 'widget_number = 12345'
+        self.assertEqual(
+            self.workspace.count_rows(self.FEATURE_CLASS_NAME), 3)
+        self.assertEqual(
+            self.workspace.count_rows(self.FEATURE_CLASS_NAME, where_clause),
+            1)
+
+        self.workspace.insert_row(
+            self.FEATURE_CLASS_NAME, ['widget_number'], [12345])
+        self.assertEqual(
+            self.workspace.count_rows(self.FEATURE_CLASS_NAME), 4,
+            'count not invalidated after insert')
+        self.assertEqual(
+            self.workspace.count_rows(self.FEATURE_CLASS_NAME, where_clause),
+            2, 'count not invalidated after insert')
+
+    def test_has_rows(self):
+        self.assertTrue(self.workspace.has_rows(self.FEATURE_CLASS_NAME))
+        self.assertTrue(self.workspace.has_rows(
+            self.FEATURE_CLASS_NAME, 'widget_number = 12345'))
+        self.assertFalse(self.workspace.has_rows(
+            self.FEATURE_CLASS_NAME, 'widget_number = 54321'))
+
     def iter_rows(self):
         rows = list(self.workspace.iter_rows(
             self.FEATURE_CLASS_NAME,
@@ -89,6 +116,44 @@ class TestWorkspace(WorkspaceFixture, unittest.TestCase):
         with self.assertRaises(ValueError):
             self.workspace.get_coded_value(self.DOMAIN_NAME, 'NotADescription')
 
+    def test_decode_value(self):
+        coded_value = self.workspace.decode_value(self.DOMAIN_NAME, 100)
+        self.assertEqual(coded_value, 100)
+        self.assertEqual(coded_value.description, 'Yes')
+        self.assertTrue(
+            self.workspace.decode_value(self.DOMAIN_NAME, 100) is coded_value,
+            'coded value not shared')
+        self.assertEqual(
+            self.workspace.decode_value(self.DOMAIN_NAME, 7).description, None)
+
+        with self.assertRaises(NameError):
+            self.workspace.decode_value('NotADomain', 100)
+
+    def test_schema_cache(self):
+        cache_dir = os.path.join(self.workspace_dir, 'schema')
+        workspace = Workspace(
+            self.gdb_path, SchemaCache(self.gdb_path, cache_dir))
+        fields = workspace.get_layer_fields(self.FEATURE_CLASS_NAME)
+        self.assertEqual(
+            fields.keys(),
+            self.workspace.get_layer_fields(self.FEATURE_CLASS_NAME).keys())
+        self.assertEqual(fields['widget_available'].domain, self.DOMAIN_NAME)
+        self.assertEqual(workspace.list_relationships(
+            self.FEATURE_CLASS_NAME), [])
+
+        cached = Workspace(
+            self.gdb_path, SchemaCache(self.gdb_path, cache_dir))
+        self.assertEqual(
+            cached.schema_cache.get_fields(self.FEATURE_CLASS_NAME),
+            fields.values())
+        self.assertEqual(
+            cached.get_coded_value(self.DOMAIN_NAME, 'Yes'), 100)
+
+        cached.add_field(self.FEATURE_CLASS_NAME, 'widget_color',
+                         {'field_type': 'TEXT', 'field_length': 100})
+        self.assertTrue('widget_color' in cached.get_layer_fields(
+            self.FEATURE_CLASS_NAME))
+
     def test_add_field(self):
         num_fields = len(self.workspace.get_layer_fields(
             self.FEATURE_CLASS_NAME))
@@ -2,6 +2,15 @@
 Utility functions and classes.
 """
 
+import functools
+import heapq
+import itertools
+import re
+
+
+# Matches identifiers (such as field names) in expressions.
+IDENTIFIER_RE = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+
 
 class Singleton(type):
     """
@@ -21,3 +30,62 @@ class Singleton(type):
 def batches(items, batch_size):
     for i in xrange(0, len(items), batch_size):
         yield items[i:i + batch_size]
+
+
+def iter_batches(iterable, batch_size):
+    """
+    Like batches, but consumes any iterable (including generators) lazily.
+    """
+
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+@functools.total_ordering
+class Descending(object):
+    """
+    Wraps a value so that it sorts in the reverse of its natural order.
+    """
+
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def merge_sorted(iterables, key):
+    """
+    Lazily merge iterables that are each sorted by key into a single sorted
+    iterator. Items with equal keys are returned in the order of the
+    iterables that they come from.
+    """
+
+    iterators = [iter(i) for i in iterables]
+    heap = []
+    for (index, iterator) in enumerate(iterators):
+        for item in iterator:
+            heap.append((key(item), index, item))
+            break
+    heapq.heapify(heap)
+
+    while heap:
+        (item_key, index, item) = heap[0]
+        yield item
+        for item in iterators[index]:
+            heapq.heapreplace(heap, (key(item), index, item))
+            break
+        else:
+            heapq.heappop(heap)
@@ -1,13 +1,15 @@
-import arcpy
+import itertools
 import logging
-import os
-import re
 from collections import namedtuple, OrderedDict
 from contextlib import contextmanager
-from time import time
+from cuuats.datamodel import profiling
+from cuuats.datamodel.backends import get_backend
+from cuuats.datamodel.domains import CodedValue
 from cuuats.datamodel.exceptions import ObjectDoesNotExist, \
     MultipleObjectsReturned
-from cuuats.datamodel.utils import Singleton
+from cuuats.datamodel.schema import MemorySchemaCache, SchemaCache, \
+    domain_info, field_info
+from cuuats.datamodel.utils import Singleton, batches
 
 
 class WorkspaceManager(object):
@@ -19,6 +21,9 @@ class WorkspaceManager(object):
 
     def __init__(self):
         self.workspaces = {}
+        self.schema_cache_enabled = False
+        self.schema_cache_dir = None
+        self.schema_version = None
 
     def get(self, path):
         """
@@ -26,9 +31,31 @@ class WorkspaceManager(object):
         """
 
         if path not in self.workspaces:
-            self.workspaces[path] = Workspace(path)
+            schema_cache = None
+            if self.schema_cache_enabled:
+                schema_cache = SchemaCache(
+                    path, self.schema_cache_dir, self.schema_version)
+            self.workspaces[path] = Workspace(path, schema_cache)
         return self.workspaces[path]
 
+    def enable_schema_cache(self, cache_dir=None, version=None):
+        """
+        Cache the schemas of workspaces created from now on in files in
+        cache_dir. Cached schemas are discarded when the workspace is
+        modified or when the version stamp changes.
+        """
+
+        self.schema_cache_enabled = True
+        self.schema_cache_dir = cache_dir
+        self.schema_version = version
+
+    def disable_schema_cache(self):
+        """
+        Stop caching the schemas of workspaces created from now on.
+        """
+
+        self.schema_cache_enabled = False
+
     def clear(self):
         """
         Clear all cached workspaces.
@@ -39,18 +66,90 @@ class WorkspaceManager(object):
 
 class Workspace(object):
     """
-    A workspace representing a file geodatabase or SDE.
+    A workspace representing a file geodatabase or SDE. Data is read and
+    written by a backend, which is chosen based on the path unless one is
+    given.
     """
 
     RelationshipInfo = namedtuple(
         'RelationshipInfo', ['origin', 'destination', 'primary_key',
                              'foreign_key', 'is_attachment'])
 
-    def __init__(self, path):
+    # Layers with at least this many rows are counted using GetCount on a
+    # table view rather than by streaming object IDs through a cursor.
+    COUNT_VIEW_THRESHOLD = 100000
+
+    def __init__(self, path, schema_cache=None, backend=None):
         self.path = path
-        self.domains = \
-            dict([(d.name, d) for d in arcpy.da.ListDomains(self.path)])
-        self.editor = arcpy.da.Editor(self.path)
+        self.schema_cache = schema_cache
+        self.backend = backend or get_backend(path)
+        self.domains = dict([(d.name, d) for d in self._list_domains()])
+        self.editor = self.backend.get_editor()
+        self._count_cache = {}
+        self._index_domains()
+
+    def _list_domains(self):
+        if self.schema_cache is None:
+            return self.backend.list_domains()
+
+        domains = self.schema_cache.get_domains()
+        if domains is None:
+            domains = [domain_info(d) for d in self.backend.list_domains()]
+            self.schema_cache.set_domains(domains)
+        return domains
+
+    def _index_domains(self):
+        # Index coded value domains by description, and create a single
+        # CodedValue for each code so that reads do not allocate one.
+        self._domain_codes = {}
+        self._domain_coded_values = {}
+        for (domain_name, domain) in self.domains.items():
+            if domain.domainType != 'CodedValue':
+                continue
+
+            codes = {}
+            coded_values = {}
+            for (code, description) in domain.codedValues.items():
+                codes.setdefault(description, code)
+                coded_values[code] = CodedValue(code, description)
+            self._domain_codes[domain_name] = codes
+            self._domain_coded_values[domain_name] = coded_values
+
+    @contextmanager
+    def memoize_schema(self):
+        """
+        Describe each layer and relationship class at most once within the
+        context. If this workspace has a schema cache, the changes made to
+        it within the context are saved once, when the context exits.
+        """
+
+        if self.schema_cache is not None:
+            with self.schema_cache.batch():
+                yield
+            return
+
+        self.schema_cache = MemorySchemaCache(self.path)
+        try:
+            yield
+        finally:
+            self.schema_cache = None
+
+    def list_layers(self):
+        """
+        List the names of the tables and feature classes in the workspace,
+        including those in feature datasets.
+        """
+
+        layer_names = None
+        if self.schema_cache is not None:
+            layer_names = self.schema_cache.get_layer_names()
+
+        if layer_names is None:
+            layer_names = self.backend.list_layers()
+            if self.schema_cache is not None:
+                self.schema_cache.set_layer_names(layer_names)
+
+        return layer_names
 
     def list_relationships(self, layer_name):
         """
@@ -58,29 +157,33 @@ class Workspace(object):
         Relationship information is returned as a RelationshipInfo tuple.
         """
 
-        layer = arcpy.Describe(os.path.join(self.path, layer_name))
-        if not hasattr(layer, "relationshipClassNames"):
-            return([])
+        rc_names = None
+        if self.schema_cache is not None:
+            rc_names = self.schema_cache.get_relationship_names(layer_name)
+
+        if rc_names is None:
+            rc_names = self.backend.list_relationship_names(layer_name)
+            if self.schema_cache is not None:
+                self.schema_cache.set_relationship_names(layer_name, rc_names)
 
-        return [self.get_relationship_info(rc_name)
-                for rc_name in layer.relationshipClassNames]
+        return [self.get_relationship_info(rc_name) for rc_name in rc_names]
 
     def get_relationship_info(self, rc_name):
         """
-        Extract the origin, destination, primary and foreign keys from a
-        RelationshipClass Describe result or the name of the relationship
-        class.
+        Get the origin, destination, primary and foreign keys of a
+        relationship class.
         """
 
-        rc = arcpy.Describe(os.path.join(self.path, rc_name))
-        origin = rc.originClassNames[0]
-        destination = rc.destinationClassNames[0]
-        keys = rc.OriginClassKeys
-        primary = [k[0] for k in keys if k[1] == 'OriginPrimary'][0]
-        foreign = [k[0] for k in keys if k[1] == 'OriginForeign'][0]
-        is_attachment = rc.isAttachmentRelationship
-        return self.RelationshipInfo(
-            origin, destination, primary, foreign, is_attachment)
+        values = None
+        if self.schema_cache is not None:
+            values = self.schema_cache.get_relationship(rc_name)
+
+        if values is None:
+            values = self.backend.describe_relationship(rc_name)
+            if self.schema_cache is not None:
+                self.schema_cache.set_relationship(rc_name, values)
+
+        return self.RelationshipInfo(*values)
 
     def get_attachment_info(self, layer_name):
         """
@@ -98,19 +201,84 @@ class Workspace(object):
         Returns a dictionary of fields for the given layer.
         """
 
-        layer_path = os.path.join(self.path, layer_name)
-        return OrderedDict([(f.name, f) for f in arcpy.ListFields(layer_path)])
+        if self.schema_cache is None:
+            fields = self.backend.list_fields(layer_name)
+        else:
+            fields = self.schema_cache.get_fields(layer_name)
+            if fields is None:
+                fields = [field_info(f)
+                          for f in self.backend.list_fields(layer_name)]
+                self.schema_cache.set_fields(layer_name, fields)
+
+        return OrderedDict([(f.name, f) for f in fields])
 
     def count_rows(self, layer_name, where_clause=None):
         """
-        Count the number of rows meeting the given criteria.
+        Count the number of rows meeting the given criteria. Counts are
+        memoized until this workspace writes to the layer.
+        """
+
+        layer_counts = self._count_cache.setdefault(layer_name, {})
+        if where_clause not in layer_counts:
+            layer_counts[where_clause] = self._count_rows(
+                layer_name, where_clause)
+        return layer_counts[where_clause]
+
+    def _count_rows(self, layer_name, where_clause):
+        if where_clause is None or \
+                self.count_rows(layer_name) >= self.COUNT_VIEW_THRESHOLD:
+            return self.backend.get_count(layer_name, where_clause)
+
+        # Stream object IDs so that memory use does not depend on the
+        # number of rows.
+        return sum(1 for r in self.iter_rows(
+            layer_name, ['OID@'], where_clause=where_clause))
+
+    @property
+    def supports_table_to_numpy(self):
+        """
+        Whether the backend can read layers into NumPy arrays directly.
+        """
+
+        return self.backend.supports_table_to_numpy
+
+    def table_to_numpy(self, layer_name, field_names, where_clause=None,
+                       null_values=None):
+        """
+        Read the specified fields of a layer into a NumPy structured array
+        in a single operation. Null values are replaced using the
+        null_values dictionary, which is keyed by field name.
         """
 
-        # TODO: Investigate whether using select by attributes would be more
-        # efficient.
+        return self.backend.table_to_numpy(
+            layer_name, field_names, where_clause, null_values)
+
+    def has_rows(self, layer_name, where_clause=None):
+        """
+        Returns true if any rows meet the given criteria. Only object IDs are
+        retrieved, and at most one row is read.
+        """
+
+        layer_counts = self._count_cache.get(layer_name, {})
+        if where_clause in layer_counts:
+            return layer_counts[where_clause] > 0
+
+        for (row, cursor) in self.iter_rows(
+                layer_name, ['OID@'], where_clause=where_clause, limit=1):
+            return True
+        return False
+
+    def clear_count_cache(self, layer_name=None):
+        """
+        Discard memoized row counts for the given layer, or for all layers.
+        This is done automatically when the workspace writes to a layer, but
+        must be done manually after changes made outside of the workspace.
+        """
 
-        return len(list(self.iter_rows(
-            layer_name, ['OID@'], where_clause=where_clause)))
+        if layer_name is None:
+            self._count_cache = {}
+        else:
+            self._count_cache.pop(layer_name, None)
 
     def get_row(self, layer_name, field_names, where_clause=None):
         """
@@ -133,64 +301,140 @@ class Workspace(object):
         Iterate over rows of the specified layer.
         """
 
-        layer_path = os.path.join(self.path, layer_name)
-        cursor_factory = arcpy.da.SearchCursor
+        cursor_factory = self.backend.search_cursor
+        cursor_name = 'SearchCursor'
 
         if update:
-            cursor_factory = arcpy.da.UpdateCursor
-
-        logging.debug(
-            '{cursor}: SELECT {prefix}{fields} FROM '
-            '{table}{where}{postfix}'.format(
-                cursor=cursor_factory.__name__,
-                prefix=prefix + ' ' if prefix else '',
-                fields=', '.join(field_names),
-                table=layer_name,
-                where=' WHERE ' + where_clause if where_clause else '',
-                postfix=' ' + postfix if postfix else ''))
-
-        with cursor_factory(layer_path, field_names, where_clause,
-                            sql_clause=(prefix, postfix)) as cursor:
-            for row in cursor:
-
-                # Load memoryview data into memory so that we don't lose access
-                # to it in the next iteration.
-                # TODO: Is there a better way to deal with this issue?
-                values = [v.tobytes() if isinstance(v, memoryview) else v
-                          for v in row]
-
-                if limit is None or limit > 0:
+            cursor_factory = self.backend.update_cursor
+            cursor_name = 'UpdateCursor'
+            self.clear_count_cache(layer_name)
+
+        sql = 'SELECT {prefix}{fields} FROM {table}{where}{postfix}'.format(
+            prefix=prefix + ' ' if prefix else '',
+            fields=', '.join(field_names),
+            table=layer_name,
+            where=' WHERE ' + where_clause if where_clause else '',
+            postfix=' ' + postfix if postfix else '')
+        logging.debug('%s: %s' % (cursor_name, sql))
+
+        # Only profile queries while there are hooks to receive them.
+        record = None
+        if profiling._query_hooks:
+            record = profiling.QueryRecord(
+                self, layer_name, field_names, sql, where_clause, update)
+
+        try:
+            with cursor_factory(layer_name, field_names, where_clause,
+                                sql_clause=(prefix, postfix)) as cursor:
+                rows = cursor
+                if limit is not None:
+                    rows = itertools.islice(rows, max(limit, 0))
+                if record is not None:
+                    rows = record.track(rows)
+
+                for row in rows:
+                    # Load memoryview data into memory so that we don't lose
+                    # access to it in the next iteration.
+                    # TODO: Is there a better way to deal with this issue?
+                    values = [v.tobytes() if isinstance(v, memoryview) else v
+                              for v in row]
                     yield (values, cursor)
-                    if limit is not None:
-                        limit -= 1
-                else:
-                    break
+        finally:
+            if record is not None:
+                record.finish()
+
+    def profile(self, slow_threshold=0.5, first_row_threshold=None,
+                n_plus_one_threshold=3):
+        """
+        Returns a QueryProfiler that records the queries made in this
+        workspace while it is used as a context manager.
+        """
+
+        return profiling.QueryProfiler(
+            self, slow_threshold, first_row_threshold, n_plus_one_threshold)
 
     def update_row(self, cursor, values):
         """
         Update the active row in the current cursor with the given values.
         """
 
-        if not isinstance(cursor, arcpy.da.UpdateCursor):
+        if not self.backend.is_update_cursor(cursor):
             raise TypeError('Invalid cursor')
         cursor.updateRow(values)
 
+    def delete_row(self, cursor):
+        """
+        Delete the active row in the current cursor.
+        """
+
+        if not self.backend.is_update_cursor(cursor):
+            raise TypeError('Invalid cursor')
+        cursor.deleteRow()
+
+    def update_rows(self, layer_name, oid_field_name, field_values,
+                    batch_size=1000):
+        """
+        Update many rows in one edit session, using one update cursor for
+        each batch of object IDs. The field_values dictionary maps object IDs
+        to dictionaries of new values keyed by database field name. Returns
+        the number of rows updated.
+        """
+
+        updated_count = 0
+        with self.edit():
+            for oids in batches(sorted(field_values.keys()), batch_size):
+                field_names = sorted(set(itertools.chain.from_iterable(
+                    [field_values[oid].keys() for oid in oids])))
+                where_clause = '%s IN (%s)' % (
+                    oid_field_name, ', '.join(['%i' % (oid,) for oid in oids]))
+
+                for (row, cursor) in self.iter_rows(
+                        layer_name, ['OID@'] + field_names, True,
+                        where_clause):
+                    values = field_values[row[0]]
+                    self.update_row(cursor, [row[0]] + [
+                        values.get(n, v)
+                        for (n, v) in zip(field_names, row[1:])])
+                    updated_count += 1
+
+        return updated_count
+
     def insert_row(self, layer_name, field_names, values):
         """
         Insert a row in the table.
         """
 
-        layer_path = os.path.join(self.path, layer_name)
-        self.editor.startEditing(False, False)
+        return self.insert_rows(layer_name, field_names, [values])[0]
+
+    def insert_rows(self, layer_name, field_names, rows):
+        """
+        Insert rows in the table using a single edit session and insert
+        cursor. Rows may be any iterable, including a generator. Returns a
+        list of the new object IDs in the order the rows were inserted.
+        """
+
+        oids = []
 
-        with arcpy.da.InsertCursor(layer_path, field_names) as cursor:
-            oid = cursor.insertRow(values)
+        with self.edit(versioned=False):
+            with self.backend.insert_cursor(layer_name, field_names) as cursor:
+                for values in rows:
+                    oids.append(cursor.insertRow(values))
 
-        self.editor.stopEditing(True)
-        return oid
+        self.clear_count_cache(layer_name)
+        return oids
 
     @contextmanager
     def edit(self, versioned=True):
+        """
+        Start an edit session that is saved if the block completes and
+        discarded if it raises. If an edit session is already open, the
+        changes are made in it instead.
+        """
+
+        if self.editor.isEditing:
+            yield
+            return
+
         self.editor.startEditing(False, versioned)
         if versioned:
             self.editor.startOperation()
@@ -203,6 +447,8 @@ class Workspace(object):
             if versioned:
                 self.editor.abortOperation()
             self.editor.stopEditing(False)
+            # Counts taken during the edit session may no longer be valid.
+            self.clear_count_cache()
             raise e
 
     def get_domain(self, domain_name, domain_type=None):
@@ -226,14 +472,32 @@ class Workspace(object):
         Get the coded value from a domain using the description.
         """
 
-        domain = self.get_domain(domain_name, 'CodedValue')
+        codes = self._domain_codes.get(domain_name, None)
+        if codes is None:
+            # Raise the appropriate error.
+            self.get_domain(domain_name, 'CodedValue')
+
+        if description not in codes:
+            raise ValueError('Domain %s has no code for description %s' %
+                             (domain_name, description))
+        return codes[description]
+
+    def decode_value(self, domain_name, value):
+        """
+        Returns the CodedValue for a code in a coded values domain, or the
+        value itself for other types of domains. CodedValues are shared, so
+        they should not be modified.
+        """
 
-        for (code, desc) in domain.codedValues.items():
-            if desc == description:
-                return code
+        coded_values = self._domain_coded_values.get(domain_name, None)
+        if coded_values is None:
+            self.get_domain(domain_name)
+            return value
 
-        raise ValueError('Domain %s has no code for description %s' %
-                         (domain_name, description))
+        coded_value = coded_values.get(value, None)
+        if coded_value is None:
+            return CodedValue(value, None)
+        return coded_value
 
     def add_field(self, layer_name, field_name, storage):
         """
@@ -244,55 +508,33 @@ class Workspace(object):
             raise KeyError('The storage dictionary must contain the '
                            'key field_type.')
 
-        layer_path = os.path.join(self.path, layer_name)
-        arcpy.AddField_management(
-            layer_path,
-            field_name,
-            **storage)
-
-    def _make_layer_name(self):
-        """
-        Returns a unique layer name.
-        """
+        self.backend.add_field(layer_name, field_name, storage)
 
-        return 'layer_%s' % (str(time()).replace('.', ''),)
+        if self.schema_cache is not None:
+            self.schema_cache.discard_layer(layer_name)
 
-    @contextmanager
     def make_layer(self, fc_name, where_clause=None):
         """
         Temporarily make a feature class into a layer so that it can be
         used with geoprocessing tools that require a layer.
         """
 
-        layer_name = self._make_layer_name()
-        fc_path = os.path.join(self.path, fc_name)
+        return self.backend.make_layer(fc_name, where_clause)
 
-        arcpy.MakeFeatureLayer_management(fc_path, layer_name)
-        yield layer_name
+    def make_table_view(self, table_name, where_clause=None):
+        """
+        Temporarily make a table or feature class into a table view, limited
+        to rows matching the where clause.
+        """
 
-        arcpy.Delete_management(layer_name)
+        return self.backend.make_table_view(table_name, where_clause)
 
     def summarize(self, fc_name, fields, where_clause=None):
         """
         Generate summary statistics for a feature class.
         """
 
-        summary_name = self._make_layer_name()
-        summary_path = 'in_memory/%s' % (summary_name,)
-
-        with self.make_layer(fc_name) as layer_name:
-            if where_clause:
-                arcpy.SelectLayerByAttribute_management(
-                    layer_name, where_clause=where_clause)
-
-            arcpy.Statistics_analysis(
-                layer_name, summary_path, fields)
-
-        summary_fields = [re.sub(r'[^A-Za-z0-9]', '_', '%s_%s' % (s, f))
-                          for (f, s) in fields]
-
-        for row in arcpy.da.SearchCursor(summary_path, summary_fields):
-            return dict(zip(summary_fields, row))
+        return self.backend.summarize(fc_name, fields, where_clause)
 
     def update_spatial_relationship(self, rc_name, rel_type='INTERSECT',
                                     search_radius=None):
@@ -305,31 +547,9 @@ class Workspace(object):
         # with spatial relationships.
 
         rc_info = self.get_relationship_info(rc_name)
-        dest_path = os.path.join(self.path, rc_info.destination)
-        origin_path = os.path.join(self.path, rc_info.origin)
-
-        # Create field mappings. We really don't want any fields
-        # included, so we add the origin primary key, which will
-        # be removed automatically.
-        field_mappings = arcpy.FieldMappings()
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(origin_path, rc_info.primary_key)
-        field_mappings.addFieldMap(field_map)
-
-        # Execute the spatial join.
-        join_name = self._make_layer_name()
-        join_path = 'in_memory/%s' % (join_name,)
-        arcpy.SpatialJoin_analysis(
-            dest_path, origin_path, join_path, 'JOIN_ONE_TO_MANY',
-            'KEEP_COMMON', field_mappings, rel_type, search_radius)
-
-        # Create a mapping: destination -> origin.
-        with arcpy.da.SearchCursor(
-                join_path, ['TARGET_FID', 'JOIN_FID']) as cursor:
-            oid_map = dict([(str(row[0]), row[1]) for row in cursor])
-
-        # Delete the join layer.
-        arcpy.Delete_management(join_path)
+        oid_map = self.backend.spatial_join(
+            rc_info.origin, rc_info.destination, rc_info.primary_key,
+            rel_type, search_radius)
         if not oid_map:
             return
 